@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+无人值守批处理：按队列依次完成 目录 -> 元数据 -> 下载 -> 整理 -> EPUB，全程使用默认选项。
+
+用法:
+    python batch_daemon.py add 12345 https://www.uuks.org/b/67890/ ...   加入队列
+    python batch_daemon.py add -f ids.txt                               从文件加入 (每行一个书号或链接)
+    python batch_daemon.py run [--jobs 2] [--budget 16] [--port 8765] [--once] [-f ids.txt]
+    python batch_daemon.py status
+
+队列保存在 novels/job_queue.json，中断后重新 run 会从每本书上次完成的阶段继续。
+已完成的书再次 add 会增量更新目录并下载新章节。
+run 运行期间会在 127.0.0.1:<port> 监听，add 命令会优先通过该端口把任务交给正在运行的守护进程。
+--jobs   同时处理的书籍数
+--budget 全局 HTTP 并发预算 (所有书籍共享)
+--once   队列清空后退出 (默认一直运行，等待新任务)
+"""
+import os
+import sys
+import time
+import json
+import socket
+import threading
+import traceback
+import socketserver
+from common import load_json, save_json, to_book_url
+from main import BASE_SAVE_PATH, BROWSER_DEBUG_PORT, KEEP_BROWSER_ALIVE, EVENT_LOG, LIVE_PROGRESS
+from module_events import start_default_sinks
+from module_browser import shared_browser
+from module_pacing import shared_controller
+from step1_catalog import CatalogManager
+from step0_metadata import MetadataInteractive
+from step2_download import BatchDownloader, MODE_HTTP
+from step3_clean import TextCleaner
+from module_registry import shared_registry
+from step4_epub import EpubAdvancedGenerator
+
+QUEUE_FILE = "job_queue.json"
+# run 期间存在的锁文件 (内容为进程号)：端口连不上时，add 不能绕过守护进程直接改队列文件
+LOCK_FILE = "job_queue.lock"
+DEFAULT_PORT = 8765
+
+# 流水线阶段 (按顺序)
+STAGES = ['catalog', 'metadata', 'download', 'clean', 'epub']
+
+
+class JobQueue:
+    """持久化的任务队列 (每次状态变化都原子写回磁盘)"""
+    def __init__(self, base_path):
+        self.path = os.path.join(base_path, QUEUE_FILE)
+        self.lock = threading.Lock()
+        data = load_json(self.path) or {}
+        self.jobs = data.get('jobs', [])
+
+    def recover(self):
+        """守护进程启动时调用：上次异常退出时仍在运行的任务重新排队 (已完成的阶段会跳过)"""
+        with self.lock:
+            for job in self.jobs:
+                if job['status'] == 'running':
+                    job['status'] = 'queued'
+            self._save()
+
+    def _save(self):
+        save_json(self.path, {"jobs": self.jobs})
+
+    def add(self, raw):
+        url = to_book_url(raw)
+        if not url:
+            return None
+        with self.lock:
+            for job in self.jobs:
+                if job['url'] != url:
+                    continue
+                if job['status'] in ('queued', 'running'):
+                    return job['id']
+                # 失败的任务重新排队，从失败的阶段继续
+                if job['status'] == 'failed':
+                    job.update(status='queued', error=None, updated=time.time())
+                    self._save()
+                    return job['id']
+                # 已完成的书再次加入：增量更新目录后重新走一遍流水线 (连载追更)
+                if job['status'] == 'done':
+                    job.update(status='queued', stage=None, error=None, updated=time.time())
+                    self._save()
+                    return job['id']
+            job_id = max([j['id'] for j in self.jobs], default=0) + 1
+            self.jobs.append({"id": job_id, "url": url, "status": "queued", "stage": None,
+                              "title": None, "error": None, "updated": time.time()})
+            self._save()
+            return job_id
+
+    def take(self):
+        """领取下一个排队的任务"""
+        with self.lock:
+            for job in self.jobs:
+                if job['status'] == 'queued':
+                    job['status'] = 'running'
+                    self._save()
+                    return job
+        return None
+
+    def update(self, job, **fields):
+        with self.lock:
+            job.update(fields)
+            job['updated'] = time.time()
+            self._save()
+
+    def counts(self):
+        with self.lock:
+            result = {}
+            for job in self.jobs:
+                result[job['status']] = result.get(job['status'], 0) + 1
+            return result
+
+
+class BatchDaemon:
+    def __init__(self, base_path, jobs=2, budget=16):
+        self.base_path = base_path
+        self.jobs = max(1, jobs)
+        self.budget = max(1, budget)
+        self.queue = JobQueue(base_path)
+        self.queue.recover()
+        self.stop = threading.Event()
+
+    # ---------------- 单本书的流水线 ----------------
+    def _stage_catalog(self, job):
+        # 目录与元数据需要操作共享标签页，同一时间只允许一个任务使用
+        with shared_browser().exclusive():
+            manager = CatalogManager(job['url'], self.base_path, interactive=False)
+            if not job.get('title'):
+                known = shared_registry(self.base_path).resolve(job['url'])
+                if known:
+                    self.queue.update(job, title=known['folder'])
+            if job.get('title') and os.path.exists(os.path.join(self.base_path, job['title'], 'catalog.json')):
+                title, _ = manager.update_incremental(job['title'])
+            else:
+                title, _ = manager.update_catalog()
+        if not title:
+            raise RuntimeError("目录抓取失败")
+        self.queue.update(job, title=title)
+
+    def _stage_metadata(self, job):
+        info_path = os.path.join(self.base_path, job['title'], 'book_info.json')
+        if os.path.exists(info_path):
+            return
+        with shared_browser().exclusive():
+            MetadataInteractive(self.base_path, interactive=False).run(job['url'])
+
+    def _stage_download(self, job):
+        result = BatchDownloader(self.base_path, mode=MODE_HTTP, concurrency=self.budget).run(job['title'])
+        if result is None:
+            raise RuntimeError("下载失败: 找不到目录文件")
+        # 仍有章节没下载成功时不算完成：阶段记录停在上一步，重新排队后从下载继续
+        if result['remaining']:
+            raise RuntimeError(f"下载未完成: 本次失败 {result['failed']} 章，仍有 {result['remaining']} 章未下载")
+
+    def _stage_clean(self, job):
+        if not TextCleaner(self.base_path).run(job['title']):
+            raise RuntimeError("整理失败: 找不到目录文件")
+
+    def _stage_epub(self, job):
+        paths = EpubAdvancedGenerator(self.base_path, interactive=False).run(job['title'])
+        if not paths or not all(os.path.exists(p) for p in paths):
+            raise RuntimeError("EPUB 生成失败")
+
+    def process(self, job):
+        done = STAGES.index(job['stage']) + 1 if job.get('stage') in STAGES else 0
+        print(f"\n[批处理] 开始任务 #{job['id']}: {job['url']} (从阶段 {STAGES[done] if done < len(STAGES) else '-'} 开始)")
+        try:
+            for stage in STAGES[done:]:
+                if self.stop.is_set():
+                    return
+                getattr(self, f"_stage_{stage}")(job)
+                self.queue.update(job, stage=stage)
+            self.queue.update(job, status='done', error=None)
+            print(f"[批处理] 任务 #{job['id']} 《{job['title']}》 完成")
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.update(job, status='failed', error=str(e))
+            print(f"[批处理] 任务 #{job['id']} 失败: {e}")
+
+    def _worker(self, once):
+        while not self.stop.is_set():
+            job = self.queue.take()
+            if job:
+                self.process(job)
+            elif once:
+                return
+            else:
+                self.stop.wait(2)
+
+    # ---------------- 本地端口 ----------------
+    def _serve(self, port):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    line = raw.decode('utf-8', 'replace').strip()
+                    if not line:
+                        continue
+                    if line.upper() == 'STATUS':
+                        reply = json.dumps(daemon.queue.counts(), ensure_ascii=False)
+                    else:
+                        job_id = daemon.queue.add(line)
+                        reply = f"OK {job_id}" if job_id else f"ERR 无法识别: {line}"
+                    self.wfile.write((reply + '\n').encode('utf-8'))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        try:
+            server = socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler)
+        except OSError as e:
+            print(f"[警告] 无法监听端口 {port}: {e}")
+            return None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"[批处理] 监听 127.0.0.1:{port}，可通过 add 命令提交新任务")
+        return server
+
+    def run(self, port=DEFAULT_PORT, once=False):
+        lock_path = os.path.join(self.base_path, LOCK_FILE)
+        with open(lock_path, 'w', encoding='utf-8') as f:
+            f.write(str(os.getpid()))
+        # 所有书籍共享一个节奏控制器，总并发不超过预算
+        shared_controller().set_max_limit(self.budget)
+        server = self._serve(port) if port else None
+        print(f"[批处理] 同时处理 {self.jobs} 本书，全局并发预算 {self.budget}，队列: {self.queue.counts()}")
+
+        workers = [threading.Thread(target=self._worker, args=(once,), daemon=True) for _ in range(self.jobs)]
+        for t in workers:
+            t.start()
+        try:
+            while any(t.is_alive() for t in workers):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            print("\n[停止] 正在退出，未完成的任务下次启动时继续。")
+            self.stop.set()
+        finally:
+            if server:
+                server.shutdown()
+            shared_browser().shutdown()
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+        print(f"[批处理] 结束，队列: {self.queue.counts()}")
+
+
+def _daemon_pid(base_path):
+    """正在运行的守护进程的进程号 (没有运行返回 None)"""
+    try:
+        with open(os.path.join(base_path, LOCK_FILE), 'r', encoding='utf-8') as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    # Windows 上 os.kill 会直接结束进程，只在 POSIX 上检查进程是否还在
+    if os.name != 'nt':
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except OSError:
+            pass
+    return pid
+
+
+def _read_id_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def _send(lines, port):
+    """交给正在运行的守护进程，失败返回 None"""
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=3) as s:
+            s.sendall(('\n'.join(lines) + '\n').encode('utf-8'))
+            s.shutdown(socket.SHUT_WR)
+            return s.makefile('r', encoding='utf-8').read().splitlines()
+    except OSError:
+        return None
+
+
+def main(argv):
+    if not argv or argv[0] not in ('add', 'run', 'status'):
+        print(__doc__)
+        return
+
+    cmd, args = argv[0], argv[1:]
+    opts = {'--jobs': 2, '--budget': 16, '--port': DEFAULT_PORT}
+    items, once = [], False
+    i = 0
+    while i < len(args):
+        a = args[i]
+        if a in opts and i + 1 < len(args):
+            opts[a] = int(args[i + 1])
+            i += 2
+            continue
+        if a == '-f' and i + 1 < len(args):
+            items += _read_id_file(args[i + 1])
+            i += 2
+            continue
+        if a == '--once':
+            once = True
+        else:
+            items.append(a)
+        i += 1
+
+    if not os.path.exists(BASE_SAVE_PATH):
+        os.makedirs(BASE_SAVE_PATH)
+
+    if cmd == 'add':
+        replies = _send(items, opts['--port'])
+        if replies is not None:
+            print("\n".join(replies))
+            return
+        pid = _daemon_pid(BASE_SAVE_PATH)
+        if pid:
+            # 守护进程正在使用队列文件，这里再写会被它覆盖 (或覆盖它的状态)
+            print(f"[错误] 守护进程 (pid {pid}) 正在运行，但无法连接端口 {opts['--port']}。"
+                  f"请用 --port 指定它监听的端口；若它已退出，删除 {os.path.join(BASE_SAVE_PATH, LOCK_FILE)} 后重试。")
+            return
+        queue = JobQueue(BASE_SAVE_PATH)
+        for item in items:
+            job_id = queue.add(item)
+            print(f"OK {job_id}" if job_id else f"ERR 无法识别: {item}")
+        return
+
+    if cmd == 'status':
+        replies = _send(['STATUS'], opts['--port'])
+        if replies is not None:
+            print(f"[运行中] {replies[0]}")
+            return
+        queue = JobQueue(BASE_SAVE_PATH)
+        for job in queue.jobs:
+            extra = f" 错误: {job['error']}" if job.get('error') else ""
+            print(f"  #{job['id']} [{job['status']}] 阶段={job.get('stage') or '-'} 《{job.get('title') or '?'}》 {job['url']}{extra}")
+        return
+
+    shared_browser().configure(debug_port=BROWSER_DEBUG_PORT, keep_alive=KEEP_BROWSER_ALIVE)
+    start_default_sinks(BASE_SAVE_PATH, log=EVENT_LOG, progress=LIVE_PROGRESS)
+    daemon = BatchDaemon(BASE_SAVE_PATH, jobs=opts['--jobs'], budget=opts['--budget'])
+    for item in items:
+        daemon.queue.add(item)
+    daemon.run(port=opts['--port'], once=once)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+端到端吞吐基准：在本机启动模拟站点 (mock_uuks.py)，按不同下载模式完整跑一遍 目录 -> 下载，
+报告每种模式的 章/秒、单次抓取延迟 p50/p99，以及站点注入的故障次数。结果可复现，不需要联网。
+
+用法:
+    python bench_e2e.py [--modes http,browser,pool] [--chapters 500] [--concurrency 8]
+                        [--latency 50] [--jitter 20] [--error-rate 0.02] [--cf-rate 0.01]
+                        [--placeholder-rate 0.01] [--burst-every 10 --burst-length 1]
+                        [--replay novels/<书名> [--book-id 书号]] [--json 结果.json] [-v]
+
+回放存档时按真实书号请求 (默认从 book_info.json / catalog.json 读出)，存档里没有该书号的页面时直接报错退出。
+浏览器模式 (browser/pool) 需要本机能启动 Chromium，启动失败时跳过。
+HTTP 模式遇到质询页会回退浏览器，没有浏览器时这些章节记为失败。
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from mock_uuks import MockServer, add_site_arguments, site_from_args
+
+# 合成页面使用的书号 (回放存档时改用存档里的真实书号)
+DEFAULT_BOOK_ID = "1"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+class LatencyProbe:
+    """记录每次抓取的耗时：HTTP 模式统计单个请求，浏览器模式统计一次 打开页面+提取"""
+    def __init__(self):
+        self.samples = []
+        self._restore = []
+
+    def _wrap_async(self, cls, name):
+        original = getattr(cls, name)
+        samples = self.samples
+
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        setattr(cls, name, wrapper)
+        self._restore.append((cls, name, original))
+
+    def _wrap(self, cls, name):
+        original = getattr(cls, name)
+        samples = self.samples
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        setattr(cls, name, wrapper)
+        self._restore.append((cls, name, original))
+
+    def __enter__(self):
+        from module_http import AsyncHttpFetcher
+        from step2_download import BatchDownloader
+        self._wrap_async(AsyncHttpFetcher, '_fetch')
+        self._wrap(BatchDownloader, 'parse_content')
+        return self
+
+    def __exit__(self, *exc):
+        for cls, name, original in reversed(self._restore):
+            setattr(cls, name, original)
+
+
+def replay_book_id(book_dir):
+    """回放目录对应的真实书号：book_info.json 的 book_id，其次 catalog.json 的链接；都没有返回 None"""
+    from common import load_json
+    from module_registry import book_id_from_url
+    info = load_json(os.path.join(book_dir, 'book_info.json')) or {}
+    if info.get('book_id'):
+        return str(info['book_id'])
+    catalog = load_json(os.path.join(book_dir, 'catalog.json')) or {}
+    return book_id_from_url(catalog.get('url'))
+
+
+def prepare_catalog(base_path, book_url):
+    """用 HTTP 直接抓取模拟站点的目录 (不启动浏览器)，生成 catalog.json；返回 (书名, 章节数, 用时)"""
+    from common import validate_filename
+    from module_http import fetch_once
+    from module_extract import extract_catalog_links, extract_book_title
+    from module_library import CatalogStore
+    from step1_catalog import CatalogManager
+
+    start = time.perf_counter()
+    manager = CatalogManager(book_url, base_path, interactive=False)
+    url = manager._mobile_catalog_url()
+    # 目录只是准备工作，遇到注入的故障就多试几次
+    for attempt in range(10):
+        status, html, _ = fetch_once(url)
+        if status == 200 and 'Just a moment' not in html[:1000]:
+            break
+        time.sleep(0.5)
+    else:
+        raise RuntimeError(f"目录页请求失败 (状态 {status})")
+    title = validate_filename(extract_book_title(html) or f"Book_{manager.book_id}")
+    chapters = manager._build_chapter_list(extract_catalog_links(html, url))
+    width = max(4, len(str(len(chapters))))
+    for idx, ch in enumerate(chapters):
+        ch['file_name'] = f"{str(idx + 1).zfill(width)}_{validate_filename(ch['title'])}.txt"
+    os.makedirs(os.path.join(base_path, title), exist_ok=True)
+    CatalogStore(base_path, title).save({"title": title, "url": book_url, "chapters": chapters,
+                                         "catalog_hash": manager.catalog_hash})
+    return title, len(chapters), time.perf_counter() - start
+
+
+def browser_available():
+    from module_browser import shared_browser
+    try:
+        shared_browser().get_page()
+        return True
+    except Exception as e:
+        print(f"[跳过] 无法启动浏览器: {e}")
+        return False
+
+
+def run_mode(mode, args, server, workdir):
+    from module_library import CatalogStore
+    from module_pacing import PacingController
+    from step2_download import BatchDownloader
+
+    base_path = os.path.join(workdir, mode)
+    book_url = f"{server.pc_base}/b/{args.book_id}/"
+    title, total, catalog_time = prepare_catalog(base_path, book_url)
+    server.site.snapshot(reset=True)
+
+    downloader = BatchDownloader(base_path, mode=mode, concurrency=args.concurrency, archive=args.archive)
+    # 每种模式用全新的节奏控制器，互不影响
+    downloader.pacer = PacingController()
+    out = sys.stdout if args.verbose else io.StringIO()
+    with LatencyProbe() as probe, contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        downloader.run(title)
+        elapsed = time.perf_counter() - start
+
+    chapters = CatalogStore(base_path, title).load()['chapters']
+    ok = sum(1 for ch in chapters if ch.get('status') == 'success')
+    return {
+        "mode": mode,
+        "chapters": total,
+        "success": ok,
+        "seconds": round(elapsed, 3),
+        "chapters_per_sec": round(ok / elapsed, 2) if elapsed > 0 else 0.0,
+        "fetches": len(probe.samples),
+        "p50_ms": round(percentile(probe.samples, 50) * 1000, 1),
+        "p99_ms": round(percentile(probe.samples, 99) * 1000, 1),
+        "catalog_seconds": round(catalog_time, 3),
+        "peak_concurrency": downloader.pacer.snapshot().get('peak_limit'),
+        "site": server.site.snapshot(),
+    }
+
+
+def print_table(results):
+    print("\n" + "=" * 96)
+    print(f"{'模式':<8}{'成功/总数':>12}{'用时(s)':>10}{'章/秒':>10}{'抓取次数':>10}{'p50(ms)':>10}{'p99(ms)':>10}  站点故障")
+    print("-" * 96)
+    for r in results:
+        site = r['site']
+        faults = ' '.join(f"{k}={site[k]}" for k in ('429', '500', 'cloudflare', 'placeholder') if site.get(k)) or '-'
+        print(f"{r['mode']:<8}{r['success']:>7}/{r['chapters']:<5}{r['seconds']:>9.2f}{r['chapters_per_sec']:>10.1f}"
+              f"{r['fetches']:>10}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}  {faults}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端下载吞吐基准 (本地模拟站点)")
+    parser.add_argument('--modes', default='http,browser,pool', help="逗号分隔: http / browser / pool")
+    parser.add_argument('--concurrency', type=int, default=8, help="HTTP 并发上限 / 浏览器池标签页数")
+    parser.add_argument('--archive', action='store_true', help="同时保存原始网页存档 (默认不存，只测抓取)")
+    parser.add_argument('--json', default=None, help="把结果写入 JSON 文件，方便对比")
+    parser.add_argument('--keep', action='store_true', help="保留临时目录")
+    parser.add_argument('-v', '--verbose', action='store_true', help="显示下载过程的输出")
+    parser.add_argument('--book-id', default=None,
+                        help="请求的书号 (默认 1；回放时默认取存档书籍的真实书号)")
+    add_site_arguments(parser)
+    parser.set_defaults(chapters=500)
+    args = parser.parse_args()
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    server = MockServer(site_from_args(args)).start()
+    # 必须在导入各步骤模块之前设置：站点地址在 common 导入时读取
+    os.environ['UUKS_PC_BASE'] = server.pc_base
+    os.environ['UUKS_MOBILE_BASE'] = server.mobile_base
+
+    if args.replay:
+        error = None
+        args.book_id = args.book_id or replay_book_id(args.replay)
+        # 存档按真实路径 /b/<书号>/... 记录，书号对不上时所有请求都会落到合成页面，结果毫无意义
+        found = server.site.replay_book_ids()
+        if not args.book_id:
+            error = f"无法从 {args.replay} 的 book_info.json / catalog.json 读出书号，请用 --book-id 指定"
+        elif not found.get(args.book_id):
+            known = ", ".join(f"{k} ({v} 页)" for k, v in sorted(found.items())) or "无"
+            error = f"回放存档里没有书号 {args.book_id} 的页面 (存档中的书号: {known})"
+        if error:
+            server.stop()
+            parser.error(error)
+        print(f"[基准] 回放书号 {args.book_id}: 存档中 {found[args.book_id]} 个页面")
+    args.book_id = args.book_id or DEFAULT_BOOK_ID
+
+    # 在临时目录里运行，Cookie 仓库等文件不会写进正式的工作目录
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    print(f"[基准] 模拟站点 {server.pc_base}，{args.chapters} 章，工作目录 {workdir}")
+
+    results = []
+    try:
+        modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+        has_browser = None
+        for mode in modes:
+            if mode in ('browser', 'pool'):
+                if has_browser is None:
+                    has_browser = browser_available()
+                if not has_browser:
+                    continue
+            print(f"[基准] 运行模式: {mode} ...")
+            results.append(run_mode(mode, args, server, workdir))
+    finally:
+        from module_browser import shared_browser
+        shared_browser().shutdown()
+        server.stop()
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if results:
+        print_table(results)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k not in ('json', 'keep', 'verbose')},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"[基准] 结果已写入 {json_path}")
+
+
+if __name__ == "__main__":
+    main()
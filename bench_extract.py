@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+正文提取性能对比：旧版 (DrissionPage 元素逐个查询) vs 新版 (lxml 单次快照 + 选择器记忆)
+
+用法:
+    python bench_extract.py [保存的章节HTML目录]
+
+不传目录时使用内置的模拟章节页。
+注意：旧版在这里跑的是离线的 SessionElement，没有真实浏览器的 CDP 往返，
+线上实际差距会比这里测到的更大。
+"""
+import os
+import sys
+import time
+from module_extract import ContentExtractor
+
+try:
+    from DrissionPage.common import make_session_ele
+except ImportError:
+    make_session_ele = None
+
+
+def legacy_extract(html):
+    """旧版 BatchDownloader.parse_content 的提取逻辑 (原样保留，仅用于对比)"""
+    root = make_session_ele(html)
+    selectors = ['#contentbox', '.contentbox', '#content', '.content', '.read-content', '#chaptercontent']
+    content_ele = None
+    for sel in selectors:
+        if root.ele(sel):
+            ele = root.ele(sel)
+            if len(ele.text) > 50:
+                content_ele = ele
+                break
+
+    if not content_ele:
+        divs = root.eles('tag:div')
+        candidates = [d for d in divs if len(d.eles('tag:a')) < 10]
+        if candidates:
+            content_ele = max(candidates, key=lambda x: len(x.text))
+
+    if not content_ele: return None
+
+    p_tags = content_ele.eles('tag:p')
+    if p_tags:
+        return [p.text.strip() for p in p_tags if p.text.strip()]
+    return [line.strip() for line in content_ele.text.split('\n') if line.strip()]
+
+
+def sample_pages(n=50):
+    """生成模拟章节页：导航栏 + 大量无关 div + 正文"""
+    pages = []
+    nav = "".join(f"<li><a href='/b/1/{i}.html'>第{i}章</a></li>" for i in range(40))
+    noise = "".join(f"<div class='box'><span>推荐{i}</span><a href='#'>链接</a></div>" for i in range(150))
+    for n_ch in range(n):
+        body = "".join(f"<p>　　第{n_ch}章第{i}段，这里是一段用于测试的小说正文内容。</p>" for i in range(80))
+        pages.append(f"<html><head><title>第{n_ch}章</title><script>var a=1;</script></head><body>"
+                     f"<div class='nav'><ul>{nav}</ul></div>{noise}"
+                     f"<div class='book'><div id='chaptercontent'>{body}</div></div></body></html>")
+    return pages
+
+
+def load_pages(folder):
+    pages = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(folder, name), 'r', encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+    return pages
+
+
+def timeit(func, pages):
+    start = time.perf_counter()
+    for html in pages:
+        func(html)
+    return (time.perf_counter() - start) / len(pages) * 1000
+
+
+def main():
+    pages = load_pages(sys.argv[1]) if len(sys.argv) > 1 else sample_pages()
+    if not pages:
+        print("[错误] 没有找到任何 HTML 文件。")
+        return
+    print(f"[基准] 共 {len(pages)} 个页面")
+
+    extractor = ContentExtractor()
+    new_ms = timeit(extractor.extract_lines, pages)
+    print(f"  新版 (lxml + 选择器记忆): {new_ms:.2f} ms/章  (学到的选择器: {extractor.selector})")
+
+    if make_session_ele:
+        old_ms = timeit(legacy_extract, pages)
+        print(f"  旧版 (逐元素查询):        {old_ms:.2f} ms/章")
+        print(f"  提速: {old_ms / new_ms:.1f}x")
+    else:
+        print("  [跳过] 未安装 DrissionPage，无法运行旧版对比。")
+
+
+if __name__ == "__main__":
+    main()
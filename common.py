@@ -2,6 +2,11 @@
 import re
 import os
 import json
+import threading
+
+# 站点地址 (可用环境变量指向本地模拟站点做离线测试，见 mock_uuks.py)
+SITE_PC_BASE = os.environ.get('UUKS_PC_BASE', 'https://www.uuks.org').rstrip('/')
+SITE_MOBILE_BASE = os.environ.get('UUKS_MOBILE_BASE', 'https://m.uuks.org').rstrip('/')
 
 def validate_filename(filename):
     """去除文件名中的非法字符"""
@@ -20,24 +25,126 @@ def clean_title(text):
         return match.group(1).strip()
     return text.strip()
 
+def book_title_from_heading(raw):
+    """
+    PC 详情页 <h1> -> 书名 (同时也是书籍文件夹名)。
+    Step0 与 Step1 都按这一条规则命名，保证两步落到同一个文件夹。
+    """
+    raw = (raw or '').strip()
+    # 去除可能的后缀 (如 "书名_作者_...")
+    if '_' in raw: raw = raw.split('_')[0]
+    return re.sub(r'[\\/:*?"<>|]', '_', raw).strip()
+
+def journal_path(path):
+    """JSON 文件对应的追加日志路径"""
+    return path + '.journal'
+
 def load_json(path):
-    """读取JSON文件"""
+    """读取JSON文件 (如果存在未合并的进度日志，会回放到数据上)"""
     if os.path.exists(path):
         try:
             with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
         except Exception as e:
             print(f"[警告] 读取JSON失败 {path}: {e}")
             return None
+        replay_journal(path, data)
+        return data
     return None
 
 def save_json(path, data):
-    """保存JSON文件"""
+    """保存JSON文件 (先写临时文件再原子替换，写到一半崩溃也不会损坏原文件)"""
+    tmp_path = path + '.tmp'
     try:
-        with open(path, 'w', encoding='utf-8') as f:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return True
     except Exception as e:
         print(f"[错误] 保存JSON失败 {path}: {e}")
+        return False
+
+def truncate_journal(path):
+    """
+    快照已包含日志中的全部变更后清空日志。只由目录快照的所有者调用 (CatalogStore / StatusJournal)。
+    截断而不是删除：仍打开着的日志句柄 (追加模式) 会继续写在新文件末尾，Windows 下也不会因文件占用而失败。
+    """
+    jpath = journal_path(path)
+    if os.path.exists(jpath):
+        try:
+            with open(jpath, 'w', encoding='utf-8'):
+                pass
+        except OSError as e:
+            print(f"[警告] 清空进度日志失败 {jpath}: {e}")
+
+def replay_journal(path, data):
+    """把追加日志中的章节变更按顺序应用到 data['chapters'] 上"""
+    jpath = journal_path(path)
+    if not os.path.exists(jpath) or not isinstance(data, dict):
+        return 0
+    index = {ch.get('url'): ch for ch in data.get('chapters', [])}
+    applied = 0
+    with open(jpath, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break # 崩溃时写了半行，后面的内容不可信
+            ch = index.get(rec.get('url'))
+            if ch is not None:
+                ch.update(rec.get('set', {}))
+                applied += 1
+    return applied
+
+class StatusJournal:
+    """
+    章节状态的追加日志 (JSONL)：
+    每次状态变化只追加一行，代价 O(1)；累计 compact_every 条后合并成一次完整快照。
+    load_json 会自动回放尚未合并的日志。
+    """
+    def __init__(self, json_path, data, compact_every=1000):
+        self.json_path = json_path
+        self.data = data
+        self.compact_every = compact_every
+        self.pending = 0
+        self._fp = None
+        self._lock = threading.Lock()
+
+    def record(self, ch, **fields):
+        """更新章节字段并写入日志"""
+        with self._lock:
+            ch.update(fields)
+            if self._fp is None:
+                self._fp = open(journal_path(self.json_path), 'a', encoding='utf-8')
+            self._fp.write(json.dumps({"url": ch.get('url'), "set": fields}, ensure_ascii=False) + '\n')
+            self._fp.flush()
+            self.pending += 1
+            if self.pending >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+        if save_json(self.json_path, self.data):
+            truncate_journal(self.json_path)
+        self.pending = 0
+
+    def compact(self):
+        """写入完整快照并清空日志"""
+        with self._lock:
+            self._compact()
+
+def to_book_url(user_input):
+    """把【uuks书号】或【目录页链接】统一成目录页链接，无法识别返回 None"""
+    user_input = (user_input or "").strip()
+    if user_input.isdigit():
+        return f"{SITE_PC_BASE}/b/{user_input}/"
+    if "http" in user_input:
+        return user_input
+    return None
 
 def get_download_config(default_base_path):
     """
@@ -54,14 +161,12 @@ def get_download_config(default_base_path):
             print("输入不能为空，请重新输入。")
             continue
         
-        if user_input.isdigit():
-            target_url = f"https://www.uuks.org/b/{user_input}/"
-            print(f"[系统] 检测到书号，自动转换为链接: {target_url}")
-        elif "http" in user_input:
-            target_url = user_input
-        else:
+        target_url = to_book_url(user_input)
+        if not target_url:
             print("输入格式不正确，请输入完整网址或纯数字书号。")
             continue
+        if user_input.isdigit():
+            print(f"[系统] 检测到书号，自动转换为链接: {target_url}")
         break
 
     # 2. 获取自定义书名（可选）
@@ -12,10 +12,27 @@ except ImportError:
     pass # 暂时忽略缺失的模块，防止报错
 from step4_epub import EpubAdvancedGenerator
 from step0_metadata import MetadataInteractive
+from module_browser import shared_browser
+from module_registry import shared_registry, book_id_from_url
+from module_events import start_default_sinks
 
 # 配置基础存储路径
 BASE_SAVE_PATH = "novels"
 
+# 浏览器设置：所有步骤共用一个浏览器，只在第一次需要时启动
+# 设置调试端口 (如 9222) 后会接管该端口上已打开的浏览器；
+# KEEP_BROWSER_ALIVE = True 时退出程序不关闭浏览器，下次运行直接复用 (省去冷启动)
+BROWSER_DEBUG_PORT = None
+KEEP_BROWSER_ALIVE = False
+
+# 下载时保存原始网页 (压缩存档，每章几 KB)；提取规则改了之后可以离线重新生成章节，不用重新下载
+ARCHIVE_RAW_HTML = True
+
+# 进度事件：EVENT_LOG 把每章/每阶段的事件写到 novels/.events/ (NDJSON，供看板等程序读取)；
+# LIVE_PROGRESS 每隔几秒打印一行实时速度和预计剩余时间
+EVENT_LOG = True
+LIVE_PROGRESS = True
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -23,6 +40,14 @@ def main():
     if not os.path.exists(BASE_SAVE_PATH):
         os.makedirs(BASE_SAVE_PATH)
 
+    shared_browser().configure(debug_port=BROWSER_DEBUG_PORT, keep_alive=KEEP_BROWSER_ALIVE)
+    start_default_sinks(BASE_SAVE_PATH, log=EVENT_LOG, progress=LIVE_PROGRESS)
+    try:
+        menu_loop()
+    finally:
+        shared_browser().shutdown()
+
+def menu_loop():
     current_url = ""
     current_book_folder = None # 核心变量：存储书名/文件夹名
 
@@ -48,8 +73,9 @@ def main():
                 print("[错误] 链接格式不正确。")
                 continue
             current_url = raw
-            # 清空书名，等待重新解析
-            current_book_folder = None 
+            # 已经处理过的书直接查缓存锁定，无需启动浏览器；否则等待重新解析
+            known = shared_registry(BASE_SAVE_PATH).resolve(raw)
+            current_book_folder = known['folder'] if known else None
             continue
 
         print("请选择操作模式:")
@@ -68,17 +94,23 @@ def main():
         #  【关键修复逻辑】: 自动解析书名
         #  如果用户选了 2-5，但还不知道书名，先自动去取书名
         # ========================================================
+        if choice in ['2', '3', '4', '5'] and not current_book_folder:
+            known = shared_registry(BASE_SAVE_PATH).resolve(current_url)
+            if known:
+                current_book_folder = known['folder']
+                print(f"[系统] 已锁定书籍: {current_book_folder}")
         if choice in ['2', '3', '4', '5'] and not current_book_folder:
             print("\n[系统] 检测到目标未锁定，正在解析书名...")
             try:
                 # 借用 Step1 的类，只做书名提取，不抓目录
                 temp_step1 = CatalogManager(current_url, BASE_SAVE_PATH)
-                temp_step1._init_browser()      # 启动浏览器
+                temp_step1._init_browser()      # 取得共享浏览器
                 title = temp_step1._fetch_book_title() # 获取书名
-                temp_step1.page.quit()          # 立即关闭
                 
                 if title:
                     current_book_folder = title
+                    shared_registry(BASE_SAVE_PATH).remember(
+                        book_id_from_url(current_url), title=title, folder=title, url=current_url)
                     print(f"[系统] 已锁定书籍: {current_book_folder}")
                 else:
                     print("[错误] 无法解析书名，请先执行步骤 1。")
@@ -94,8 +126,15 @@ def main():
         if choice == '1':
             # Step 1: 抓目录
             step1 = CatalogManager(current_url, BASE_SAVE_PATH)
-            # update_catalog 会返回 (书名, json路径)
-            title, _ = step1.update_catalog()
+            # 已有目录的书 (连载中) 默认只做增量更新，不重新选择范围
+            incremental = False
+            if current_book_folder and os.path.exists(os.path.join(BASE_SAVE_PATH, current_book_folder, 'catalog.json')):
+                incremental = input("目录已存在: [1] 增量更新 (默认)  [2] 重新抓取: ").strip() != '2'
+            # 两种方式都返回 (书名, json路径)
+            if incremental:
+                title, _ = step1.update_incremental(current_book_folder)
+            else:
+                title, _ = step1.update_catalog()
             if title:
                 current_book_folder = title
 
@@ -103,9 +142,21 @@ def main():
             # Step 2: 下载
             # 请确保 step2_download.py 类名正确
             try:
-                from step2_download import BatchDownloader
-                step2 = BatchDownloader(BASE_SAVE_PATH)
-                step2.run(current_book_folder)
+                from step2_download import BatchDownloader, MODE_BROWSER, MODE_HTTP, MODE_POOL
+                print("下载模式: [1] 浏览器逐章 (默认)  [2] HTTP 并发 (遇盾自动回退浏览器)  [3] 多标签页浏览器池")
+                print("          [4] 离线重解析 (不联网，用本地存档的网页重新生成章节)")
+                picked = input("请选择 (1/2/3/4): ").strip()
+                if picked == '4':
+                    BatchDownloader(BASE_SAVE_PATH).reparse(current_book_folder)
+                else:
+                    mode = {'2': MODE_HTTP, '3': MODE_POOL}.get(picked, MODE_BROWSER)
+                    if mode == MODE_POOL:
+                        n = input("标签页数量 (默认 4): ").strip()
+                        step2 = BatchDownloader(BASE_SAVE_PATH, mode=mode, concurrency=int(n) if n.isdigit() else 4,
+                                                archive=ARCHIVE_RAW_HTML)
+                    else:
+                        step2 = BatchDownloader(BASE_SAVE_PATH, mode=mode, archive=ARCHIVE_RAW_HTML)
+                    step2.run(current_book_folder)
             except ImportError:
                 print("[错误] step2_download.py 缺失或类名不匹配")
 
@@ -118,9 +169,27 @@ def main():
             except ImportError:
                 print("[错误] step3_clean.py 缺失或类名不匹配")
 
+            # 合并为单个 TXT (可选压缩)
+            print("合并文本: [0] 不合并 (默认)  [1] 合并为 TXT  [2] 合并并 gzip 压缩  [3] 合并并 zstd 压缩")
+            merge = input("请选择 (0/1/2/3): ").strip()
+            if merge in ('1', '2', '3'):
+                from step3_merge import TextMerger, COMPRESS_NONE, COMPRESS_GZIP, COMPRESS_ZSTD
+                compress = {'1': COMPRESS_NONE, '2': COMPRESS_GZIP, '3': COMPRESS_ZSTD}[merge]
+                TextMerger(BASE_SAVE_PATH, compress=compress).run(current_book_folder)
+
         elif choice == '4':
             # Step 4: EPUB (我们刚刚修改好的)
-            step4 = EpubAdvancedGenerator(BASE_SAVE_PATH)
+            from step4_epub import SPLIT_NONE, SPLIT_COUNT, SPLIT_SIZE, SPLIT_MARKER
+            print("输出方式: [1] 单个文件 (默认)  [2] 按章节数分卷  [3] 按大小分卷  [4] 按原书分卷 (第X卷)")
+            split = {'2': SPLIT_COUNT, '3': SPLIT_SIZE, '4': SPLIT_MARKER}.get(input("请选择 (1/2/3/4): ").strip(), SPLIT_NONE)
+            split_value = None
+            if split == SPLIT_COUNT:
+                n = input("每卷章节数 (默认 500): ").strip()
+                split_value = int(n) if n.isdigit() else None
+            elif split == SPLIT_SIZE:
+                n = input("每卷大小上限 MB (默认 20): ").strip()
+                split_value = int(n) if n.isdigit() else None
+            step4 = EpubAdvancedGenerator(BASE_SAVE_PATH, split=split, split_value=split_value)
             step4.run(current_book_folder)
 
         elif choice == '5':
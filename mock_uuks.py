@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟 uuks.org：不联网测试 目录抓取 / 章节下载 / 元数据采集 的吞吐与容错。
+
+启动：
+    python mock_uuks.py [--port 8765] [--chapters 3000] [--latency 50] [--jitter 20]
+                        [--error-rate 0.02] [--cf-rate 0.01] [--placeholder-rate 0.01]
+                        [--burst-every 30 --burst-length 3] [--replay novels/<书名>]
+然后用环境变量让程序指向它 (Windows 用 set，Linux/macOS 用 export)：
+    set UUKS_PC_BASE=http://127.0.0.1:8765
+    set UUKS_MOBILE_BASE=http://127.0.0.1:8765/m
+    python main.py        (链接输入 http://127.0.0.1:8765/b/1/)
+
+页面：
+    /b/<id>/               PC 详情页 (书名、作者、简介、更新时间、封面)
+    /m/b/<id>/all.html     移动端全本目录 (支持 ETag / 304)
+    /b/<id>/<n>.html       章节页 (移动端 /m/b/<id>/<n>.html 相同)
+    /cover/<id>.png        封面
+    /__stats               已处理的请求与注入的故障统计 (JSON)
+故障注入：
+    --latency/--jitter     每个请求的延迟 (毫秒，正态抖动)
+    --error-rate           返回 500 的概率
+    --cf-rate              返回 Cloudflare 质询页的概率；质询页 1 秒后自动刷新并下发 cf_clearance，
+                           带这个 Cookie 的请求不再被质询 (模拟浏览器过盾后拿到通行证)
+    --placeholder-rate     章节页返回 "正在手打中" 占位页的概率
+    --burst-every/-length  每隔 N 秒进入持续 M 秒的 429 风暴 (带 Retry-After)
+    --replay 目录          用书籍目录里的原始网页存档 (raw_html.*，见 module_archive) 回放真实页面；
+                           存档里没有的页面仍用合成内容
+"""
+import re
+import json
+import time
+import zlib
+import struct
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+# 合成正文用的字表
+_WORDS = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜金生丽水玉出昆冈"
+
+_CHAPTER_PATH = re.compile(r'^(/m)?/b/(\d+)/(\d+)\.html$')
+_CATALOG_PATH = re.compile(r'^/m/b/(\d+)/all\.html$')
+_BOOK_PATH = re.compile(r'^/b/(\d+)/?$')
+_BOOK_ID_PATH = re.compile(r'^(?:/m)?/b/(\d+)/')
+_COVER_PATH = re.compile(r'^/cover/(\d+)\.png$')
+
+CF_PAGE = """<html><head><title>Just a moment...</title>
+<script>window._cf_chl_opt={};setTimeout(function(){location.reload()},1000);</script></head>
+<body><div id="challenge-platform" class="cf-browser-verification">Checking your browser...</div></body></html>"""
+
+PLACEHOLDER_PAGE = """<html><head><title>{title}</title></head><body><h1>{title}</h1>
+<div id="content"><p>章节正在手打中，请稍后再来...</p></div></body></html>"""
+
+
+def _png(width=60, height=80, rgb=(180, 40, 40)):
+    """生成一张纯色 PNG 作为封面"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    row = b'\x00' + bytes(rgb) * width
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height)) + chunk(b'IEND', b''))
+
+
+class MockSite:
+    """页面内容与故障注入 (与 HTTP 服务分开，方便在测试里直接调用)"""
+    def __init__(self, chapters=1000, paragraphs=40, latency=0, jitter=0, error_rate=0.0, cf_rate=0.0,
+                 placeholder_rate=0.0, burst_every=0, burst_length=0, replay=None, seed=1):
+        self.chapters = chapters
+        self.paragraphs = paragraphs
+        self.latency = latency / 1000.0
+        self.jitter = jitter / 1000.0
+        self.error_rate = error_rate
+        self.cf_rate = cf_rate
+        self.placeholder_rate = placeholder_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.seed = seed
+        self.started = time.time()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.cover = _png()
+        self.recorded = self._load_replay(replay) if replay else {}
+
+    # ---------------- 回放 ----------------
+    def _load_replay(self, book_dir):
+        """存档里的 URL 按 (是否移动端 + 路径) 映射到本地路径"""
+        from module_archive import HtmlArchive
+        archive = HtmlArchive(book_dir)
+        pages = {}
+        for url in archive.urls():
+            u = urlparse(url)
+            path = ('/m' if u.netloc.startswith('m.') else '') + u.path
+            pages[path] = url
+        print(f"[模拟站点] 回放存档 {book_dir}: {len(pages)} 个页面")
+        self.archive = archive
+        return pages
+
+    def replay_book_ids(self):
+        """回放存档里出现的书号 -> 页面数 (存档按真实书号记录路径，只有请求同一书号才会命中)"""
+        ids = {}
+        for path in self.recorded:
+            m = _BOOK_ID_PATH.match(path)
+            if m:
+                ids[m.group(1)] = ids.get(m.group(1), 0) + 1
+        return ids
+
+    def _recorded(self, path):
+        url = self.recorded.get(path)
+        return self.archive.get(url) if url else None
+
+    # ---------------- 统计 ----------------
+    def count(self, key):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def snapshot(self, reset=False):
+        with self.lock:
+            stats = dict(self.stats)
+            if reset:
+                self.stats = {}
+        return stats
+
+    def _chance(self, rate):
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    # ---------------- 合成内容 ----------------
+    def book_title(self, book_id):
+        return f"模拟小说{book_id}"
+
+    def chapter_title(self, book_id, n):
+        rng = random.Random(f"{self.seed}-{book_id}-t{n}")
+        return f"第{n}章 " + ''.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 6)))
+
+    def chapter_page(self, book_id, n):
+        title = self.chapter_title(book_id, n)
+        rng = random.Random(f"{self.seed}-{book_id}-{n}")
+        paras = ''.join(f"<p>　　{''.join(rng.choice(_WORDS) for _ in range(rng.randint(30, 90)))}</p>"
+                        for _ in range(self.paragraphs))
+        nav = ''.join(f"<li><a href='/b/{book_id}/{i}.html'>第{i}章</a></li>" for i in range(max(1, n - 5), n + 5))
+        return (f"<html><head><title>{title}_{self.book_title(book_id)}_UU看书</title></head><body>"
+                f"<div class='nav'><ul>{nav}</ul></div><h1>{title}</h1>"
+                f"<div id='content'>{paras}<p>UU看书 www.uuks.org 最快更新</p></div>"
+                f"<div class='footer'><a href='/b/{book_id}/'>返回书页</a></div></body></html>")
+
+    def catalog_page(self, book_id):
+        title = self.book_title(book_id)
+        links = ''.join(f"<li><a href='/m/b/{book_id}/{n}.html'>{self.chapter_title(book_id, n)}</a></li>"
+                        for n in range(1, self.chapters + 1))
+        return (f"<html><head><title>{title}最新章节列表_UU看书</title></head><body>"
+                f"<div class='header'><a href='/'>首页</a><a href='#'>加入书架</a></div>"
+                f"<h1>{title}</h1><ul class='chapters'>{links}</ul></body></html>")
+
+    def book_page(self, book_id):
+        title = self.book_title(book_id)
+        return (f"<html><head><title>{title}_UU看书</title></head><body><h1>{title}</h1>"
+                f"<div class='book-img'><img src='/cover/{book_id}.png'></div>"
+                f"<div class='info'><p>作者：模拟作者</p><p>简介：这是一本用于离线测试的模拟小说，共 {self.chapters} 章。</p>"
+                f"<p>更新时间：2024-01-01 12:00</p></div></body></html>")
+
+    # ---------------- 请求处理 ----------------
+    def handle(self, path, cookie=''):
+        """返回 (状态码, 响应头 dict, 内容 bytes 或 str)"""
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if self.burst_every and (time.time() - self.started) % self.burst_every < self.burst_length:
+            self.count('429')
+            return 429, {'Retry-After': str(self.burst_length)}, "Too Many Requests"
+        if 'cf_clearance=' not in cookie and self._chance(self.cf_rate):
+            self.count('cloudflare')
+            clearance = hashlib.sha1(str(time.time()).encode()).hexdigest()
+            return 503, {'Set-Cookie': f"cf_clearance={clearance}; Path=/; Max-Age=3600"}, CF_PAGE
+        if self._chance(self.error_rate):
+            self.count('500')
+            return 500, {}, "Internal Server Error"
+
+        m = _CHAPTER_PATH.match(path)
+        if m:
+            book_id, n = m.group(2), int(m.group(3))
+            if not 1 <= n <= self.chapters and path not in self.recorded:
+                self.count('404')
+                return 404, {}, "Not Found"
+            if self._chance(self.placeholder_rate):
+                self.count('placeholder')
+                return 200, {}, PLACEHOLDER_PAGE.format(title=self.chapter_title(book_id, n))
+            self.count('chapter')
+            return 200, {}, self._recorded(path) or self._recorded(path[2:] if m.group(1) else '/m' + path) \
+                or self.chapter_page(book_id, n)
+
+        m = _CATALOG_PATH.match(path)
+        if m:
+            self.count('catalog')
+            return 200, {}, self._recorded(path) or self.catalog_page(m.group(1))
+
+        m = _BOOK_PATH.match(path)
+        if m:
+            self.count('book')
+            return 200, {}, self._recorded(path) or self.book_page(m.group(1))
+
+        if _COVER_PATH.match(path):
+            self.count('cover')
+            return 200, {'Content-Type': 'image/png'}, self.cover
+
+        self.count('404')
+        return 404, {}, "Not Found"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    site = None
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/__stats':
+            status, headers, body = 200, {'Content-Type': 'application/json'}, json.dumps(self.site.snapshot())
+        else:
+            status, headers, body = self.site.handle(path, self.headers.get('Cookie', ''))
+        data = body.encode('utf-8') if isinstance(body, str) else body
+
+        # 目录页支持条件请求 (增量更新用)
+        etag = None
+        if status == 200 and _CATALOG_PATH.match(path):
+            etag = '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+            if self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+
+        self.send_response(status)
+        self.send_header('Content-Type', headers.pop('Content-Type', 'text/html; charset=utf-8'))
+        self.send_header('Content-Length', str(len(data)))
+        if etag:
+            self.send_header('ETag', etag)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+    """在后台线程里运行的模拟站点"""
+    def __init__(self, site, host='127.0.0.1', port=0):
+        handler = type('Handler', (_Handler,), {'site': site})
+        self.site = site
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def pc_base(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def mobile_base(self):
+        return self.pc_base + "/m"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_site_arguments(parser):
+    """模拟站点的命令行参数 (bench_e2e.py 共用)"""
+    parser.add_argument('--chapters', type=int, default=1000, help="合成书籍的章节数")
+    parser.add_argument('--latency', type=float, default=0, help="平均延迟 (毫秒)")
+    parser.add_argument('--jitter', type=float, default=0, help="延迟抖动 (毫秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="500 错误概率")
+    parser.add_argument('--cf-rate', type=float, default=0.0, help="Cloudflare 质询页概率")
+    parser.add_argument('--placeholder-rate', type=float, default=0.0, help="占位页概率")
+    parser.add_argument('--burst-every', type=float, default=0, help="每隔多少秒出现一次 429 风暴")
+    parser.add_argument('--burst-length', type=float, default=0, help="429 风暴持续秒数")
+    parser.add_argument('--replay', default=None, help="回放书籍目录里的原始网页存档")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子 (故障注入可复现)")
+
+
+def site_from_args(args):
+    return MockSite(chapters=args.chapters, latency=args.latency, jitter=args.jitter,
+                    error_rate=args.error_rate, cf_rate=args.cf_rate, placeholder_rate=args.placeholder_rate,
+                    burst_every=args.burst_every, burst_length=args.burst_length,
+                    replay=args.replay, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 uuks.org")
+    parser.add_argument('--port', type=int, default=8765)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(site_from_args(args), port=args.port).start()
+    print(f"[模拟站点] 已启动: {server.pc_base}  (移动端 {server.mobile_base})")
+    print(f"  set UUKS_PC_BASE={server.pc_base}")
+    print(f"  set UUKS_MOBILE_BASE={server.mobile_base}")
+    print(f"  示例书籍链接: {server.pc_base}/b/1/    按 Ctrl+C 停止")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(f"[模拟站点] 已停止，统计: {server.site.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
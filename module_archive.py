@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+原始网页存档：下载时把每个页面的原始 HTML 压缩后存进书籍目录，按 URL 索引。
+提取逻辑或广告规则改了之后，可以直接从存档重新生成章节 (Step2 的 "离线重解析")，不用再访问网站。
+
+文件 (都在书籍目录下)：
+    raw_html.pack   压缩数据，只追加
+    raw_html.idx    索引，每行一条 JSON {"u": URL, "o": 偏移, "n": 长度, "c": 压缩方式, "k": crc32}，
+                    同一 URL 以最后一条为准
+    raw_html.dict   压缩字典：zstd 用前几十个页面训练；没有 zstd 时用第一个页面作为 zlib 预设字典
+同一网站的页面模板几乎一样，带字典压缩后每章只有几 KB。
+
+查看存档情况：
+    python module_archive.py stats novels/<书名>
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import threading
+
+# zstd 可选：Python 3.14 自带 compression.zstd，否则使用 zstandard 包
+try:
+    from compression import zstd as _zstd
+
+    def _zstd_compressor(zdict, level):
+        zd = _zstd.ZstdDict(zdict) if zdict else None
+        return lambda data: _zstd.compress(data, level=level, zstd_dict=zd)
+
+    def _zstd_decompressor(zdict):
+        zd = _zstd.ZstdDict(zdict) if zdict else None
+        return lambda data: _zstd.decompress(data, zstd_dict=zd)
+
+    def _zstd_train(samples, size):
+        return _zstd.train_dict(samples, size).dict_content
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def _zstd_compressor(zdict, level):
+            zd = _zstd.ZstdCompressionDict(zdict) if zdict else None
+            return _zstd.ZstdCompressor(level=level, dict_data=zd).compress
+
+        def _zstd_decompressor(zdict):
+            zd = _zstd.ZstdCompressionDict(zdict) if zdict else None
+            return _zstd.ZstdDecompressor(dict_data=zd).decompress
+
+        def _zstd_train(samples, size):
+            return _zstd.train_dictionary(size, samples).as_bytes()
+    except ImportError:
+        _zstd = None
+
+ARCHIVE_NAME = "raw_html"
+
+# 压缩方式
+CODEC_ZLIB = 'zlib'        # zlib，无字典 (只有存第一个页面时)
+CODEC_ZLIB_DICT = 'zlibd'  # zlib + 预设字典
+CODEC_ZSTD = 'zstd'        # zstd，字典训练好之前
+CODEC_ZSTD_DICT = 'zstdd'  # zstd + 训练的字典
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 9
+# 攒够多少个页面后训练 zstd 字典，以及字典大小
+DICT_SAMPLES = 64
+DICT_SIZE = 112 * 1024
+# zlib 预设字典最多只用 32KB
+ZLIB_DICT_SIZE = 32 * 1024
+
+
+class HtmlArchive:
+    def __init__(self, book_dir):
+        self.book_dir = book_dir
+        base = os.path.join(book_dir, ARCHIVE_NAME)
+        self.pack_path = base + '.pack'
+        self.index_path = base + '.idx'
+        self.dict_path = base + '.dict'
+        self.lock = threading.Lock()
+        self.index = {}    # url -> [偏移, 长度, 压缩方式, crc32]
+        self.zdict = None
+        self._samples = []
+        self._codecs = {}
+        self._pack = None
+        self._idx = None
+        self._reader = None
+        self._load()
+
+    # ---------------- 打开 ----------------
+    def _load(self):
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时写了半行
+                    # 数据没完整写进 pack 的记录不可信
+                    if rec['o'] + rec['n'] <= pack_size:
+                        self.index[rec['u']] = [rec['o'], rec['n'], rec['c'], rec.get('k')]
+        if os.path.exists(self.dict_path):
+            with open(self.dict_path, 'rb') as f:
+                self.zdict = f.read()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def urls(self):
+        return list(self.index)
+
+    # ---------------- 压缩 ----------------
+    def _codec(self, codec):
+        """压缩方式 -> (压缩函数, 解压函数)"""
+        pair = self._codecs.get(codec)
+        if pair is None:
+            if codec in (CODEC_ZSTD, CODEC_ZSTD_DICT):
+                if _zstd is None:
+                    raise RuntimeError("存档使用 zstd 压缩，需要安装 zstandard")
+                zdict = self.zdict if codec == CODEC_ZSTD_DICT else None
+                pair = (_zstd_compressor(zdict, ZSTD_LEVEL), _zstd_decompressor(zdict))
+            else:
+                zdict = self.zdict[:ZLIB_DICT_SIZE] if codec == CODEC_ZLIB_DICT else None
+
+                def compress(data, zdict=zdict):
+                    c = zlib.compressobj(ZLIB_LEVEL, zdict=zdict) if zdict else zlib.compressobj(ZLIB_LEVEL)
+                    return c.compress(data) + c.flush()
+
+                def decompress(data, zdict=zdict):
+                    d = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+                    return d.decompress(data) + d.flush()
+                pair = (compress, decompress)
+            self._codecs[codec] = pair
+        return pair
+
+    def _choose_codec(self, raw):
+        """根据字典情况选择压缩方式；需要时顺便建立字典"""
+        if self.zdict is None:
+            if _zstd is None:
+                # 第一个页面本身就是很好的 zlib 预设字典 (同一模板)
+                self._save_dict(raw[:ZLIB_DICT_SIZE])
+            else:
+                self._samples.append(raw)
+                if len(self._samples) >= DICT_SAMPLES:
+                    try:
+                        self._save_dict(_zstd_train(self._samples, DICT_SIZE))
+                    except Exception as e:
+                        print(f"[存档] 字典训练失败，继续无字典压缩: {e}")
+                        self.zdict = b''
+                    self._samples = []
+                return CODEC_ZSTD if _zstd is not None else CODEC_ZLIB
+        if not self.zdict:
+            return CODEC_ZSTD if _zstd is not None else CODEC_ZLIB
+        # 已有字典：按建立字典时的压缩方式继续
+        if _zstd is not None and not self._is_zlib_dict():
+            return CODEC_ZSTD_DICT
+        return CODEC_ZLIB_DICT
+
+    def _is_zlib_dict(self):
+        """当前字典是否为 zlib 预设字典 (原始 HTML 片段)，而不是 zstd 训练的字典"""
+        return not self.zdict.startswith(b'\x37\xa4\x30\xec')
+
+    def _save_dict(self, zdict):
+        self.zdict = zdict
+        self._codecs = {}
+        tmp = self.dict_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(zdict)
+        os.replace(tmp, self.dict_path)
+
+    # ---------------- 读写 ----------------
+    def put(self, url, html):
+        """存入一个页面 (同一 URL 再次存入时以新的为准)"""
+        if not url or not html:
+            return
+        raw = html.encode('utf-8') if isinstance(html, str) else html
+        with self.lock:
+            codec = self._choose_codec(raw)
+            data = self._codec(codec)[0](raw)
+            if self._pack is None:
+                os.makedirs(self.book_dir, exist_ok=True)
+                self._pack = open(self.pack_path, 'ab')
+                self._idx = open(self.index_path, 'a', encoding='utf-8')
+            off = self._pack.seek(0, os.SEEK_END)
+            self._pack.write(data)
+            # 先落 pack 再写索引：崩溃时最多丢掉最后一条
+            self._pack.flush()
+            crc = zlib.crc32(data)
+            self._idx.write(json.dumps({"u": url, "o": off, "n": len(data), "c": codec, "k": crc,
+                                        "t": int(time.time())}, ensure_ascii=False) + '\n')
+            self._idx.flush()
+            self.index[url] = [off, len(data), codec, crc]
+
+    def get(self, url):
+        """返回页面 HTML (str)，没有存档 (或数据校验不通过) 返回 None"""
+        with self.lock:
+            rec = self.index.get(url)
+            if not rec:
+                return None
+            if self._pack:
+                self._pack.flush()
+            if self._reader is None:
+                self._reader = open(self.pack_path, 'rb')
+            off, length, codec, crc = rec
+            self._reader.seek(off)
+            data = self._reader.read(length)
+            if crc is not None and zlib.crc32(data) != crc:
+                return None
+            return self._codec(codec)[1](data).decode('utf-8', errors='replace')
+
+    def close(self):
+        """关闭文件；同一 URL 的旧版本占了一半以上空间时整理一次"""
+        with self.lock:
+            for f in (self._pack, self._idx, self._reader):
+                if f:
+                    f.close()
+            self._pack = self._idx = self._reader = None
+            if not os.path.exists(self.pack_path):
+                return
+            live_bytes = sum(rec[1] for rec in self.index.values())
+            if os.path.getsize(self.pack_path) > 2 * live_bytes + (1 << 20):
+                self._compact()
+
+    def _compact(self):
+        tmp_pack, tmp_idx = self.pack_path + '.tmp', self.index_path + '.tmp'
+        new_index = {}
+        with open(self.pack_path, 'rb') as src, open(tmp_pack, 'wb') as dst, \
+                open(tmp_idx, 'w', encoding='utf-8') as idx:
+            for url, (off, length, codec, crc) in sorted(self.index.items(), key=lambda kv: kv[1][0]):
+                src.seek(off)
+                new_index[url] = [dst.tell(), length, codec, crc]
+                dst.write(src.read(length))
+                idx.write(json.dumps({"u": url, "o": new_index[url][0], "n": length, "c": codec, "k": crc},
+                                     ensure_ascii=False) + '\n')
+        # 两次替换之间崩溃时，索引与 pack 对不上的记录靠 crc32 识别，读取时当作没有存档
+        os.replace(tmp_pack, self.pack_path)
+        os.replace(tmp_idx, self.index_path)
+        self.index = new_index
+
+    def stats(self):
+        packed = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        codecs = {}
+        for _, _, codec, _ in self.index.values():
+            codecs[codec] = codecs.get(codec, 0) + 1
+        return {"pages": len(self.index), "pack_bytes": packed,
+                "dict_bytes": len(self.zdict or b''), "codecs": codecs}
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != 'stats':
+        print(__doc__)
+        return
+    archive = HtmlArchive(sys.argv[2])
+    if not len(archive):
+        print("[存档] 没有找到存档。")
+        return
+    st = archive.stats()
+    raw = sum(len(archive.get(url).encode('utf-8')) for url in archive.urls())
+    print(f"[存档] {st['pages']} 个页面，原始 {raw / 1024 / 1024:.1f} MB -> 压缩后 {st['pack_bytes'] / 1024 / 1024:.1f} MB "
+          f"(字典 {st['dict_bytes'] // 1024} KB，压缩方式 {st['codecs']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import threading
+from DrissionPage import ChromiumPage, ChromiumOptions
+from module_cookies import shared_store
+
+
+class BrowserService:
+    """
+    全局共享的浏览器会话：
+    第一次需要时才启动，之后所有步骤复用同一个 Chromium，避免每个菜单操作都冷启动一次。
+    设置 debug_port 后会优先接管该端口上已打开的浏览器；
+    配合 keep_alive，程序退出时不关闭浏览器，下次运行直接接管 (保留缓存和登录状态)。
+    """
+    def __init__(self):
+        self.page = None
+        self.debug_port = None
+        self.keep_alive = False
+        self._lock = threading.Lock()
+        # 多个任务共用一个标签页时，用它保证同一时间只有一个任务在操作页面
+        self._session_lock = threading.RLock()
+
+    def configure(self, debug_port=None, keep_alive=False):
+        self.debug_port = debug_port
+        self.keep_alive = keep_alive
+
+    def _alive(self):
+        if not self.page:
+            return False
+        try:
+            return self.page.states.is_alive
+        except Exception:
+            return False
+
+    def get_page(self):
+        """获取共享页面 (懒启动，浏览器被手动关闭后会自动重启)"""
+        with self._lock:
+            if self._alive():
+                return self.page
+
+            co = ChromiumOptions()
+            if self.debug_port:
+                co.set_local_port(self.debug_port)
+                print(f"[系统] 连接浏览器 (端口 {self.debug_port}，如未运行则自动启动)...")
+            else:
+                print("[系统] 启动共享浏览器...")
+            self.page = ChromiumPage(co)
+            shared_store().apply_to_page(self.page)
+            return self.page
+
+    def exclusive(self):
+        """独占页面的上下文：with shared_browser().exclusive(): ..."""
+        return self._session_lock
+
+    def shutdown(self, force=False):
+        """程序退出时调用；keep_alive 模式下只断开引用，不关闭浏览器"""
+        with self._lock:
+            if not self.page:
+                return
+            if force or not self.keep_alive:
+                try:
+                    self.page.quit()
+                except Exception:
+                    pass
+            self.page = None
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_browser():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = BrowserService()
+        return _shared
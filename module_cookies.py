@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+from urllib.parse import urlparse
+from common import load_json, save_json
+
+# 本地 Cookie 仓库 (与 novels 目录同级)
+COOKIE_STORE_PATH = "cf_cookies.json"
+
+# 没有过期时间的会话 Cookie，默认保留 12 小时
+SESSION_COOKIE_TTL = 12 * 3600
+
+CF_TITLE_MARKERS = ["Just a moment", "验证"]
+
+
+def is_challenge_title(title):
+    return bool(title) and any(m in title for m in CF_TITLE_MARKERS)
+
+
+class CookieStore:
+    """
+    Cloudflare 通行证仓库：
+    保存 cf_clearance 等会话 Cookie 以及与之绑定的 User-Agent，并记录过期时间。
+    浏览器启动后先注入，HTTP 客户端请求前带上，跨步骤、跨进程、跨书籍复用。
+    """
+    def __init__(self, path=COOKIE_STORE_PATH):
+        self.path = path
+        self.user_agent = None
+        self.cookies = []
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """文件被其他进程更新过才重新读取"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        data = load_json(self.path) or {}
+        now = time.time()
+        with self._lock:
+            self._mtime = mtime
+            self.user_agent = data.get('user_agent')
+            self.cookies = [c for c in data.get('cookies', []) if c.get('expires', 0) > now]
+
+    def _persist(self):
+        save_json(self.path, {
+            "user_agent": self.user_agent,
+            "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "cookies": self.cookies,
+        })
+        try:
+            self._mtime = os.path.getmtime(self.path)
+        except OSError:
+            pass
+
+    def has_clearance(self):
+        self.reload()
+        now = time.time()
+        return any(c['name'] == 'cf_clearance' and c['expires'] > now for c in self.cookies)
+
+    # ---------------- 浏览器 ----------------
+    def save_from_page(self, page):
+        """从浏览器抓取当前所有 Cookie 和 UA 写入仓库"""
+        try:
+            raw = page.cookies(all_domains=True, all_info=True)
+            ua = page.user_agent
+        except Exception as e:
+            print(f"[Cookie] 读取浏览器 Cookie 失败: {e}")
+            return
+
+        now = time.time()
+        cookies = []
+        for c in raw:
+            expires = c.get('expires') or c.get('expiry') or -1
+            if expires <= 0:
+                expires = now + SESSION_COOKIE_TTL
+            cookies.append({
+                "name": c.get('name'),
+                "value": c.get('value'),
+                "domain": c.get('domain', ''),
+                "path": c.get('path', '/'),
+                "expires": expires,
+            })
+
+        with self._lock:
+            self.user_agent = ua
+            self.cookies = cookies
+            self._persist()
+        if any(c['name'] == 'cf_clearance' for c in cookies):
+            print(f"[Cookie] 已保存 Cloudflare 通行证 ({len(cookies)} 个 Cookie)")
+
+    def apply_to_page(self, page):
+        """把仓库中未过期的 Cookie 注入浏览器 (UA 不一致时同步 UA)"""
+        self.reload()
+        if not self.cookies:
+            return
+        try:
+            if self.user_agent and page.user_agent != self.user_agent:
+                page.set.user_agent(self.user_agent)
+            page.set.cookies([{k: c[k] for k in ('name', 'value', 'domain', 'path', 'expires')}
+                              for c in self.cookies])
+            print(f"[Cookie] 已载入本地通行证 ({len(self.cookies)} 个 Cookie)")
+        except Exception as e:
+            print(f"[Cookie] 注入浏览器失败: {e}")
+
+    # ---------------- HTTP 客户端 ----------------
+    def cookies_for(self, url):
+        """返回适用于 url 的 {name: value}"""
+        self.reload()
+        host = urlparse(url).hostname or ''
+        now = time.time()
+        jar = {}
+        for c in self.cookies:
+            domain = c.get('domain', '').lstrip('.')
+            if c['expires'] > now and (host == domain or host.endswith('.' + domain)):
+                jar[c['name']] = c['value']
+        return jar
+
+    def http_headers(self, url):
+        """HTTP 请求头：与通行证绑定的 UA + Cookie"""
+        headers = {}
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+        jar = self.cookies_for(url)
+        if jar:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in jar.items())
+        return headers
+
+
+def wait_for_clearance(page, store=None, timeout=30):
+    """
+    等待浏览器通过 Cloudflare 质询 (轮询标题，通过即返回，不再盲等 10 秒)，
+    通过后把通行证写入本地仓库。返回是否通过。
+    """
+    if not is_challenge_title(page.title):
+        return True
+    print(f"\n[注意] 触发 Cloudflare 盾，等待自动验证 (最多 {timeout} 秒)...\n")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(0.5)
+        if not is_challenge_title(page.title):
+            (store or shared_store()).save_from_page(page)
+            return True
+    print("[警告] Cloudflare 验证超时")
+    return False
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_store():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = CookieStore()
+        return _shared
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+流式 EPUB 写入：每个章节读到后立即渲染并写进 zip，内存里只保留 目录项 (文件名/标题)，
+content.opf / toc.ncx / nav.xhtml 在最后写入。
+生成的文件结构与 ebooklib (write_epub) 的输出一致，阅读器里看不出区别。
+
+zip 由 RawZipWriter 直接写出，可以接收已经压缩好的条目 (构建缓存中取出的章节无需重新压缩)。
+"""
+import os
+import time
+import zlib
+import struct
+import hashlib
+from html import escape
+from common import load_json, save_json
+
+MIMETYPE = b"application/epub+zip"
+
+CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles>
+    <rootfile media-type="application/oebps-package+xml" full-path="EPUB/content.opf"/>
+  </rootfiles>
+</container>
+"""
+
+XHTML_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" epub:prefix="z3998: http://www.daisy.org/z3998/2012/vocab/structure/#" lang="{lang}" xml:lang="{lang}">
+  <head>
+    <title>{title}</title>
+  </head>
+  <body>
+    {body}
+  </body>
+</html>
+"""
+
+
+def render_body(title, text):
+    """章节正文 -> HTML 片段 (标题 + 每行一个 <p>)"""
+    lines = [f"<p>{escape(line.strip(), quote=False)}</p>" for line in text.split('\n') if line.strip()]
+    return f"<h2>{escape(title, quote=False)}</h2>" + "".join(lines)
+
+
+def render_xhtml(title, body, lang='zh'):
+    return XHTML_TEMPLATE.format(lang=lang, title=escape(title, quote=False), body=body).encode('utf-8')
+
+
+# 模板或渲染方式变化时修改，使旧的缓存条目失效
+RENDER_VERSION = 1
+
+
+def deflate_entry(data, level=6):
+    """压缩一个 zip 条目，返回 (crc32, 原始大小, 压缩数据)"""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return zlib.crc32(data), len(data), c.compress(data) + c.flush()
+
+
+def render_chapter_files(batch, level=6):
+    """
+    进程池的工作函数：读取一批章节文件并渲染、压缩。
+    batch 为 [(标题, 文件路径), ...]，返回等长列表，元素为 deflate_entry 的结果或错误信息 (str)。
+    """
+    results = []
+    for title, path in batch:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            results.append(f"读取文件失败 {path}: {e}")
+            continue
+        results.append(deflate_entry(render_xhtml(title, render_body(title, content)), level))
+    return results
+
+
+def _dos_datetime(t=None):
+    t = time.localtime(t)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 4) | t.tm_mday)
+
+
+class RawZipWriter:
+    """
+    最小化的 zip 写入器：条目可以是原始数据 (内部压缩) 也可以是已压缩好的 deflate 数据。
+    条目数超过 65535 时写 zip64 结尾记录；单个 EPUB 超过 4GB 不支持。
+    """
+    def __init__(self, path):
+        self.fp = open(path, 'wb')
+        self.entries = []   # (名称, 方法, crc, 压缩大小, 原始大小, 偏移)
+        self.dos_time, self.dos_date = _dos_datetime()
+
+    def write(self, name, data, compress=True, level=6):
+        if compress:
+            crc, size, cdata = deflate_entry(data, level)
+            self.write_compressed(name, crc, size, cdata)
+        else:
+            self._write(name, 0, zlib.crc32(data), len(data), data)
+
+    def write_compressed(self, name, crc, size, cdata):
+        self._write(name, 8, crc, size, cdata)
+
+    def _write(self, name, method, crc, size, cdata):
+        offset = self.fp.tell()
+        if offset > 0xFFFFFFFF:
+            raise ValueError("EPUB 超过 4GB，请使用分卷输出")
+        raw_name = name.encode('utf-8')
+        self.fp.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, 0x0800, method,
+                                  self.dos_time, self.dos_date, crc, len(cdata), size, len(raw_name), 0))
+        self.fp.write(raw_name)
+        self.fp.write(cdata)
+        self.entries.append((raw_name, method, crc, len(cdata), size, offset))
+
+    def close(self):
+        cd_offset = self.fp.tell()
+        for raw_name, method, crc, csize, size, offset in self.entries:
+            self.fp.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, 0x0800, method,
+                                      self.dos_time, self.dos_date, crc, csize, size,
+                                      len(raw_name), 0, 0, 0, 0, 0, offset))
+            self.fp.write(raw_name)
+        cd_size = self.fp.tell() - cd_offset
+        count = len(self.entries)
+        if count > 0xFFFF or cd_offset > 0xFFFFFFFF:
+            zip64_offset = self.fp.tell()
+            self.fp.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+                                      count, count, cd_size, cd_offset))
+            self.fp.write(struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1))
+            count, cd_offset = 0xFFFF, 0xFFFFFFFF
+        self.fp.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0))
+        self.fp.close()
+
+
+class StreamingEpubWriter:
+    """
+    用法:
+        with StreamingEpubWriter(path, identifier, title, author) as w:
+            w.set_cover(jpg_bytes)
+            w.add_page('intro.xhtml', '书籍信息', intro_html)
+            w.add_page('ch_0000.xhtml', '第一章', render_body('第一章', text))
+    先写入临时文件，close() 成功后才替换目标文件；中途出错不会留下半个 EPUB。
+    """
+    def __init__(self, path, identifier, title, author, lang='zh', compresslevel=6, series=None):
+        self.path = path
+        self.identifier = identifier
+        self.title = title
+        self.author = author
+        self.lang = lang
+        self.compresslevel = compresslevel
+        # 分卷输出时的 (系列名, 卷序号)，写入 belongs-to-collection 元数据
+        self.series = series
+        self.tmp_path = path + '.tmp'
+        self.pages = []        # (id, 文件名, 标题)，即书脊顺序
+        self.toc = []          # 目录：页面或 (分组标题, [页面...])
+        self._section = None
+        self.has_cover = False
+        self.zip = RawZipWriter(self.tmp_path)
+        # mimetype 必须是第一个条目且不压缩
+        self.zip.write('mimetype', MIMETYPE, compress=False)
+        self.write_entry('META-INF/container.xml', CONTAINER_XML.encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+    def write_entry(self, name, data):
+        self.zip.write(name, data, level=self.compresslevel)
+
+    def set_cover(self, data):
+        self.write_entry('EPUB/cover.jpg', data)
+        cover_page = XHTML_TEMPLATE.format(lang=self.lang, title='Cover',
+                                           body='<img src="cover.jpg" alt="Cover"/>')
+        self.write_entry('EPUB/cover.xhtml', cover_page.encode('utf-8'))
+        self.has_cover = True
+
+    def add_page(self, file_name, title, body):
+        """写入一个页面 (进入书脊和目录)，body 为 <body> 内的 HTML"""
+        self.add_rendered(file_name, title, render_xhtml(title, body, self.lang))
+
+    def add_rendered(self, file_name, title, xhtml):
+        """写入已渲染好的完整 XHTML (bytes)"""
+        self.write_entry(f'EPUB/{file_name}', xhtml)
+        self._add_to_toc(file_name, title)
+
+    def add_compressed(self, file_name, title, entry):
+        """写入已压缩好的页面 (deflate_entry 的返回值，来自构建缓存)"""
+        self.zip.write_compressed(f'EPUB/{file_name}', *entry)
+        self._add_to_toc(file_name, title)
+
+    def start_section(self, title):
+        """之后添加的页面在目录里归入 title 分组 (嵌套目录)"""
+        self._section = (title, [])
+        self.toc.append(self._section)
+
+    def end_section(self):
+        self._section = None
+
+    def _add_to_toc(self, file_name, title):
+        page = (f"chapter_{len(self.pages)}", file_name, title)
+        self.pages.append(page)
+        if self._section is not None:
+            self._section[1].append(page)
+        else:
+            self.toc.append(page)
+
+    # ---------------- 结尾的索引文件 ----------------
+    def _opf(self):
+        modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        meta_cover = '\n    <meta name="cover" content="cover-img"></meta>' if self.has_cover else ''
+        if self.series:
+            name, position = self.series
+            meta_cover += (f'\n    <meta property="belongs-to-collection" id="series">{escape(name, quote=False)}</meta>'
+                           f'\n    <meta refines="#series" property="collection-type">series</meta>'
+                           f'\n    <meta refines="#series" property="group-position">{position}</meta>'
+                           f'\n    <meta name="calibre:series" content="{escape(name)}"/>'
+                           f'\n    <meta name="calibre:series_index" content="{position}"/>')
+        items = []
+        if self.has_cover:
+            items.append('<item href="cover.jpg" id="cover-img" media-type="image/jpeg" properties="cover-image"/>')
+            items.append('<item href="cover.xhtml" id="cover" media-type="application/xhtml+xml"/>')
+        items += [f'<item href="{escape(name)}" id="{pid}" media-type="application/xhtml+xml"/>'
+                  for pid, name, _ in self.pages]
+        items.append('<item href="toc.ncx" id="ncx" media-type="application/x-dtbncx+xml"/>')
+        items.append('<item href="nav.xhtml" id="nav" media-type="application/xhtml+xml" properties="nav"/>')
+        spine = ['<itemref idref="nav"/>'] + [f'<itemref idref="{pid}"/>' for pid, _, _ in self.pages]
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="3.0" prefix="rendition: http://www.idpf.org/vocab/rendition/#">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+    <meta property="dcterms:modified">{modified}</meta>
+    <dc:identifier id="id">{escape(self.identifier)}</dc:identifier>
+    <dc:title>{escape(self.title, quote=False)}</dc:title>
+    <dc:language>{self.lang}</dc:language>
+    <dc:creator id="creator">{escape(self.author, quote=False)}</dc:creator>{meta_cover}
+  </metadata>
+  <manifest>
+    {chr(10).join('    ' + i for i in items).lstrip()}
+  </manifest>
+  <spine toc="ncx">
+    {chr(10).join('    ' + s for s in spine).lstrip()}
+  </spine>
+</package>
+"""
+
+    @staticmethod
+    def _ncx_points(items, pad):
+        out = []
+        for item in items:
+            if len(item) == 2:
+                # 分组：指向组内第一页，子节点缩进一层
+                title, children = item
+                out.append(f"""
+{pad}<navPoint id="section_{children[0][0]}">
+{pad}  <navLabel>
+{pad}    <text>{escape(title, quote=False)}</text>
+{pad}  </navLabel>
+{pad}  <content src="{escape(children[0][1])}"/>{StreamingEpubWriter._ncx_points(children, pad + '  ')}
+{pad}</navPoint>""")
+                continue
+            pid, name, title = item
+            out.append(f"""
+{pad}<navPoint id="{pid}">
+{pad}  <navLabel>
+{pad}    <text>{escape(title, quote=False)}</text>
+{pad}  </navLabel>
+{pad}  <content src="{escape(name)}"/>
+{pad}</navPoint>""")
+        return "".join(out)
+
+    @staticmethod
+    def _nav_items(items, pad):
+        out = []
+        for item in items:
+            if len(item) == 2:
+                title, children = item
+                out.append(f"""
+{pad}<li>
+{pad}  <span>{escape(title, quote=False)}</span>
+{pad}  <ol>{StreamingEpubWriter._nav_items(children, pad + '    ')}
+{pad}  </ol>
+{pad}</li>""")
+                continue
+            _, name, title = item
+            out.append(f"""
+{pad}<li>
+{pad}  <a href="{escape(name)}">{escape(title, quote=False)}</a>
+{pad}</li>""")
+        return "".join(out)
+
+    def _ncx(self):
+        toc = [item for item in self.toc if len(item) == 3 or item[1]]
+        points = self._ncx_points(toc, '    ')
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <head>
+    <meta content="{escape(self.identifier)}" name="dtb:uid"/>
+    <meta content="0" name="dtb:depth"/>
+    <meta content="0" name="dtb:totalPageCount"/>
+    <meta content="0" name="dtb:maxPageNumber"/>
+  </head>
+  <docTitle>
+    <text>{escape(self.title, quote=False)}</text>
+  </docTitle>
+  <navMap>{points}
+  </navMap>
+</ncx>
+"""
+
+    def _nav(self):
+        toc = [item for item in self.toc if len(item) == 3 or item[1]]
+        entries = self._nav_items(toc, '        ')
+        title = escape(self.title, quote=False)
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{self.lang}" xml:lang="{self.lang}">
+  <head>
+    <title>{title}</title>
+  </head>
+  <body>
+    <nav epub:type="toc" id="id" role="doc-toc">
+      <h2>{title}</h2>
+      <ol>{entries}
+      </ol>
+    </nav>
+  </body>
+</html>
+"""
+
+    def close(self):
+        self.write_entry('EPUB/content.opf', self._opf().encode('utf-8'))
+        self.write_entry('EPUB/toc.ncx', self._ncx().encode('utf-8'))
+        self.write_entry('EPUB/nav.xhtml', self._nav().encode('utf-8'))
+        self.zip.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self.zip.fp.close()
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def chapter_key(title, text_hash):
+    """章节缓存键：标题 + 正文哈希 + 渲染版本"""
+    return hashlib.sha1(f"{RENDER_VERSION}\0{title}\0{text_hash}".encode('utf-8')).hexdigest()
+
+
+class EpubBuildCache:
+    """
+    每本书的 EPUB 构建缓存：渲染并压缩好的章节条目，按 chapter_key 存取。
+    数据追加写入 <path>.pack，索引 (键 -> 偏移/长度/crc/大小) 与每个输出文件上次构建的签名保存在 <path>.json；
+    无用的条目超过一半时整理一次 pack 文件。分卷输出时各卷共用一个缓存。
+    """
+    def __init__(self, path):
+        self.pack_path = path + '.pack'
+        self.index_path = path + '.json'
+        data = load_json(self.index_path) or {}
+        self.index = data.get('entries', {})
+        # 输出文件绝对路径 -> [签名, 文件大小, 修改时间]
+        self.outputs = data.get('outputs', {})
+        # pack 文件与索引对不上 (被删除/截断) 时整体作废
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        if any(off + length > pack_size for off, length, _, _ in self.index.values()):
+            self.index, self.outputs = {}, {}
+        self.used = set()
+        self.built = {}
+        self.added = 0
+        self._reader = None
+        self._writer = None
+
+    def get(self, key):
+        """返回 (crc, 原始大小, 压缩数据)，不存在返回 None"""
+        rec = self.index.get(key)
+        if not rec:
+            return None
+        if self._writer:
+            self._writer.flush()
+        if self._reader is None:
+            self._reader = open(self.pack_path, 'rb')
+        off, length, crc, size = rec
+        self._reader.seek(off)
+        self.used.add(key)
+        return crc, size, self._reader.read(length)
+
+    def put(self, key, entry):
+        crc, size, cdata = entry
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.pack_path) or '.', exist_ok=True)
+            self._writer = open(self.pack_path, 'ab')
+        off = self._writer.seek(0, os.SEEK_END)
+        self._writer.write(cdata)
+        self.index[key] = [off, len(cdata), crc, size]
+        self.used.add(key)
+        self.added += 1
+
+    def is_fresh(self, signature, output_path, keys=()):
+        """签名一致且上次生成的文件原样还在：可以跳过构建 (keys 为该文件用到的章节，继续保留在缓存里)"""
+        path = os.path.abspath(output_path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if self.outputs.get(path) != [signature, st.st_size, st.st_mtime_ns]:
+            return False
+        self.used.update(keys)
+        self.built[path] = self.outputs[path]
+        return True
+
+    def record_output(self, signature, output_path):
+        path = os.path.abspath(output_path)
+        st = os.stat(path)
+        self.built[path] = [signature, st.st_size, st.st_mtime_ns]
+
+    def save(self):
+        for f in (self._reader, self._writer):
+            if f:
+                f.close()
+        self._reader = self._writer = None
+        # 只保留本次构建用到的条目
+        live = {k: v for k, v in self.index.items() if k in self.used}
+        live_bytes = sum(v[1] for v in live.values())
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        if pack_size > 2 * live_bytes + (1 << 20):
+            live = self._compact(live)
+        self.index, self.outputs = live, self.built
+        save_json(self.index_path, {"outputs": self.outputs, "entries": live})
+
+    def _compact(self, live):
+        tmp = self.pack_path + '.tmp'
+        new_index = {}
+        with open(self.pack_path, 'rb') as src, open(tmp, 'wb') as dst:
+            for key, (off, length, crc, size) in sorted(live.items(), key=lambda kv: kv[1][0]):
+                src.seek(off)
+                new_index[key] = [dst.tell(), length, crc, size]
+                dst.write(src.read(length))
+        os.replace(tmp, self.pack_path)
+        return new_index
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+进度事件：下载 / 清洗 / 制作电子书 过程中发出结构化事件，调用方可以订阅，不必解析屏幕输出。
+
+事件类型 (每个事件都带 type / ts / step / book，其余字段见各发出处)：
+    stage_started   阶段开始      stage, total
+    stage_done      阶段结束      stage, total, success, failed, seconds ...
+    chapter_started 开始处理一章  chapter, url, index
+    chapter_done    一章处理完    chapter, ok, seconds (已知时), size ...
+    retry           重试          url, attempt
+    cf_challenge    遇到质询页    url
+
+用法：
+    bus = shared_events()
+    bus.subscribe(lambda ev: print(ev.to_dict()), types=(STAGE_DONE,))
+    bus.subscribe(NdjsonSink("novels/.events"))     # 写入 NDJSON 日志
+    bus.subscribe(ProgressDisplay())                # 实时速度 / 剩余时间
+
+发出事件只是放进队列 (没有订阅者时什么都不做)；订阅者在单独的分发线程里回调，
+写文件、打印再慢也不会拖住抓取循环。队列满时丢弃事件并计数，不会阻塞。
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from queue import Queue, Full
+
+# 事件类型
+STAGE_STARTED = 'stage_started'
+STAGE_DONE = 'stage_done'
+CHAPTER_STARTED = 'chapter_started'
+CHAPTER_DONE = 'chapter_done'
+RETRY = 'retry'
+CF_CHALLENGE = 'cf_challenge'
+EVENT_TYPES = (STAGE_STARTED, STAGE_DONE, CHAPTER_STARTED, CHAPTER_DONE, RETRY, CF_CHALLENGE)
+
+# 分发队列上限 (订阅者跟不上时丢弃，不阻塞发出方)
+MAX_PENDING = 10000
+EVENTS_DIR_NAME = ".events"
+
+
+class Event:
+    __slots__ = ('type', 'ts', 'step', 'book', 'data')
+
+    def __init__(self, kind, step, book, data):
+        self.type = kind
+        self.ts = time.time()
+        self.step = step
+        self.book = book
+        self.data = data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def to_dict(self):
+        d = {"type": self.type, "ts": round(self.ts, 3), "step": self.step, "book": self.book}
+        d.update(self.data)
+        return d
+
+
+class EventBus:
+    def __init__(self, max_pending=MAX_PENDING):
+        # (回调, 关心的事件类型集合或 None)；修改时整体替换，分发线程读取时不用加锁
+        self._subscribers = ()
+        self._queue = Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    # ---------------- 订阅 ----------------
+    def subscribe(self, callback, types=None):
+        """订阅事件 (types 为空表示全部)；返回 callback，可用于 unsubscribe"""
+        with self._lock:
+            self._subscribers += ((callback, frozenset(types) if types else None),)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="events", daemon=True)
+                self._thread.start()
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s[0] is not callback)
+
+    @property
+    def active(self):
+        return bool(self._subscribers)
+
+    # ---------------- 发出 ----------------
+    def emit(self, kind, step=None, book=None, **data):
+        if not self._subscribers:
+            return
+        try:
+            self._queue.put_nowait(Event(kind, step, book, data))
+        except Full:
+            self.dropped += 1
+
+    def scope(self, step, book=None):
+        """绑定 步骤/书名 的发出器，各步骤内部使用"""
+        return EventScope(self, step, book)
+
+    def flush(self, timeout=5.0):
+        """等待已发出的事件都分发完 (运行结束时调用，保证日志完整)"""
+        q = self._queue
+        with q.all_tasks_done:
+            q.all_tasks_done.wait_for(lambda: not q.unfinished_tasks, timeout)
+
+    # ---------------- 分发 ----------------
+    def _dispatch(self):
+        failed = set()
+        while True:
+            event = self._queue.get()
+            try:
+                for callback, types in self._subscribers:
+                    if types is not None and event.type not in types:
+                        continue
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        # 同一个订阅者出错只提示一次，不影响其他订阅者
+                        if id(callback) not in failed:
+                            failed.add(id(callback))
+                            print(f"[事件] 订阅者出错: {e}")
+            finally:
+                self._queue.task_done()
+
+
+class EventScope:
+    __slots__ = ('bus', 'step', 'book')
+
+    def __init__(self, bus, step, book=None):
+        self.bus = bus
+        self.step = step
+        self.book = book
+
+    def emit(self, kind, **data):
+        self.bus.emit(kind, self.step, self.book, **data)
+
+
+# ==========================================
+# 内置订阅者
+# ==========================================
+class NdjsonSink:
+    """事件逐行写入 <目录>/events-<日期>.ndjson (追加，按天分文件)"""
+    def __init__(self, folder):
+        self.folder = folder
+        self._file = None
+        self._day = None
+
+    def __call__(self, event):
+        day = time.strftime("%Y%m%d", time.localtime(event.ts))
+        if day != self._day:
+            self.close()
+            os.makedirs(self.folder, exist_ok=True)
+            self._file = open(os.path.join(self.folder, f"events-{day}.ndjson"), 'a', encoding='utf-8')
+            self._day = day
+        self._file.write(json.dumps(event.to_dict(), ensure_ascii=False) + '\n')
+        # 章节事件很密集，只在阶段边界落盘
+        if event.type in (STAGE_STARTED, STAGE_DONE):
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class ProgressDisplay:
+    """
+    根据 stage_started / chapter_done 估算实时速度与剩余时间，每隔 interval 秒打印一行。
+    速度按最近 window 秒内完成的章节计算，站点变慢时剩余时间会跟着变。
+    """
+    def __init__(self, interval=2.0, window=30.0, out=print):
+        self.interval = interval
+        self.window = window
+        self.out = out
+        self.stages = {}    # (步骤, 书名) -> 当前阶段的进度
+
+    def __call__(self, event):
+        key = (event.step, event.book)
+        if event.type == STAGE_STARTED:
+            if event.get('total'):
+                self.stages[key] = {'stage': event.get('stage'), 'total': event.get('total'), 'done': 0,
+                                    'failed': 0, 'start': event.ts, 'shown': event.ts,
+                                    'samples': deque([(event.ts, 0)])}
+            return
+        if event.type == STAGE_DONE:
+            self.stages.pop(key, None)
+            return
+        state = self.stages.get(key)
+        if event.type != CHAPTER_DONE or state is None:
+            return
+        state['done'] += 1
+        if not event.get('ok', True):
+            state['failed'] += 1
+        samples = state['samples']
+        samples.append((event.ts, state['done']))
+        while len(samples) > 2 and samples[0][0] < event.ts - self.window:
+            samples.popleft()
+        if event.ts - state['shown'] >= self.interval or state['done'] == state['total']:
+            state['shown'] = event.ts
+            self.out(self.format(event.step, event.book, state))
+
+    @staticmethod
+    def format(step, book, state):
+        done, total = state['done'], state['total']
+        (t0, n0), (t1, n1) = state['samples'][0], state['samples'][-1]
+        rate = (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+        line = f"[进度] {step}"
+        if book:
+            line += f" 《{book}》"
+        line += f" {state['stage']} {done}/{total} ({done * 100 // max(total, 1)}%)"
+        if state['failed']:
+            line += f"，失败 {state['failed']}"
+        if rate > 0:
+            eta = int((total - done) / rate)
+            line += f" | {rate:.1f} 章/秒 | 预计剩余 {eta // 60}:{eta % 60:02d}"
+        return line
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_events():
+    """进程内共享的事件总线"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = EventBus()
+        return _shared
+
+
+def start_default_sinks(base_path, log=True, progress=True):
+    """主程序 / 批处理启动时调用：事件日志写到 <存储目录>/.events/，实时进度打印到屏幕"""
+    bus = shared_events()
+    if log:
+        bus.subscribe(NdjsonSink(os.path.join(base_path, EVENTS_DIR_NAME)))
+    if progress:
+        bus.subscribe(ProgressDisplay(), types=(STAGE_STARTED, STAGE_DONE, CHAPTER_DONE))
+    return bus
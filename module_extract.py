@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+import re
+from lxml import etree
+from lxml import html as lxml_html
+
+# 常见的小说正文 ID/Class (按优先级)
+CONTENT_SELECTORS = ['#contentbox', '.contentbox', '#content', '.content', '.read-content', '#chaptercontent']
+
+# 会产生换行的块级标签
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'ul', 'ol', 'dd', 'dt', 'tr', 'section', 'article',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre'}
+NOISE_TAGS = ('script', 'style', 'noscript', 'iframe')
+
+
+def css_to_xpath(selector):
+    """仅支持本项目用到的 #id / .class / tag 三种简单选择器"""
+    if selector.startswith('#'):
+        return f'//*[@id="{selector[1:]}"]'
+    if selector.startswith('.'):
+        return f'//*[contains(concat(" ", normalize-space(@class), " "), " {selector[1:]} ")]'
+    return f'//{selector}'
+
+
+# 预编译 XPath，避免每章重复解析表达式
+_XPATHS = {}
+
+
+def compiled_xpath(selector):
+    xp = _XPATHS.get(selector)
+    if xp is None:
+        xp = _XPATHS[selector] = etree.XPath(css_to_xpath(selector))
+    return xp
+
+
+_P_TAGS = etree.XPath('.//p')
+
+# 开头的 XML 声明 (XHTML / 移动端页面常见)；快照已经是解码后的字符串，带 encoding 的声明会让 lxml 直接报错
+_XML_DECLARATION = re.compile(r'^[\ufeff\s]*<\?xml[^>]*\?>')
+
+
+def parse_html(html):
+    """把 HTML 快照解析成 lxml 树，并去掉脚本/样式节点"""
+    if isinstance(html, str):
+        html = _XML_DECLARATION.sub('', html, count=1)
+    root = lxml_html.fromstring(html)
+    etree.strip_elements(root, *NOISE_TAGS, with_tail=False)
+    return root
+
+
+def _walk(el, out):
+    block = el.tag in BLOCK_TAGS
+    if block: out.append('\n')
+    if el.text: out.append(el.text)
+    for child in el:
+        if isinstance(child.tag, str):
+            _walk(child, out)
+        if child.tail: out.append(child.tail)
+    if block: out.append('\n')
+
+
+def element_text(el):
+    """近似浏览器 innerText：块级标签与 <br> 处换行"""
+    out = []
+    _walk(el, out)
+    return ''.join(out)
+
+
+def element_lines(el):
+    return [line.strip() for line in element_text(el).split('\n') if line.strip()]
+
+
+def _largest_text_div(root, max_links=10):
+    """
+    兜底：找字数最多、且链接少于 max_links 的 div。
+    自底向上一次遍历累计每个节点的字数和链接数，O(节点数)。
+    """
+    nodes = list(root.iter(etree.Element))
+    text_len = {}
+    link_cnt = {}
+    best, best_len = None, -1
+    for el in reversed(nodes):
+        t = len(el.text or '')
+        a = 1 if el.tag == 'a' else 0
+        for c in el:
+            if isinstance(c.tag, str):
+                t += text_len[c]
+                a += link_cnt[c]
+            t += len(c.tail or '')
+        text_len[el] = t
+        link_cnt[el] = a
+        if el.tag == 'div' and a < max_links and t > best_len:
+            best, best_len = el, t
+    return best
+
+
+class ContentExtractor:
+    """
+    基于单次 HTML 快照的正文提取器 (进程内 lxml 解析，不产生 CDP 往返)。
+    某个选择器对本书提取成功后会被记住，后续章节直接使用，不再逐个试探。
+    """
+    def __init__(self, selector=None, min_length=50):
+        self.selector = selector
+        self.min_length = min_length
+
+    def _select(self, root, selector):
+        found = compiled_xpath(selector)(root)
+        if found and len(element_text(found[0]).strip()) > self.min_length:
+            return found[0]
+        return None
+
+    def find_content(self, root):
+        # 1. 已学到的选择器
+        if self.selector:
+            el = self._select(root, self.selector)
+            if el is not None:
+                return el
+
+        # 2. 依次试探常见选择器，命中后记住
+        for sel in CONTENT_SELECTORS:
+            if sel == self.selector: continue
+            el = self._select(root, sel)
+            if el is not None:
+                self.selector = sel
+                return el
+
+        # 3. 兜底：找字数最多的 div
+        return _largest_text_div(root)
+
+    def extract_lines(self, html):
+        """返回正文段落列表 (未过滤广告)，提取失败返回 None"""
+        if not html: return None
+        root = parse_html(html)
+        content_ele = self.find_content(root)
+        if content_ele is None: return None
+
+        # 优先提取 p 标签，如果没有则按行分割
+        p_tags = _P_TAGS(content_ele)
+        if p_tags:
+            lines = [element_text(p).strip() for p in p_tags]
+            return [line for line in lines if line]
+        return element_lines(content_ele)
+
+
+# 目录链接的特征词
+CATALOG_KEYWORDS = ["第", "章", "节", "回", "尾声"]
+
+
+def _is_chapter_text(text):
+    return any(k in text for k in CATALOG_KEYWORDS) or text.strip().isdigit()
+
+
+def extract_catalog_links(html, base_url):
+    """
+    从目录页快照中找出章节链接最多的 div/ul 容器，返回其中所有链接 [(文字, 绝对地址), ...]。
+    自底向上一次遍历统计每个容器内的章节链接数。
+    """
+    root = parse_html(html)
+    root.make_links_absolute(base_url, resolve_base_href=True)
+
+    count = {}
+    best, best_count = None, 0
+    for el in reversed(list(root.iter(etree.Element))):
+        n = 1 if el.tag == 'a' and _is_chapter_text(element_text(el)) else 0
+        for c in el:
+            if isinstance(c.tag, str):
+                n += count[c]
+        count[el] = n
+        if el.tag in ('div', 'ul') and n > best_count:
+            best, best_count = el, n
+
+    container = best if best is not None else root
+    return [(element_text(a).strip(), a.get('href')) for a in container.iter('a')]
+
+
+# 页面标题 (<title>) 里书名之后常见的后缀
+_TITLE_SUFFIX = re.compile(r'(最新章节|全文阅读|章节目录|全部章节|全集|无弹窗|在线阅读|TXT下载).*$', re.I)
+
+
+def extract_heading(html):
+    """目录页快照中 <h1> 的文本；没有时返回 None"""
+    h1 = parse_html(html).find('.//h1')
+    text = element_text(h1).strip() if h1 is not None else ''
+    return text or None
+
+
+def extract_book_title(html):
+    """从目录页快照中提取书名：优先 <h1>，其次 <title>；找不到返回 None"""
+    root = parse_html(html)
+    h1 = root.find('.//h1')
+    raw = element_text(h1).strip() if h1 is not None else ''
+    if not raw:
+        title = root.find('.//title')
+        raw = (title.text or '').strip() if title is not None else ''
+    # 去除可能的后缀 (如 "书名_作者_..."、"书名最新章节列表")
+    raw = re.split(r'[_|｜]', raw)[0]
+    raw = _TITLE_SUFFIX.sub('', raw).strip()
+    return raw or None
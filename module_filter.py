@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+广告/水印过滤引擎：把规则文件里的所有规则编译成一个组合正则，每行只扫描一遍。
+
+规则文件格式见 ad_rules.txt；novels/ad_rules.txt 中的个人规则会一起生效。
+检查某个章节文件会被删掉哪些行：
+    python module_filter.py check novels/<书名>/0001_xxx.txt
+"""
+import os
+import re
+import sys
+import hashlib
+import threading
+from common import clean_title
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ad_rules.txt")
+USER_RULES_NAME = "ad_rules.txt"
+
+# 规则类型
+RULE_KEYWORD = 'keyword'
+RULE_REGEX = 're'
+RULE_LINE = 'line'
+RULE_STRIP = 'strip'
+
+# 全角空格、不换行空格、零宽字符等统一处理
+_ODD_SPACES = re.compile(r'[\u3000\xa0\u2002-\u200a\u202f\u205f]')
+_ZERO_WIDTH = re.compile(r'[\u200b-\u200d\u2060\ufeff]')
+_RUNS = re.compile(r'[ \t]+')
+
+# 规则开头的全局标志，如 (?i)；拼进组合正则后只能放在最前面，所以改写成只作用于本条的 (?i:...)
+_GLOBAL_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+# 引用了分组编号/名称的规则：拼进组合正则后编号会错位，单独匹配
+_BACKREF = re.compile(r'\\(?:[1-9]|g<)|\(\?P=')
+
+
+def parse_rules(text):
+    """解析规则文本，返回 [(类型, 模式)]"""
+    rules = []
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        kind, sep, pattern = line.partition(':')
+        if sep and kind in (RULE_REGEX, RULE_LINE, RULE_STRIP) and pattern:
+            rules.append((kind, pattern))
+        else:
+            rules.append((RULE_KEYWORD, line))
+    return rules
+
+
+def _scoped(pattern):
+    """把一条规则包成独立的非捕获组；开头的全局标志 (?i) 改为 (?i:...)"""
+    flags = ''
+    m = _GLOBAL_FLAGS.match(pattern)
+    while m:
+        flags += m.group(1)
+        pattern = pattern[m.end():]
+        m = _GLOBAL_FLAGS.match(pattern)
+    return f"(?{flags}:{pattern})" if flags else f"(?:{pattern})"
+
+
+def _combine(parts):
+    """规则片段 -> (组合正则或 None, 需要逐条匹配的正则列表)"""
+    joined, separate = [], []
+    for part in parts:
+        if _BACKREF.search(part):
+            separate.append(re.compile(part))
+        else:
+            joined.append(part)
+    combined = None
+    if joined:
+        try:
+            combined = re.compile("|".join(joined))
+        except re.error as e:
+            # 例如多条规则定义了同名分组；逐条匹配结果相同，只是慢一些
+            print(f"[过滤] 规则无法合并为一个正则 ({e})，改为逐条匹配")
+            separate = [re.compile(part) for part in joined] + separate
+    return combined, separate
+
+
+class AdFilter:
+    def __init__(self, rules):
+        self.rules = rules
+        drop, strip = [], []
+        for kind, pattern in rules:
+            if kind == RULE_KEYWORD:
+                drop.append(re.escape(pattern))
+                continue
+            part = _scoped(pattern)
+            if kind == RULE_LINE:
+                part = f"^{part}$"
+            # 逐条先编译一次，写错的正则只跳过这一条
+            try:
+                re.compile(part)
+            except re.error as e:
+                print(f"[过滤] 忽略无效规则 {kind}:{pattern} ({e})")
+                continue
+            (strip if kind == RULE_STRIP else drop).append(part)
+        self._drop, self._drop_each = _combine(drop)
+        self._strip, self._strip_each = _combine(strip)
+        # 规则指纹：清洗步骤用它判断文件是否已按当前规则处理过
+        self.signature = hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def from_files(cls, *paths):
+        rules = []
+        for path in paths:
+            if path and os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    rules += parse_rules(f.read())
+        return cls(rules)
+
+    def clean_line(self, line):
+        """返回清理后的行；整行是广告时返回 None"""
+        if self._strip or self._strip_each:
+            if self._strip:
+                line = self._strip.sub('', line)
+            for regex in self._strip_each:
+                line = regex.sub('', line)
+            line = line.strip()
+            if not line:
+                return None
+        if self._drop and self._drop.search(line):
+            return None
+        if any(regex.search(line) for regex in self._drop_each):
+            return None
+        return line
+
+    def filter_lines(self, lines):
+        out = []
+        for line in lines:
+            line = self.clean_line(line)
+            if line:
+                out.append(line)
+        return out
+
+    def matches(self, line):
+        """调试用：返回命中的规则片段 (None 表示未命中)"""
+        for regex in [self._drop, *self._drop_each, self._strip, *self._strip_each]:
+            m = regex.search(line) if regex else None
+            if m:
+                return m.group(0)
+        return None
+
+
+def _squash(text):
+    return re.sub(r'\s+', '', text)
+
+
+def clean_text(ad_filter, title, text):
+    """
+    重新清洗一章正文：过滤广告行、规整空白 (全角/零宽空格、连续空格)、
+    一行一段并以空行分隔 (与下载步骤的输出一致)、去掉开头重复的章节标题。
+    """
+    text = _ZERO_WIDTH.sub('', text)
+    lines = []
+    for line in text.splitlines():
+        line = _RUNS.sub(' ', _ODD_SPACES.sub(' ', line)).strip()
+        if line:
+            lines.append(line)
+    lines = ad_filter.filter_lines(lines)
+
+    # 正文开头重复的标题 (可能不止一行，例如 "第一章 xxx" 后面又跟一遍)
+    titles = {_squash(title), _squash(clean_title(title))} - {''}
+    while lines and _squash(lines[0]) in titles:
+        lines.pop(0)
+    return '\n\n'.join(lines)
+
+
+_worker_filters = {}
+
+
+def clean_chapter_files(rules, batch):
+    """
+    进程池的工作函数：按 rules 清洗一批章节文件并原地改写 (临时文件 + 原子替换)。
+    batch 为 [(标题, 文件路径), ...]，返回等长列表，元素为
+    (是否改写, 新内容 sha1 或 None, 原大小, 新大小)，出错时为错误信息 (str)。
+    """
+    # 同一个工作进程只编译一次规则
+    ad_filter = _worker_filters.get(repr(rules))
+    if ad_filter is None:
+        ad_filter = _worker_filters[repr(rules)] = AdFilter(rules)
+
+    results = []
+    for title, path in batch:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            results.append(f"读取文件失败 {path}: {e}")
+            continue
+        size = len(text.encode('utf-8'))
+        cleaned = clean_text(ad_filter, title, text)
+        if cleaned == text:
+            results.append((False, None, size, size))
+            continue
+        if not cleaned:
+            # 整章都被规则删掉了，多半是规则写得太宽，保留原文件
+            results.append(f"清洗后正文为空，已跳过 {path}")
+            continue
+        data = cleaned.encode('utf-8')
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            results.append(f"写入文件失败 {path}: {e}")
+            continue
+        results.append((True, hashlib.sha1(data).hexdigest(), size, len(data)))
+    return results
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_filter(base_path=None):
+    """
+    默认规则 + base_path 下的个人规则；规则文件修改后下次调用自动重新编译。
+    """
+    paths = (DEFAULT_RULES_PATH, os.path.join(base_path, USER_RULES_NAME) if base_path else None)
+    stamp = tuple(os.path.getmtime(p) if p and os.path.exists(p) else None for p in paths)
+    with _shared_lock:
+        cached = _shared.get(paths)
+        if cached is None or cached[0] != stamp:
+            cached = _shared[paths] = (stamp, AdFilter.from_files(*paths))
+        return cached[1]
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != 'check':
+        print(__doc__)
+        return
+    ad_filter = shared_filter("novels")
+    with open(sys.argv[2], 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            hit = ad_filter.matches(line) if line else None
+            if hit:
+                result = ad_filter.clean_line(line)
+                action = "删除整行" if result is None else f"保留: {result}"
+                print(f"  第{n}行 [{hit}] {action}\n    {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from urllib.parse import urlparse
+from urllib.request import getproxies, proxy_bypass
+import requests
+from module_pacing import classify_status, FAIL_CLOUDFLARE, FAIL_EMPTY, FAIL_ERROR
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# aiohttp 只有在安装了 Brotli 时才能解压 br，否则不要声明支持
+try:
+    import brotli  # noqa: F401
+    _ENCODINGS = "gzip, deflate, br"
+except ImportError:
+    _ENCODINGS = "gzip, deflate"
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Accept-Encoding": _ENCODINGS,
+}
+
+# Cloudflare 质询页的特征
+CF_MARKERS = ["Just a moment", "cf-browser-verification", "challenge-platform", "cf_chl_opt"]
+
+# handler 的返回值
+RESULT_OK = 'ok'
+RESULT_RETRY = 'retry'
+RESULT_CLOUDFLARE = 'cloudflare'
+
+
+def is_cloudflare_page(status, html):
+    """判断响应是否为 Cloudflare 质询页"""
+    if status not in (200, 403, 429, 503):
+        return False
+    head = html[:4000] if html else ""
+    return any(m in head for m in CF_MARKERS)
+
+
+def system_proxy():
+    """读取系统代理 (Windows 下会读取注册表中的代理设置)"""
+    proxies = getproxies()
+    return proxies.get('https') or proxies.get('http')
+
+
+def fetch_once(url, headers=None, timeout=15):
+    """
+    同步抓取单个页面 (目录检查等一次性请求用)。
+    返回 (状态码, HTML, 响应头)；网络异常时状态码为 0。
+    """
+    h = dict(DEFAULT_HEADERS)
+    if headers:
+        h.update(headers)
+    try:
+        resp = requests.get(url, headers=h, timeout=timeout)
+        if resp.encoding and resp.encoding.lower() == 'iso-8859-1':
+            resp.encoding = resp.apparent_encoding
+        return resp.status_code, resp.text, resp.headers
+    except Exception as e:
+        print(f"  [HTTP异常] {url}: {e}")
+        return 0, "", {}
+
+
+class AsyncHttpFetcher:
+    """
+    基于 aiohttp 的并发抓取器：
+    连接复用 (keep-alive)、gzip/brotli 解压，并发数可配置。
+    传入 controller (PacingController) 时，实际并发与请求间隔由它动态调节，
+    concurrency 只作为上限。
+    传入 metrics (module_metrics.RunMetrics) 时记录每个请求的延迟、状态码、重试与质询次数。
+    """
+    def __init__(self, concurrency=8, timeout=15, retries=3, headers=None, controller=None, metrics=None):
+        self.concurrency = max(1, int(concurrency))
+        self.controller = controller
+        self.metrics = metrics
+        self.timeout = timeout
+        self.retries = retries
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self.proxy = system_proxy()
+
+    @staticmethod
+    def available():
+        return aiohttp is not None
+
+    def _proxy_for(self, url):
+        """本机地址 (如 mock_uuks 模拟站点) 与系统代理例外列表中的地址直连"""
+        if not self.proxy:
+            return None
+        host = urlparse(url).hostname or ''
+        if host in ('127.0.0.1', 'localhost', '::1') or proxy_bypass(host):
+            return None
+        return self.proxy
+
+    async def _fetch(self, session, url):
+        async with session.get(url, proxy=self._proxy_for(url)) as resp:
+            html = await resp.text(errors='replace')
+            return resp.status, html
+
+    async def _worker(self, session, queue, handler, blocked, failed, on_attempt):
+        while True:
+            try:
+                item, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            ctl = self.controller
+            metrics = self.metrics
+            for retry in range(self.retries):
+                if on_attempt: on_attempt(item, retry)
+                if ctl: await ctl.acquire_async()
+                start = time.time()
+                try:
+                    status, html = await self._fetch(session, url)
+                except Exception as e:
+                    status, html = 0, ""
+                    print(f"  [HTTP异常] {url}: {e}")
+                finally:
+                    if ctl: ctl.release()
+                latency = time.time() - start
+                if metrics:
+                    metrics.observe('fetch_seconds', latency, mode='http')
+                    if status != 200:
+                        metrics.inc('http_status', code=status)
+
+                if is_cloudflare_page(status, html):
+                    if ctl: ctl.on_failure(FAIL_CLOUDFLARE)
+                    if metrics: metrics.inc('cloudflare')
+                    blocked.append(item)
+                    break
+
+                result = handler(item, html if status == 200 else None)
+                if ctl:
+                    if result == RESULT_OK:
+                        ctl.on_success(latency)
+                    elif result == RESULT_RETRY:
+                        ctl.on_failure(classify_status(status) or (FAIL_EMPTY if status == 200 else FAIL_ERROR))
+                if result == RESULT_OK:
+                    if ctl: await ctl.pause_async()
+                    break
+                if result == RESULT_CLOUDFLARE:
+                    if ctl: ctl.on_failure(FAIL_CLOUDFLARE)
+                    if metrics: metrics.inc('cloudflare')
+                    blocked.append(item)
+                    break
+                if retry < self.retries - 1:
+                    if metrics: metrics.inc('retries')
+                    if ctl:
+                        await ctl.retry_wait_async(retry)
+                    else:
+                        await asyncio.sleep(1)
+            else:
+                failed.append(item)
+
+    async def _run(self, items, handler, on_attempt):
+        queue = asyncio.Queue()
+        for item, url in items:
+            queue.put_nowait((item, url))
+
+        blocked, failed = [], []
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+            workers = [self._worker(session, queue, handler, blocked, failed, on_attempt) for _ in range(self.concurrency)]
+            await asyncio.gather(*workers)
+        return blocked, failed
+
+    def fetch_all(self, items, handler, on_attempt=None):
+        """
+        并发抓取 items = [(item, url), ...]。
+        handler(item, html) 在事件循环线程中回调 (请求失败时 html 为 None)，
+        返回 RESULT_OK / RESULT_RETRY / RESULT_CLOUDFLARE。
+        on_attempt(item, retry) 在每次发出请求前回调 (retry 从 0 开始)，用于进度事件。
+        返回值：(被 Cloudflare 拦截、需交给浏览器处理的 item 列表, 重试耗尽的 item 列表)
+        """
+        if not items:
+            return [], []
+        start = time.time()
+        blocked, failed = asyncio.run(self._run(items, handler, on_attempt))
+        print(f"[HTTP] 完成 {len(items)} 个请求，用时 {time.time() - start:.1f}s，"
+              f"被拦截 {len(blocked)} 个，失败 {len(failed)} 个")
+        return blocked, failed
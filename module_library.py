@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+可选的 SQLite 书库：跨书籍查询章节状态 (哪些书有失败章节、全库还有多少待下载等)。
+
+启用方式：执行一次迁移，在 novels 目录下生成 library.db
+    python module_library.py migrate [novels]
+之后各步骤通过 CatalogStore 读写目录时会自动同步到书库。
+catalog.json 仍然是每本书的主数据，书库只是带索引的镜像。
+
+查询：
+    python module_library.py failed   [novels]   有失败章节的书
+    python module_library.py pending  [novels]   全库待下载统计
+"""
+import os
+import sys
+import time
+import sqlite3
+import threading
+from common import load_json, save_json, truncate_journal, StatusJournal
+
+LIBRARY_DB_NAME = "library.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id         INTEGER PRIMARY KEY,
+    folder     TEXT UNIQUE NOT NULL,
+    title      TEXT,
+    url        TEXT,
+    author     TEXT,
+    epub_path  TEXT,
+    epub_at    REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    book_id    INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    idx        INTEGER NOT NULL,
+    url        TEXT NOT NULL,
+    title      TEXT,
+    file_name  TEXT,
+    status     TEXT,
+    size       INTEGER,
+    hash       TEXT,
+    updated_at REAL,
+    PRIMARY KEY (book_id, url)
+);
+CREATE INDEX IF NOT EXISTS idx_chapters_status ON chapters(status, book_id);
+"""
+
+
+class LibraryDB:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._dirty = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    # ---------------- 写入 ----------------
+    def has_book(self, folder):
+        return self.conn.execute("SELECT 1 FROM books WHERE folder=?", (folder,)).fetchone() is not None
+
+    def _book_id(self, folder):
+        row = self.conn.execute("SELECT id FROM books WHERE folder=?", (folder,)).fetchone()
+        if row:
+            return row[0]
+        cur = self.conn.execute("INSERT INTO books(folder, updated_at) VALUES(?, ?)", (folder, time.time()))
+        return cur.lastrowid
+
+    def sync_catalog(self, folder, data):
+        """用完整目录覆盖该书的章节表 (单个事务)"""
+        now = time.time()
+        with self.lock, self.conn:
+            book_id = self._book_id(folder)
+            self.conn.execute("UPDATE books SET title=?, url=?, updated_at=? WHERE id=?",
+                              (data.get('title'), data.get('url'), now, book_id))
+            self.conn.execute("DELETE FROM chapters WHERE book_id=?", (book_id,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chapters(book_id, idx, url, title, file_name, status, size, hash, updated_at) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(book_id, i, ch.get('url'), ch.get('title'), ch.get('file_name'), ch.get('status'),
+                  ch.get('size'), ch.get('hash'), now) for i, ch in enumerate(data.get('chapters', []))])
+
+    def update_chapter(self, folder, url, fields):
+        """更新单个章节 (批量提交，flush() 时落盘)"""
+        cols = [k for k in ('status', 'size', 'hash', 'title', 'file_name') if k in fields]
+        if not cols:
+            return
+        with self.lock:
+            book_id = self._book_id(folder)
+            sets = ", ".join(f"{c}=?" for c in cols)
+            self.conn.execute(f"UPDATE chapters SET {sets}, updated_at=? WHERE book_id=? AND url=?",
+                              [fields[c] for c in cols] + [time.time(), book_id, url])
+            self._dirty += 1
+            if self._dirty >= 100:
+                self.conn.commit()
+                self._dirty = 0
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+            self._dirty = 0
+
+    def update_book(self, folder, **fields):
+        cols = [k for k in ('title', 'url', 'author', 'epub_path', 'epub_at') if k in fields]
+        with self.lock, self.conn:
+            book_id = self._book_id(folder)
+            if cols:
+                sets = ", ".join(f"{c}=?" for c in cols)
+                self.conn.execute(f"UPDATE books SET {sets}, updated_at=? WHERE id=?",
+                                  [fields[c] for c in cols] + [time.time(), book_id])
+
+    # ---------------- 查询 ----------------
+    def books_with_status(self, status):
+        return self.conn.execute(
+            "SELECT b.folder, COUNT(*) FROM chapters c JOIN books b ON b.id=c.book_id "
+            "WHERE c.status=? GROUP BY b.id ORDER BY COUNT(*) DESC", (status,)).fetchall()
+
+    def status_summary(self):
+        return self.conn.execute(
+            "SELECT status, COUNT(*), COALESCE(SUM(size), 0) FROM chapters GROUP BY status").fetchall()
+
+    def book_summary(self, folder):
+        return dict(self.conn.execute(
+            "SELECT c.status, COUNT(*) FROM chapters c JOIN books b ON b.id=c.book_id "
+            "WHERE b.folder=? GROUP BY c.status", (folder,)).fetchall())
+
+    # ---------------- 迁移 ----------------
+    def migrate_from_json(self, base_path):
+        """把现有 novels/<书名>/catalog.json + book_info.json 导入书库"""
+        count = 0
+        for folder in sorted(os.listdir(base_path)):
+            book_dir = os.path.join(base_path, folder)
+            catalog = load_json(os.path.join(book_dir, 'catalog.json')) if os.path.isdir(book_dir) else None
+            if not catalog:
+                continue
+            # 补齐文件大小 (JSON 布局里没有记录)
+            for ch in catalog.get('chapters', []):
+                if ch.get('size') is None and ch.get('file_name'):
+                    try:
+                        ch['size'] = os.path.getsize(os.path.join(book_dir, ch['file_name']))
+                    except OSError:
+                        pass
+            self.sync_catalog(folder, catalog)
+            info = load_json(os.path.join(book_dir, 'book_info.json'))
+            if info:
+                self.update_book(folder, author=info.get('author'))
+            count += 1
+            print(f"[书库] 已导入: {folder} ({len(catalog.get('chapters', []))} 章)")
+        return count
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def open_library(base_path, create=False):
+    """返回 base_path 下的书库；未启用 (library.db 不存在) 时返回 None"""
+    path = os.path.join(base_path, LIBRARY_DB_NAME)
+    with _libraries_lock:
+        db = _libraries.get(path)
+        if db is None and (create or os.path.exists(path)):
+            db = _libraries[path] = LibraryDB(path)
+        return db
+
+
+class _MirroredJournal(StatusJournal):
+    """状态日志 + 书库镜像"""
+    def __init__(self, json_path, data, db, folder):
+        super().__init__(json_path, data)
+        self.db = db
+        self.folder = folder
+
+    def record(self, ch, **fields):
+        super().record(ch, **fields)
+        self.db.update_chapter(self.folder, ch.get('url'), fields)
+
+    def compact(self):
+        super().compact()
+        self.db.flush()
+
+
+class CatalogStore:
+    """
+    目录存储的统一接口：Step1/2/3/4 都通过它读写 catalog.json，
+    启用书库时自动把目录与章节状态同步到 SQLite。
+    """
+    def __init__(self, base_path, book_folder):
+        self.base_path = base_path
+        self.folder = book_folder
+        self.book_dir = os.path.join(base_path, book_folder)
+        self.json_path = os.path.join(self.book_dir, 'catalog.json')
+        self.db = open_library(base_path)
+
+    def exists(self):
+        return os.path.exists(self.json_path)
+
+    def load(self):
+        data = load_json(self.json_path)
+        # 书库启用前就存在的书，第一次读取时补登记
+        if data and self.db and not self.db.has_book(self.folder):
+            self.db.sync_catalog(self.folder, data)
+        return data
+
+    def save(self, data):
+        # 快照由 load() 回放过日志的数据生成，已包含全部变更
+        if save_json(self.json_path, data):
+            truncate_journal(self.json_path)
+        if self.db:
+            self.db.sync_catalog(self.folder, data)
+
+    def journal(self, data):
+        """章节状态日志 (启用书库时同时写入 SQLite)"""
+        if self.db:
+            return _MirroredJournal(self.json_path, data, self.db, self.folder)
+        return StatusJournal(self.json_path, data)
+
+    def update_book(self, **fields):
+        if self.db:
+            self.db.update_book(self.folder, **fields)
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+    base_path = sys.argv[2] if len(sys.argv) > 2 else "novels"
+
+    if cmd == 'migrate':
+        db = open_library(base_path, create=True)
+        n = db.migrate_from_json(base_path)
+        print(f"[完成] 共导入 {n} 本书 -> {db.path}")
+        return
+
+    db = open_library(base_path)
+    if not db:
+        print(f"[错误] 书库未启用，请先执行: python module_library.py migrate {base_path}")
+        return
+
+    if cmd == 'failed':
+        rows = db.books_with_status('failed')
+        if not rows:
+            print("[书库] 没有失败章节。")
+        for folder, n in rows:
+            print(f"  《{folder}》 失败 {n} 章")
+    elif cmd == 'pending':
+        for status, n, size in db.status_summary():
+            print(f"  {status or '未知'}: {n} 章 ({size / 1024 / 1024:.1f} MB)")
+        for folder, n in db.books_with_status('pending'):
+            print(f"  《{folder}》 待下载 {n} 章")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import threading
+from common import load_json, save_json
+
+# 清单缓存放在 novels/.cache 下，避免写清单本身改动书籍目录的修改时间
+CACHE_DIR_NAME = ".cache"
+
+
+class ChapterManifest:
+    """
+    书籍目录的文件清单：一次 os.scandir 得到所有文件的 名称/大小/修改时间 (可选内容哈希)。
+    每次 refresh 都扫描一遍 (原地改写文件不会改变目录的修改时间，不能据此跳过)，
+    大小与修改时间都没变的文件沿用缓存的哈希，不重新读取内容；
+    同一进程内的各步骤共享同一个实例，并持久化到磁盘供下次运行使用。
+    """
+    def __init__(self, book_dir, cache_path=None):
+        self.book_dir = book_dir
+        self.cache_path = cache_path
+        self.entries = {}   # name -> [size, mtime_ns, sha1 或 None]
+        self._dirty = False
+        self._lock = threading.RLock()
+        if cache_path:
+            cached = load_json(cache_path)
+            if cached:
+                self.entries = cached.get('entries', {})
+
+    @classmethod
+    def for_book(cls, base_path, book_folder):
+        """获取 (或创建) 进程内共享的清单，并确保与磁盘同步"""
+        book_dir = os.path.join(base_path, book_folder)
+        key = os.path.abspath(book_dir)
+        with _cache_lock:
+            manifest = _cache.get(key)
+            if manifest is None:
+                cache_path = os.path.join(base_path, CACHE_DIR_NAME, f"{book_folder}.manifest.json")
+                manifest = _cache[key] = cls(book_dir, cache_path)
+        manifest.refresh()
+        return manifest
+
+    def refresh(self):
+        """扫描一遍目录；同名且大小、修改时间都未变的条目保留已算好的哈希，其余的哈希作废"""
+        with self._lock:
+            entries = {}
+            try:
+                with os.scandir(self.book_dir) as it:
+                    for e in it:
+                        if not e.is_file():
+                            continue
+                        st = e.stat()
+                        old = self.entries.get(e.name)
+                        sha1 = old[2] if old and old[0] == st.st_size and old[1] == st.st_mtime_ns else None
+                        entries[e.name] = [st.st_size, st.st_mtime_ns, sha1]
+            except OSError:
+                entries = {}
+            if entries != self.entries:
+                self.entries = entries
+                self._dirty = True
+
+    # ---------------- 查询 ----------------
+    def names(self):
+        return list(self.entries)
+
+    def exists(self, name):
+        return name in self.entries
+
+    def size(self, name):
+        entry = self.entries.get(name)
+        return entry[0] if entry else -1
+
+    def hash(self, name):
+        """文件内容的 sha1 (按需计算并缓存)"""
+        with self._lock:
+            entry = self.entries.get(name)
+            if not entry:
+                return None
+            if entry[2] is None:
+                h = hashlib.sha1()
+                with open(os.path.join(self.book_dir, name), 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        h.update(block)
+                entry[2] = h.hexdigest()
+                self._dirty = True
+            return entry[2]
+
+    # ---------------- 本进程的写入 ----------------
+    def record(self, name, sha1=None):
+        """本进程刚写入/覆盖了 name (写入方已算好内容哈希时可一并传入)"""
+        with self._lock:
+            st = os.stat(os.path.join(self.book_dir, name))
+            self.entries[name] = [st.st_size, st.st_mtime_ns, sha1]
+            self._dirty = True
+
+    def rename(self, old, new):
+        with self._lock:
+            entry = self.entries.pop(old, None)
+            if entry:
+                self.entries[new] = entry
+            self._dirty = True
+
+    def remove(self, name):
+        with self._lock:
+            self.entries.pop(name, None)
+            self._dirty = True
+
+    def save(self):
+        """持久化清单 (只保存记录在案的条目；下次 refresh 会逐个核对大小和修改时间)"""
+        with self._lock:
+            if not self._dirty or not self.cache_path:
+                return
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            save_json(self.cache_path, {"entries": self.entries})
+            self._dirty = False
+
+
+_cache = {}
+_cache_lock = threading.Lock()
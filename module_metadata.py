@@ -2,15 +2,16 @@
 import re
 import time
 import requests
+from common import SITE_PC_BASE, book_title_from_heading
+from module_cookies import shared_store, is_challenge_title, wait_for_clearance
 
 class MetadataFetcher:
     def __init__(self, page_driver):
         self.page = page_driver
 
     def _check_cloudflare(self):
-        if "Just a moment" in self.page.title or "验证" in self.page.title:
-            print("\n[注意] 触发 Cloudflare 盾，等待 10 秒自动验证...\n")
-            time.sleep(10)
+        if is_challenge_title(self.page.title):
+            wait_for_clearance(self.page)
 
     def fetch_via_pc(self, book_id):
         """
@@ -18,7 +19,7 @@ class MetadataFetcher:
         """
         if not book_id: return None
 
-        pc_url = f"https://www.uuks.org/b/{book_id}/"
+        pc_url = f"{SITE_PC_BASE}/b/{book_id}/"
         print(f"[爬虫] 正在访问 PC 详情页: {pc_url}")
         
         self.page.get(pc_url)
@@ -39,9 +40,7 @@ class MetadataFetcher:
             # === A. 书名 (保留原逻辑) ===
             h1 = self.page.ele('tag:h1')
             if h1:
-                raw = h1.text.strip()
-                if '_' in raw: raw = raw.split('_')[0]
-                meta['title'] = re.sub(r'[\\/:*?"<>|]', '_', raw).strip()
+                meta['title'] = book_title_from_heading(h1.text)
 
             # === B & D. 作者与简介 (关键修改：从混合文本块中正则提取) ===
             # 定位包含“作者：”的元素，获取其父级的完整文本块
@@ -102,6 +101,7 @@ class MetadataFetcher:
             return
         try:
             headers = {'User-Agent': 'Mozilla/5.0'}
+            headers.update(shared_store().http_headers(url))
             resp = requests.get(url, headers=headers, timeout=10)
             if resp.status_code == 200:
                 with open(save_path, 'wb') as f:
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标：每次运行 (某本书的某个步骤) 记录计数器与耗时直方图，结束时导出
+    novels/.metrics/<书名>/<步骤>_<时间>.json     本次运行的汇总 (p50/p90/p99、总量)
+    novels/.metrics/uuks_<步骤>_<书名>.prom       Prometheus 文本格式 (node_exporter textfile 采集)
+Prometheus 文件目录可用环境变量 UUKS_PROM_DIR 指定。
+
+常用指标 (单位：秒 / 字节)：
+    fetch_seconds{mode}     单次抓取 (浏览器打开页面 / HTTP 请求) 的延迟
+    parse_seconds           提取正文/目录
+    write_seconds           写文件
+    stage_seconds{stage}    各阶段总耗时
+    bytes_in / bytes_out    读入的 HTML / 写出的文件
+    retries / cloudflare / failures / http_status{code}
+查看最近一次运行：
+    python module_metrics.py show novels/.metrics/<书名>
+"""
+import os
+import re
+import sys
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_DIR_NAME = ".metrics"
+
+# 延迟直方图的桶上界 (秒)：1ms ~ 60s
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_PROM_NAME = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class Histogram:
+    """固定桶的直方图：记录代价 O(log 桶数)，分位数按桶内线性插值估算"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "sum": round(self.sum, 4),
+                "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+                "p50": round(self.quantile(0.5), 4), "p90": round(self.quantile(0.9), 4),
+                "p99": round(self.quantile(0.99), 4), "max": round(self.max, 4)}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+class RunMetrics:
+    """
+    一次运行的指标。线程安全，可在下载线程 / 事件循环 / 主线程同时记录。
+    step 为步骤名 (catalog / download / epub ...)，book 可以在运行中途再设置。
+    """
+    def __init__(self, step, book=None):
+        self.step = step
+        self.book = book
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    # ---------------- 记录 ----------------
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """with metrics.timer('write_seconds'): ... 记录代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_stage(self, stage, seconds):
+        """阶段耗时累加到 stage_seconds{stage}"""
+        self.inc('stage_seconds', seconds, stage=stage)
+
+    # ---------------- 汇总 ----------------
+    def summary(self):
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": round(v, 4) if isinstance(v, float) else v}
+                        for (n, l), v in sorted(self.counters.items())]
+            histograms = [dict({"name": n, "labels": dict(l)}, **h.summary())
+                          for (n, l), h in sorted(self.histograms.items())]
+        return {"step": self.step, "book": self.book, "started": self.started,
+                "duration": round(time.time() - self.started, 3),
+                "counters": counters, "histograms": histograms}
+
+    def report(self):
+        """一行可读的摘要：各类耗时的总和与 p50/p99"""
+        parts = []
+        with self._lock:
+            items = sorted(self.histograms.items(), key=lambda kv: -kv[1].sum)
+            for (name, labels), h in items:
+                label = name.replace('_seconds', '') + ''.join(f"[{v}]" for _, v in labels)
+                parts.append(f"{label} {h.sum:.1f}s (n={h.count}, p50 {h.quantile(0.5) * 1000:.0f}ms, "
+                             f"p99 {h.quantile(0.99) * 1000:.0f}ms)")
+        return "[指标] " + (" | ".join(parts) if parts else "无")
+
+    def to_prometheus(self):
+        lines = []
+        base = {"step": self.step}
+        if self.book:
+            base["book"] = self.book
+
+        def fmt(labels):
+            merged = dict(base, **labels)
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in merged.items()) + "}"
+
+        with self._lock:
+            declared = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = "uuks_" + _PROM_NAME.sub('_', name) + "_total"
+                if metric not in declared:
+                    declared.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{fmt(dict(labels))} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                metric = "uuks_" + _PROM_NAME.sub('_', name)
+                if metric not in declared:
+                    declared.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, n in zip([str(b) for b in h.buckets] + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{fmt(dict(labels, le=bound))} {cumulative}")
+                lines.append(f"{metric}_sum{fmt(dict(labels))} {h.sum:.6f}")
+                lines.append(f"{metric}_count{fmt(dict(labels))} {h.count}")
+        lines.append("# TYPE uuks_run_timestamp_seconds gauge")
+        lines.append(f"uuks_run_timestamp_seconds{fmt({})} {self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    # ---------------- 导出 ----------------
+    def export(self, base_path):
+        """写出 JSON 汇总与 Prometheus 文本文件，返回 JSON 路径 (失败时打印警告并返回 None)"""
+        book = _safe_name(self.book or "_")
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        json_dir = os.path.join(base_path, METRICS_DIR_NAME, book)
+        prom_dir = os.environ.get('UUKS_PROM_DIR') or os.path.join(base_path, METRICS_DIR_NAME)
+        json_path = os.path.join(json_dir, f"{self.step}_{stamp}.json")
+        try:
+            os.makedirs(json_dir, exist_ok=True)
+            os.makedirs(prom_dir, exist_ok=True)
+            _atomic_write(json_path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+            # 同一本书同一步骤只保留最新一次，node_exporter 读到的始终是完整文件
+            _atomic_write(os.path.join(prom_dir, f"uuks_{self.step}_{book}.prom"), self.to_prometheus())
+        except OSError as e:
+            print(f"[指标] 导出失败: {e}")
+            return None
+        return json_path
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _safe_name(name):
+    return re.sub(r'[\\/:*?"<>|\s]', '_', name)
+
+
+def _atomic_write(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != 'show':
+        print(__doc__)
+        return
+    folder = sys.argv[2]
+    files = sorted((f for f in os.listdir(folder) if f.endswith('.json')),
+                   key=lambda f: os.path.getmtime(os.path.join(folder, f)))
+    if not files:
+        print("[指标] 没有找到记录。")
+        return
+    with open(os.path.join(folder, files[-1]), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    print(f"[指标] {data['step']} 《{data['book']}》 用时 {data['duration']:.1f}s ({files[-1]})")
+    for h in data['histograms']:
+        labels = ''.join(f"[{v}]" for v in h['labels'].values())
+        print(f"  {h['name']}{labels}: n={h['count']} 合计 {h['sum']:.2f}s "
+              f"p50 {h['p50'] * 1000:.0f}ms p90 {h['p90'] * 1000:.0f}ms p99 {h['p99'] * 1000:.0f}ms")
+    for c in data['counters']:
+        labels = ''.join(f"[{v}]" for v in c['labels'].values())
+        print(f"  {c['name']}{labels}: {c['value']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# 失败类型
+FAIL_CLOUDFLARE = 'cloudflare'  # 触发 Cloudflare 质询页
+FAIL_EMPTY = 'empty'            # parse_content 没解析出正文
+FAIL_THROTTLED = 'throttled'    # 429 / 503
+FAIL_SLOW = 'slow'              # 延迟明显升高
+FAIL_ERROR = 'error'            # 网络异常等
+
+
+def classify_status(status):
+    """把 HTTP 状态码映射为失败类型，正常返回 None"""
+    if status in (429, 503):
+        return FAIL_THROTTLED
+    if status == 0 or status >= 500:
+        return FAIL_ERROR
+    return None
+
+
+class PacingController:
+    """
+    AIMD (加性增、乘性减) 自适应并发与节奏控制器。
+    响应健康时逐步提高并发、缩短间隔；
+    遇到 Cloudflare / 空内容 / 429·503 / 延迟升高时，并发减半、间隔加倍。
+    线程安全，同一个实例可在目录抓取、浏览器池和 HTTP 模式之间共享。
+    """
+    def __init__(self, start_limit=2, min_limit=1, max_limit=16,
+                 start_delay=0.5, min_delay=0.05, max_delay=10.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.limit = float(start_limit)
+        self.delay = start_delay
+
+        self.in_flight = 0
+        self.latency = None       # 延迟的指数滑动平均
+        self.base_latency = None  # 观察到的最低平均延迟，作为"健康"基线
+        self.last_decrease = 0.0
+        self.peak_limit = self.limit
+        self.stats = {'ok': 0, 'increase': 0, 'decrease': 0,
+                      FAIL_CLOUDFLARE: 0, FAIL_EMPTY: 0, FAIL_THROTTLED: 0, FAIL_SLOW: 0, FAIL_ERROR: 0}
+        self._cond = threading.Condition()
+
+    # ---------------- 并发闸门 ----------------
+    def set_max_limit(self, max_limit):
+        with self._cond:
+            self.max_limit = max(self.min_limit, max_limit)
+            self.limit = min(self.limit, float(self.max_limit))
+
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight < self.current_limit():
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.current_limit():
+                self._cond.wait(0.5)
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        while not self.try_acquire():
+            await asyncio.sleep(0.05)
+
+    def release(self):
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    # ---------------- 反馈 ----------------
+    def on_success(self, latency=None):
+        with self._cond:
+            self.stats['ok'] += 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+                if self.base_latency is None or self.latency < self.base_latency:
+                    self.base_latency = self.latency
+                # 平均延迟超过基线 2.5 倍，视为站点开始吃力
+                if self.stats['ok'] > 5 and self.latency > self.base_latency * 2.5 + 0.2:
+                    self._decrease(FAIL_SLOW)
+                    return
+
+            # 加性增：大约每完成一个"窗口"的请求，并发 +1
+            old = self.current_limit()
+            self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            self.delay = max(self.min_delay, self.delay - 0.02)
+            if self.current_limit() > old:
+                self.stats['increase'] += 1
+                self.peak_limit = max(self.peak_limit, self.limit)
+                self._cond.notify_all()
+
+    def on_failure(self, kind=FAIL_ERROR):
+        with self._cond:
+            self._decrease(kind)
+
+    def _decrease(self, kind):
+        self.stats[kind] = self.stats.get(kind, 0) + 1
+        now = time.time()
+        # 同一波失败只减一次，避免一串并发请求同时失败时把并发直接打到底
+        if now - self.last_decrease < max(1.0, self.latency or 0):
+            return
+        self.last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit / 2)
+        self.delay = min(self.max_delay, max(self.delay * 2, 0.5))
+        self.stats['decrease'] += 1
+
+    # ---------------- 节奏 ----------------
+    def _jitter(self, base):
+        return base * random.uniform(0.8, 1.2)
+
+    def pause(self):
+        """两次请求之间的间隔"""
+        time.sleep(self._jitter(self.delay))
+
+    async def pause_async(self):
+        await asyncio.sleep(self._jitter(self.delay))
+
+    def retry_wait(self, attempt):
+        """第 attempt 次重试前的等待 (指数退避)"""
+        time.sleep(min(self.max_delay, self._jitter(max(self.delay, 0.5) * (2 ** attempt))))
+
+    async def retry_wait_async(self, attempt):
+        await asyncio.sleep(min(self.max_delay, self._jitter(max(self.delay, 0.5) * (2 ** attempt))))
+
+    # ---------------- 报告 ----------------
+    def snapshot(self):
+        with self._cond:
+            return {
+                'limit': self.current_limit(),
+                'peak_limit': int(self.peak_limit),
+                'delay': round(self.delay, 3),
+                'latency': round(self.latency, 3) if self.latency is not None else None,
+                'base_latency': round(self.base_latency, 3) if self.base_latency is not None else None,
+                'stats': dict(self.stats),
+            }
+
+    def report(self):
+        s = self.snapshot()
+        st = s['stats']
+        lat = f"{s['latency']:.2f}s" if s['latency'] is not None else "-"
+        return (f"[节奏] 并发 {s['limit']} (峰值 {s['peak_limit']}) | 间隔 {s['delay']:.2f}s | 平均延迟 {lat} | "
+                f"加速 {st['increase']} 次 / 退避 {st['decrease']} 次 "
+                f"(盾 {st[FAIL_CLOUDFLARE]}, 空内容 {st[FAIL_EMPTY]}, 限流 {st[FAIL_THROTTLED]}, "
+                f"变慢 {st[FAIL_SLOW]}, 异常 {st[FAIL_ERROR]})")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_controller():
+    """进程内共享的控制器：目录抓取与章节下载使用同一份站点健康状态"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PacingController()
+        return _shared
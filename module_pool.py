@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+有界、保序的进程池：清洗正文 (Step3) 与渲染章节 (Step4) 共用。
+任务按批提交，结果按提交顺序逐个产出；同时在途的批次不超过 进程数 × IN_FLIGHT_FACTOR，
+已算好但还没被取走的结果不会无限堆积。
+"""
+import os
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+# 每个进程同时在途的批次数
+IN_FLIGHT_FACTOR = 4
+
+
+def worker_count(todo, workers=None, min_items=64, batch=16):
+    """
+    待处理 todo 项时实际使用的进程数 (workers 为 None 时按 CPU 核数)。
+    少于 min_items 项时返回 1：启动进程的开销比处理本身还大。
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if todo < min_items:
+        return 1
+    return max(1, min(workers, todo // batch))
+
+
+def ordered_map(func, items, workers, batch=16, args=(), label="处理"):
+    """
+    把 items 按 batch 项一组交给 func(*args, 一组) (须返回与该组等长的结果列表，且可被子进程导入)，
+    按顺序逐项产出结果。workers <= 1 或无法启动进程池时在当前进程里逐组处理。
+    """
+    batches = [items[i:i + batch] for i in range(0, len(items), batch)]
+    pool = None
+    if workers > 1:
+        try:
+            pool = ProcessPoolExecutor(workers)
+        except (OSError, NotImplementedError) as e:
+            print(f"[警告] 无法启动进程池 ({e})，改为单进程{label}")
+    if pool is None:
+        for group in batches:
+            yield from func(*args, group)
+        return
+    with pool:
+        pending = deque()
+        it = iter(batches)
+        for group in islice(it, workers * IN_FLIGHT_FACTOR):
+            pending.append(pool.submit(func, *args, group))
+        while pending:
+            results = pending.popleft().result()
+            group = next(it, None)
+            if group:
+                pending.append(pool.submit(func, *args, group))
+            yield from results
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import hashlib
+
+# 占位页 / 错误页的特征文字 (只在正文很短时判定，避免误伤正常章节)
+PLACEHOLDER_SIGNATURES = [
+    "正在手打中", "手打中，请稍后", "请稍后再来", "请稍后刷新", "章节内容正在努力恢复",
+    "内容更新中", "本章节内容加载失败", "章节不存在", "403 Forbidden", "404 Not Found",
+    "502 Bad Gateway", "503 Service", "Just a moment", "Access denied",
+]
+PLACEHOLDER_MAX_CHARS = 1000
+
+# 指纹只对足够长的正文有意义
+FINGERPRINT_MIN_CHARS = 200
+# 汉明距离不超过该值视为近似重复 (64 位 simhash)
+NEAR_DUPLICATE_BITS = 3
+# 同一章节最多自动重下几次，之后标记为 suspect，不再反复重下
+MAX_QUALITY_RETRIES = 2
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    return _SPACES.sub('', text)
+
+
+def placeholder_reason(text):
+    """命中占位页特征时返回命中的文字，否则 None"""
+    if len(normalize_text(text)) > PLACEHOLDER_MAX_CHARS:
+        return None
+    for sig in PLACEHOLDER_SIGNATURES:
+        if sig in text:
+            return sig
+    return None
+
+
+def simhash(text, shingle=3):
+    """64 位 simhash (字符 3-gram)，文本太短时返回 None"""
+    text = normalize_text(text)
+    if len(text) < FINGERPRINT_MIN_CHARS:
+        return None
+    n = len(text) - shingle + 1
+    # 所有 shingle 的哈希拼成一个 0/1 字符串，按步长切片统计每一位 (比逐位循环快得多)
+    bits = ''.join(hashlib.blake2b(text[i:i + shingle].encode('utf-8'), digest_size=8).digest().hex()
+                   for i in range(n))
+    bits = bin(int(bits, 16))[2:].zfill(n * 64)
+    value = 0
+    for bit in range(64):
+        if bits[bit::64].count('1') * 2 > n:
+            value |= 1 << (63 - bit)
+    return f"{value:016x}"
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def find_duplicates(chapters):
+    """
+    按目录顺序找出内容重复的章节：完全相同 (hash) 或近似相同 (simhash)。
+    每组保留最靠前的一章，返回 {后面章节的下标: 被重复的章节下标}。
+    近似比较用 4 段 16 位分桶，只比较至少一段相同的候选 (距离 <=3 时必然有一段相同)。
+    """
+    dup = {}
+    by_hash = {}
+    buckets = {}
+    for idx, ch in enumerate(chapters):
+        if ch.get('status') != 'success':
+            continue
+        h = ch.get('hash')
+        if h:
+            if h in by_hash:
+                dup[idx] = by_hash[h]
+                continue
+            by_hash[h] = idx
+
+        fp = ch.get('fp')
+        if not fp:
+            continue
+        keys = [(band, fp[band * 4:(band + 1) * 4]) for band in range(4)]
+        match = None
+        for key in keys:
+            for other in buckets.get(key, ()):
+                if hamming(fp, chapters[other]['fp']) <= NEAR_DUPLICATE_BITS:
+                    match = other
+                    break
+            if match is not None:
+                break
+        if match is not None:
+            dup[idx] = match
+            continue
+        for key in keys:
+            buckets.setdefault(key, []).append(idx)
+    return dup
+
+
+class QualityChecker:
+    """
+    章节内容质量检查：为每个已下载章节记录内容哈希 (文件 sha1) 和 simhash 指纹，
+    找出占位页 / 跨章节重复，交给下载器重新排队。
+    文件没变化 (哈希与目录记录一致) 时不再读取正文。
+    """
+    def __init__(self, manifest, journal):
+        self.manifest = manifest
+        self.journal = journal
+
+    def fingerprint(self, ch):
+        """确保 ch 的 hash/fp 与磁盘文件一致；返回占位页特征 (没有则 None)"""
+        name = ch['file_name']
+        sha1 = self.manifest.hash(name)
+        if sha1 is None:
+            return None
+        if ch.get('hash') == sha1 and 'fp' in ch:
+            return ch.get('placeholder')
+
+        with open(os.path.join(self.manifest.book_dir, name), 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        reason = placeholder_reason(text)
+        reason = f"占位页: {reason}" if reason else None
+        self.journal.record(ch, hash=sha1, fp=simhash(text), placeholder=reason)
+        return reason
+
+    def scan(self, chapters, indices=None):
+        """
+        检查章节 (indices 为下标集合，为空时检查全部已成功的章节)，返回需要重下的章节列表。
+        超过重试次数的章节标记为 suspect 并保留文件。
+        """
+        flagged = {}
+        for idx in (indices if indices is not None else range(len(chapters))):
+            ch = chapters[idx]
+            if ch.get('status') != 'success':
+                continue
+            reason = self.fingerprint(ch)
+            if reason:
+                flagged[idx] = reason
+
+        for idx, orig in find_duplicates(chapters).items():
+            if indices is None or idx in indices or orig in indices:
+                flagged.setdefault(idx, f"与《{chapters[orig]['title']}》内容重复")
+
+        # 之前被标记、这次检查通过的章节，清除标记
+        for idx in (indices if indices is not None else range(len(chapters))):
+            ch = chapters[idx]
+            if idx not in flagged and ch.get('status') == 'success' and ch.get('quality'):
+                self.journal.record(ch, quality=None, quality_retry=None)
+
+        requeue = []
+        for idx in sorted(flagged):
+            ch = chapters[idx]
+            retries = ch.get('quality_retry') or 0
+            if retries >= MAX_QUALITY_RETRIES:
+                self.journal.record(ch, status='suspect', quality=flagged[idx])
+                print(f"  [存疑] {ch['title']}: {flagged[idx]} (已重下 {retries} 次，保留现有内容)")
+                continue
+            print(f"  [重下] {ch['title']}: {flagged[idx]}")
+            self.journal.record(ch, status='pending', quality=flagged[idx], quality_retry=retries + 1)
+            requeue.append(ch)
+        return requeue
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+书籍解析缓存：novels/books.json 记录 书籍ID -> 书名/文件夹/作者/链接。
+Step0 / Step1 成功后写入；主菜单对已知书籍直接查表锁定，不再为取书名启动浏览器。
+查不到时扫描一遍 novels 下已有的书籍文件夹 (book_info.json / catalog.json) 补全缓存。
+"""
+import os
+import re
+import time
+import threading
+from common import load_json, save_json
+
+REGISTRY_NAME = "books.json"
+
+_BOOK_ID = re.compile(r'/b/(\d+)')
+
+
+def book_id_from_url(url):
+    match = _BOOK_ID.search(url or '')
+    return match.group(1) if match else None
+
+
+class BookRegistry:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.path = os.path.join(base_path, REGISTRY_NAME)
+        self.books = (load_json(self.path) or {}).get('books', {})
+        self.lock = threading.Lock()
+        self._scanned = False
+
+    def _save(self):
+        os.makedirs(self.base_path, exist_ok=True)
+        save_json(self.path, {"books": self.books})
+
+    def remember(self, book_id, **fields):
+        """记录/更新一本书 (值为空的字段不覆盖已有记录)"""
+        if not book_id:
+            return
+        with self.lock:
+            entry = self.books.setdefault(str(book_id), {})
+            new = {k: v for k, v in fields.items() if v}
+            if all(entry.get(k) == v for k, v in new.items()):
+                return
+            entry.update(new, updated_at=time.time())
+            self._save()
+
+    def get(self, book_id):
+        """已知且本地文件夹仍存在时返回记录，否则 None"""
+        with self.lock:
+            entry = self.books.get(str(book_id))
+        if entry and entry.get('folder') and os.path.isdir(os.path.join(self.base_path, entry['folder'])):
+            return entry
+        return None
+
+    def resolve(self, url):
+        """链接 -> 书籍记录；缓存里没有时扫描一次已有文件夹再查"""
+        book_id = book_id_from_url(url)
+        if not book_id:
+            return None
+        entry = self.get(book_id)
+        if entry is None and not self._scanned:
+            self.scan()
+            entry = self.get(book_id)
+        return entry
+
+    def scan(self):
+        """从已有书籍文件夹补全缓存 (兼容引入缓存之前下载的书)"""
+        self._scanned = True
+        if not os.path.isdir(self.base_path):
+            return
+        known = {e.get('folder') for e in self.books.values()}
+        with os.scandir(self.base_path) as it:
+            folders = [e.name for e in it if e.is_dir() and not e.name.startswith('.') and e.name not in known]
+        found = {}
+        for folder in folders:
+            book_dir = os.path.join(self.base_path, folder)
+            info = load_json(os.path.join(book_dir, 'book_info.json')) or {}
+            book_id = info.get('book_id')
+            url = None
+            if not book_id:
+                catalog = load_json(os.path.join(book_dir, 'catalog.json')) or {}
+                url = catalog.get('url')
+                book_id = book_id_from_url(url)
+            if book_id and not self.get(book_id):
+                entry = {'title': info.get('title') or folder, 'folder': folder,
+                         'author': info.get('author'), 'url': url, 'updated_at': time.time()}
+                found[str(book_id)] = {k: v for k, v in entry.items() if v}
+        if found:
+            with self.lock:
+                self.books.update(found)
+                self._save()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_registry(base_path):
+    """同一存储目录在进程内共享一个缓存实例"""
+    key = os.path.abspath(base_path)
+    with _shared_lock:
+        registry = _shared.get(key)
+        if registry is None:
+            registry = _shared[key] = BookRegistry(base_path)
+        return registry
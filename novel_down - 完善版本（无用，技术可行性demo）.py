@@ -4,6 +4,7 @@ import os
 import time
 import re
 import random
+from module_filter import shared_filter
 
 class NovelDownloader:
     def __init__(self, target_url, base_save_path):
@@ -141,11 +142,7 @@ class NovelDownloader:
                 line = line.strip()
                 if line: lines.append(line)
 
-        clean_lines = []
-        for line in lines:
-            if any(ad in line for ad in ["UU看书", "uuks.org", "javascript", "请收藏", "本站"]):
-                continue
-            clean_lines.append(line)
+        clean_lines = shared_filter(self.base_save_path).filter_lines(lines)
         
         return '\n\n'.join(clean_lines)
 
@@ -1,19 +1,21 @@
 # -*- coding: utf-8 -*-
 import os
 import re
-from DrissionPage import ChromiumPage
 from common import save_json
 from module_metadata import MetadataFetcher
+from module_browser import shared_browser
+from module_registry import shared_registry
 
 class MetadataInteractive:
-    def __init__(self, base_path):
+    def __init__(self, base_path, interactive=True):
         self.base_path = base_path
         self.page = None
+        # 非交互模式 (批处理) 下直接存储采集到的信息
+        self.interactive = interactive
 
     def _init_browser(self):
         if not self.page:
-            print("[系统] 正在启动浏览器...")
-            self.page = ChromiumPage()
+            self.page = shared_browser().get_page()
 
     def _manual_modify(self, meta):
         """手动修改元数据 (包含封面)"""
@@ -85,7 +87,7 @@ class MetadataInteractive:
                 print(" [M] 修改 (Modify)")
                 print(" [Q] 放弃 (Quit)")
                 
-                choice = input("\n请输入指令 (s/m/q): ").strip().lower()
+                choice = input("\n请输入指令 (s/m/q): ").strip().lower() if self.interactive else 's'
 
                 if choice == 's':
                     # === 存储流程 ===
@@ -97,6 +99,8 @@ class MetadataInteractive:
                     info_path = os.path.join(book_dir, 'book_info.json')
                     save_json(info_path, meta)
                     print(f"[保存] 信息已写入: {info_path}")
+                    shared_registry(self.base_path).remember(
+                        book_id, title=meta['title'], folder=meta['title'], author=meta['author'], url=input_url)
 
                     # 下载封面 (使用确认后的 URL)
                     if meta['cover_url']:
@@ -123,6 +127,5 @@ class MetadataInteractive:
             traceback.print_exc()
             return None
         finally:
-            if self.page:
-                self.page.quit()
-                self.page = None
+            # 浏览器由共享服务管理，这里只释放引用
+            self.page = None
@@ -2,21 +2,41 @@
 import os
 import time
 import re
-from DrissionPage import ChromiumPage
-from common import save_json
+import json
+import hashlib
+from common import validate_filename, book_title_from_heading, SITE_PC_BASE, SITE_MOBILE_BASE
+from module_library import CatalogStore
+from module_extract import extract_catalog_links, extract_book_title, extract_heading
+from module_http import fetch_once, is_cloudflare_page
+from module_pacing import shared_controller, FAIL_CLOUDFLARE
+from module_cookies import shared_store, is_challenge_title, wait_for_clearance
+from module_browser import shared_browser
+from module_registry import shared_registry
+from module_archive import HtmlArchive
+from module_metrics import RunMetrics
 
 class CatalogManager:
-    def __init__(self, target_url, base_save_path):
+    def __init__(self, target_url, base_save_path, interactive=True):
         self.raw_input_url = target_url
         self.base_save_path = base_save_path
         self.page = None
+        # 非交互模式 (批处理) 下不询问范围，默认全部章节
+        self.interactive = interactive
+        # 与下载步骤共享的节奏控制器
+        self.pacer = shared_controller()
+        # 本地 Cloudflare 通行证
+        self.cookies = shared_store()
         # 提取 ID
         self.book_id = self._extract_book_id(target_url)
+        # 最近一次抓到的完整目录指纹 (用于增量更新时判断目录是否变化)
+        self.catalog_hash = None
+        # 本次运行的指标 (页面延迟、解析/写入耗时)，结束时导出
+        self.metrics = RunMetrics('catalog')
 
     def _init_browser(self):
         if not self.page:
-            print("[系统] 启动浏览器 (Step1-目录抓取)...")
-            self.page = ChromiumPage()
+            # 复用共享浏览器，不再每一步冷启动
+            self.page = shared_browser().get_page()
             self.page.set.timeouts(15)
 
     def _extract_book_id(self, url):
@@ -25,9 +45,22 @@ class CatalogManager:
         return None
 
     def _check_cloudflare(self):
-        if "Just a moment" in self.page.title or "验证" in self.page.title:
-            print("\n[注意] 触发 Cloudflare 盾，等待 10 秒自动验证...\n")
-            time.sleep(10)
+        if is_challenge_title(self.page.title):
+            self.pacer.on_failure(FAIL_CLOUDFLARE)
+            self.metrics.inc('cloudflare')
+            wait_for_clearance(self.page, self.cookies)
+            return True
+        return False
+
+    def _visit(self, url):
+        """打开页面并把延迟/盾反馈给节奏控制器"""
+        start = time.time()
+        self.page.get(url)
+        latency = time.time() - start
+        self.metrics.observe('fetch_seconds', latency, mode='browser')
+        self.pacer.pause() # 稍作等待确保加载，间隔随站点状态自适应
+        if not self._check_cloudflare():
+            self.pacer.on_success(latency)
 
     # ==========================================================
     #  核心逻辑 1: 仅获取书名 (用于确定存储路径)
@@ -36,24 +69,19 @@ class CatalogManager:
         """访问 PC 详情页，只为了提取书名"""
         if not self.book_id: return f"Book_Unknown"
 
-        pc_url = f"https://www.uuks.org/b/{self.book_id}/"
+        pc_url = f"{SITE_PC_BASE}/b/{self.book_id}/"
         print(f"[目录] 正在访问 PC 页获取书名: {pc_url}")
         
-        self.page.get(pc_url)
-        time.sleep(1.5) # 稍作等待确保加载
-        self._check_cloudflare()
+        self._visit(pc_url)
 
         title = f"Book_{self.book_id}" # 默认后备书名
 
         try:
             # 仅提取 H1 标签作为书名
             h1 = self.page.ele('tag:h1')
-            if h1:
-                raw = h1.text.strip()
-                # 去除可能的后缀 (如 "书名_作者_...")
-                if '_' in raw: raw = raw.split('_')[0]
-                # 清洗文件名非法字符
-                title = re.sub(r'[\\/:*?"<>|]', '_', raw).strip()
+            if h1 and book_title_from_heading(h1.text):
+                # 与 Step0 (MetadataFetcher) 同一规则，两步得到同一个文件夹名
+                title = book_title_from_heading(h1.text)
                 print(f"[成功] 识别书名: 《{title}》")
             else:
                 print(f"[警告] 未找到 H1 标签，使用默认目录名: {title}")
@@ -70,7 +98,7 @@ class CatalogManager:
         if not self.book_id: return mobile_url
         match = re.search(r'/(\d+\.html)', mobile_url)
         if match:
-            return f"https://www.uuks.org/b/{self.book_id}/{match.group(1)}"
+            return f"{SITE_PC_BASE}/b/{self.book_id}/{match.group(1)}"
         return mobile_url
 
     def _clean_chapter_title(self, text):
@@ -82,6 +110,9 @@ class CatalogManager:
     def _interactive_select(self, chapters):
         total = len(chapters)
         if total == 0: return []
+        if not self.interactive:
+            print(f"[系统] 非交互模式，选定全部 {total} 章")
+            return chapters
 
         print("\n" + "="*50)
         print("【 章节预览 & 范围选择 】")
@@ -123,40 +154,18 @@ class CatalogManager:
         print(f"[系统] 已选定范围: {start_idx} - {end_idx} (共 {end_idx - start_idx + 1} 章)")
         return chapters[start_idx-1 : end_idx]
 
-    def parse_mobile_catalog(self):
-        """跳转移动端抓取目录"""
-        url = f"https://m.uuks.org/b/{self.book_id}/all.html"
-        print(f"\n[策略] 跳转移动端全本页抓取目录: {url}")
-        
-        self.page.get(url)
-        time.sleep(1)
-        self._check_cloudflare()
-
-        # 寻找包含最多链接的容器
-        candidates = self.page.eles('tag:div') + self.page.eles('tag:ul')
-        best_container = None
-        max_count = 0
-        valid_kws = ["第", "章", "节", "回", "尾声"]
-
-        for ele in candidates:
-            links = ele.eles('tag:a')
-            if not links: continue
-            count = sum(1 for l in links if any(k in l.text for k in valid_kws) or l.text.strip().isdigit())
-            if count > max_count:
-                max_count = count
-                best_container = ele
-        
-        container = best_container if best_container else self.page
-        all_links = container.eles('tag:a')
-        
+    def _mobile_catalog_url(self):
+        return f"{SITE_MOBILE_BASE}/b/{self.book_id}/all.html"
+
+    def _build_chapter_list(self, links):
+        """把 [(文字, 链接), ...] 过滤、去重、转成 PC 端章节列表"""
         raw_list = []
         seen = set()
         trash = ["分卷阅读", "加入书架", "投推荐票", "直达底部", "返回顶部", "首页"] 
 
-        for link in all_links:
+        for t, u in links:
             try:
-                t = link.text.strip()
-                u = link.link
+                t = (t or "").strip()
                 if not u or "javascript" in u: continue
                 if any(k in t for k in trash): continue
 
@@ -169,18 +178,273 @@ class CatalogManager:
                 seen.add(pc_url)
                 raw_list.append({"title": clean_t, "url": pc_url, "status": "pending"})
             except: continue
-        
-        return self._interactive_select(raw_list)
+
+        # 目录指纹：只看 链接+标题，页面上的广告、时间变化不影响
+        digest_src = json.dumps([[c['url'], c['title']] for c in raw_list], ensure_ascii=False)
+        self.catalog_hash = hashlib.sha1(digest_src.encode('utf-8')).hexdigest()
+        return raw_list
+
+    def _load_mobile_catalog(self):
+        """打开移动端全本页，返回 (页面快照, 实际地址)"""
+        url = self._mobile_catalog_url()
+        print(f"\n[策略] 跳转移动端全本页抓取目录: {url}")
+        self._visit(url)
+        html = self.page.html
+        self.metrics.inc('bytes_in', len(html.encode('utf-8')))
+        return html, self.page.url or url
+
+    def _archive_catalog(self, book_dir, url, html):
+        """目录页的原始 HTML 也存一份 (与章节页同一个存档，见 module_archive)"""
+        archive = HtmlArchive(book_dir)
+        try:
+            archive.put(url, html)
+        except Exception as e:
+            print(f"[存档] 目录页存档失败: {e}")
+        finally:
+            archive.close()
+
+    def _title_from_catalog(self, html):
+        """
+        从目录页快照里直接取书名，省去单独访问 PC 详情页。
+        书名决定文件夹，必须与 Step0 一致：快照 <h1> 按 Step0 的规则 (book_title_from_heading) 取书名，
+        且与宽松规则 (extract_book_title，会去掉 "全集"、"｜..." 等后缀) 结果相同时才采用，否则返回 None 交给 PC 详情页。
+        """
+        title = book_title_from_heading(extract_heading(html))
+        # 取到的是站点名之类的东西时不可信，交给 PC 详情页
+        if not title or any(k in title for k in ("UU看书", "uuks", "目录")):
+            return None
+        if title != validate_filename(extract_book_title(html)):
+            print(f"[目录] 目录页书名 《{title}》 可能带有后缀，改从 PC 详情页确认")
+            return None
+        print(f"[成功] 识别书名: 《{title}》")
+        return title
+
+    def parse_mobile_catalog(self, snapshot=None):
+        """跳转移动端抓取目录 (snapshot 为已取得的 (快照, 地址) 时不再访问页面)"""
+        html, url = snapshot or self._load_mobile_catalog()
+
+        # 取一次页面快照，在本地用 lxml 找出章节链接最多的容器
+        # (逐个元素读取 text/link 每次都是一次 CDP 往返，几千章的目录要跑好几分钟)
+        start = time.time()
+        links = extract_catalog_links(html, url)
+        elapsed = time.time() - start
+        self.metrics.observe('parse_seconds', elapsed)
+        print(f"[目录] 解析出 {len(links)} 个链接，用时 {elapsed:.2f}s")
+
+        return self._interactive_select(self._build_chapter_list(links))
+
+    # ==========================================================
+    #  核心逻辑 3: 增量更新 (连载中的书籍)
+    # ==========================================================
+    def _fetch_catalog_conditional(self, data):
+        """
+        带 ETag/Last-Modified 的条件请求抓取移动端目录。
+        返回 (html, 响应头)；目录未变化 (304) 时 html 为 None。
+        HTTP 被 Cloudflare 拦截时改用浏览器 (不支持条件请求，靠目录指纹判断)。
+        """
+        url = self._mobile_catalog_url()
+        headers = self.cookies.http_headers(url)
+        if data.get('catalog_etag'):
+            headers['If-None-Match'] = data['catalog_etag']
+        if data.get('catalog_last_modified'):
+            headers['If-Modified-Since'] = data['catalog_last_modified']
+
+        start = time.time()
+        status, html, resp_headers = fetch_once(url, headers)
+        self.metrics.observe('fetch_seconds', time.time() - start, mode='http')
+        if status != 200:
+            self.metrics.inc('http_status', code=status)
+        if html:
+            self.metrics.inc('bytes_in', len(html.encode('utf-8')))
+        if status == 304:
+            self.pacer.on_success(time.time() - start)
+            return None, resp_headers
+        if status == 200 and not is_cloudflare_page(status, html):
+            self.pacer.on_success(time.time() - start)
+            return html, resp_headers
+
+        print(f"[增量] HTTP 请求未成功 (状态 {status})，改用浏览器...")
+        if is_cloudflare_page(status, html):
+            self.metrics.inc('cloudflare')
+        self._init_browser()
+        self._visit(url)
+        return self.page.html, {}
+
+    def _save(self, store, data):
+        """写 catalog.json (计入写入耗时)"""
+        with self.metrics.timer('write_seconds'):
+            store.save(data)
+
+    def _finish_metrics(self, book):
+        """打印并导出本次运行的指标"""
+        self.metrics.book = book
+        print(self.metrics.report())
+        self.metrics.export(self.base_save_path)
+
+    def _merge_catalog(self, data, fresh, book_dir):
+        """
+        以章节 URL 为键，把最新目录合并进已有目录：
+        - 末尾新增的章节直接追加，编号接在已有文件之后 (已有文件无需重命名)
+        - 中间插入的章节放到对应位置 (Step3 会按目录顺序重新编号)
+        - 网站上已删除的章节标记 removed，本地文件保留
+        - 改名的章节更新标题，并同步重命名本地文件
+        返回 (追加, 插入, 删除, 改名) 四个列表；新旧目录没有任何相同的 URL 时无法对齐，
+        不做任何修改，返回 None
+        """
+        old = data['chapters']
+        old_map = {ch['url']: ch for ch in old}
+        fresh_urls = {c['url'] for c in fresh}
+
+        # 用户当初选择的起始章节之前的内容，视为有意排除
+        first = next((i for i, c in enumerate(fresh) if c['url'] in old_map), None)
+        if first is None:
+            return None
+        fresh = fresh[first:]
+
+        last_known = max(i for i, c in enumerate(fresh) if c['url'] in old_map)
+        appended, inserted, removed, retitled = [], [], [], []
+        merged = []
+        for i, c in enumerate(fresh):
+            ch = old_map.get(c['url'])
+            if ch is None:
+                (appended if i > last_known else inserted).append(c)
+                merged.append(c)
+                continue
+            if ch.pop('removed', None):
+                print(f"  [恢复] {ch['title']}")
+            if ch['title'] != c['title']:
+                retitled.append((ch['title'], c['title']))
+                ch['title'] = c['title']
+                self._rename_chapter_file(book_dir, ch)
+            merged.append(ch)
+
+        # 已删除的章节留在原位置，保持编号稳定
+        for idx, ch in enumerate(old):
+            if ch['url'] not in fresh_urls:
+                if not ch.get('removed'):
+                    ch['removed'] = True
+                    removed.append(ch)
+                prev = old[idx - 1]['url'] if idx > 0 else None
+                pos = next((k + 1 for k, m in enumerate(merged) if m['url'] == prev), 0)
+                merged.insert(pos, ch)
+
+        # 新章节编号接在已有最大编号之后，不与现有文件冲突
+        numbers = [int(ch['file_name'].split('_', 1)[0]) for ch in merged
+                   if ch.get('file_name', '').split('_', 1)[0].isdigit()]
+        next_no = max(numbers, default=0) + 1
+        width = max(len(str(next_no + len(appended) + len(inserted))), 4)
+        for ch in merged:
+            if 'file_name' not in ch:
+                ch['file_name'] = f"{str(next_no).zfill(width)}_{validate_filename(ch['title'])}.txt"
+                next_no += 1
+        data['chapters'] = merged
+        return appended, inserted, removed, retitled
+
+    def _rename_chapter_file(self, book_dir, ch):
+        """章节改名：保留编号，替换标题部分"""
+        old_name = ch.get('file_name')
+        if not old_name or '_' not in old_name: return
+        new_name = f"{old_name.split('_', 1)[0]}_{validate_filename(ch['title'])}.txt"
+        ch['file_name'] = new_name
+        old_path = os.path.join(book_dir, old_name)
+        if os.path.exists(old_path):
+            try:
+                os.rename(old_path, os.path.join(book_dir, new_name))
+            except OSError as e:
+                print(f"  [重命名失败] {old_name} -> {new_name}: {e}")
+                ch['file_name'] = old_name
+
+    def update_incremental(self, book_folder):
+        """
+        增量更新已有目录：一次 (条件) 请求，目录没变化就直接返回；
+        有变化时只追加新章节，不重新选择范围、不重排已有文件名。
+        返回 (书名, json路径)，与 update_catalog 一致。
+        """
+        store = CatalogStore(self.base_save_path, book_folder)
+        if not store.exists():
+            print("[增量] 尚无目录文件，转为完整抓取。")
+            return self.update_catalog()
+
+        data = store.load()
+        if not self.book_id:
+            self.book_id = self._extract_book_id(data.get('url', ''))
+        shared_registry(self.base_save_path).remember(
+            self.book_id, title=data.get('title') or book_folder, folder=book_folder, url=data.get('url'))
+        print(f"[增量] 检查目录更新: 《{book_folder}》")
+
+        try:
+            html, headers = self._fetch_catalog_conditional(data)
+            validators = {k: headers.get(h) for k, h in
+                          (('catalog_etag', 'ETag'), ('catalog_last_modified', 'Last-Modified')) if headers.get(h)}
+            if html is None:
+                print("[增量] 目录未变化 (304)，无需更新。")
+                return book_folder, store.json_path
+
+            self._archive_catalog(store.book_dir, self._mobile_catalog_url(), html)
+            with self.metrics.timer('parse_seconds'):
+                fresh = self._build_chapter_list(extract_catalog_links(html, self._mobile_catalog_url()))
+            if not fresh:
+                print("[增量] 未解析到任何章节，保留原目录。")
+                return None, None
+            if self.catalog_hash == data.get('catalog_hash'):
+                print("[增量] 目录内容未变化，无需更新。")
+                if validators and any(data.get(k) != v for k, v in validators.items()):
+                    data.update(validators)
+                    self._save(store, data)
+                return book_folder, store.json_path
+
+            merged = self._merge_catalog(data, fresh, store.book_dir)
+            if merged is None:
+                # 不保存新的指纹和 ETag，否则之后的 "目录未变化" 判断会把新章节永远挡在外面
+                print("[增量] 新目录与已有目录没有任何相同的章节链接 (网站可能改了链接格式)，未做修改。")
+                print("[增量] 请检查书籍链接；确认无误后可删除 catalog.json 重新完整抓取目录。")
+                return None, None
+            appended, inserted, removed, retitled = merged
+            data['catalog_hash'] = self.catalog_hash
+            data.update(validators)
+            self._save(store, data)
+
+            print("-" * 50)
+            print(f"[增量] 新增 {len(appended)} 章 / 插入 {len(inserted)} 章 / 删除 {len(removed)} 章 / 改名 {len(retitled)} 章")
+            for c in appended[:10]:
+                print(f"  [新增] {c['title']}")
+            if len(appended) > 10:
+                print(f"  ... 另有 {len(appended) - 10} 章")
+            for c in inserted:
+                print(f"  [插入] {c['title']} (编号将由 Step3 重新整理)")
+            for c in removed:
+                print(f"  [删除] {c['title']} (本地文件保留)")
+            for old_t, new_t in retitled:
+                print(f"  [改名] {old_t} -> {new_t}")
+            print(f"[完成] 目录已更新: {store.json_path}")
+            return book_folder, store.json_path
+
+        except Exception as e:
+            print(f"[异常] {e}")
+            import traceback
+            traceback.print_exc()
+            return None, None
+        finally:
+            self.page = None
+            self._finish_metrics(book_folder)
 
     # ==========================================================
     #  主程序入口
     # ==========================================================
     def update_catalog(self):
         self._init_browser()
+        book_title = None
         
         try:
-            # 1. 仅获取书名
-            book_title = self._fetch_book_title()
+            # 1. 书名：已知书籍沿用原文件夹 (包括 Step0 建好但还没登记的)；否则优先从目录页本身提取 (一次访问同时拿到书名和目录)
+            registry = shared_registry(self.base_save_path)
+            known = registry.resolve(self.raw_input_url)
+            snapshot = self._load_mobile_catalog()
+            if known:
+                book_title = known['folder']
+                print(f"[系统] 已知书籍: 《{book_title}》")
+            else:
+                book_title = self._title_from_catalog(snapshot[0]) or self._fetch_book_title()
             
             # 2. 创建目录 (如果 Step0 已创建，这里是用来确认路径)
             novel_dir = os.path.join(self.base_save_path, book_title)
@@ -191,9 +455,10 @@ class CatalogManager:
                 print(f"[系统] 目标目录已存在: {novel_dir}")
             
             # (注意：此处不再保存 book_info.json 和 cover.jpg)
+            self._archive_catalog(novel_dir, self._mobile_catalog_url(), snapshot[0])
             
-            # 3. 抓取目录
-            chapters = self.parse_mobile_catalog()
+            # 3. 解析目录 (使用第 1 步取得的快照)
+            chapters = self.parse_mobile_catalog(snapshot)
             
             if not chapters:
                 print("[取消] 未选择任何章节或抓取失败。")
@@ -206,14 +471,17 @@ class CatalogManager:
                 # 预生成文件名，供 Step2 下载使用
                 ch['file_name'] = f"{str(idx+1).zfill(width)}_{ch['title']}.txt"
 
-            # 5. 保存目录文件 (catalog.json)
-            json_path = os.path.join(novel_dir, 'catalog.json')
+            # 5. 保存目录文件 (catalog.json，启用书库时同步写入)
+            store = CatalogStore(self.base_save_path, book_title)
+            json_path = store.json_path
             data = {
                 "title": book_title,
                 "url": self.raw_input_url,
-                "chapters": chapters
+                "chapters": chapters,
+                "catalog_hash": self.catalog_hash
             }
-            save_json(json_path, data)
+            self._save(store, data)
+            registry.remember(self.book_id, title=book_title, folder=book_title, url=self.raw_input_url)
             
             print(f"[完成] 目录文件已生成: {json_path}")
             return book_title, json_path
@@ -224,6 +492,6 @@ class CatalogManager:
             traceback.print_exc()
             return None, None
         finally:
-            if self.page:
-                self.page.quit()
-                self.page = None
+            # 浏览器由共享服务管理，这里只释放引用
+            self.page = None
+            self._finish_metrics(book_title)
@@ -1,9 +1,22 @@
 # -*- coding: utf-8 -*-
 import os
 import time
-import random
-from DrissionPage import ChromiumPage
-from common import load_json, save_json
+import threading
+from queue import Queue, Empty
+from DrissionPage import ChromiumPage, ChromiumOptions
+from module_library import CatalogStore
+from module_http import AsyncHttpFetcher, RESULT_OK, RESULT_RETRY
+from module_pacing import shared_controller, FAIL_CLOUDFLARE, FAIL_EMPTY, FAIL_ERROR
+from module_cookies import shared_store, is_challenge_title, wait_for_clearance
+from module_browser import shared_browser
+from module_extract import ContentExtractor
+from module_manifest import ChapterManifest
+from module_quality import QualityChecker, placeholder_reason
+from module_filter import shared_filter, clean_text
+from module_archive import HtmlArchive
+from module_metrics import RunMetrics
+from module_events import (shared_events, STAGE_STARTED, STAGE_DONE, CHAPTER_STARTED, CHAPTER_DONE,
+                           RETRY, CF_CHALLENGE)
 
 # 尝试引入整理模块，兼容 step3_clean.py
 try:
@@ -12,84 +25,343 @@ except ImportError:
     print("[警告] 未找到 step3_clean.py，将跳过自动整理步骤。")
     FileOrganizer = None
 
+# 下载模式
+MODE_BROWSER = 'browser'  # 单标签页浏览器逐章抓取 (兼容性最好)
+MODE_HTTP = 'http'        # aiohttp 并发直连，仅在遇到 Cloudflare 时回退浏览器
+MODE_POOL = 'pool'        # 多标签页 (或多浏览器实例) 并行抓取
+
 class BatchDownloader:
-    def __init__(self, base_save_path):
+    def __init__(self, base_save_path, mode=MODE_BROWSER, concurrency=8, pool_browsers=False, archive=True):
         self.base_save_path = base_save_path
+        self.mode = mode
+        self.concurrency = concurrency
+        # 浏览器池模式下：False = 同一浏览器开多个标签页，True = 启动多个独立浏览器
+        self.pool_browsers = pool_browsers
         self.page = None
+        # 自适应节奏控制 (与目录抓取共享同一个实例)
+        self.pacer = shared_controller()
+        # 本地 Cloudflare 通行证 (浏览器与 HTTP 客户端共用)
+        self.cookies = shared_store()
+        # 正文提取器 (会记住对本书有效的选择器)
+        self.extractor = ContentExtractor()
+        self.journal = None
+        self.manifest = None
+        # 是否保存原始 HTML 存档 (供离线重解析，见 module_archive)
+        self.archive_enabled = archive
+        self.archive = None
+        # 本次运行的指标 (抓取延迟、解析/写入耗时、流量、重试)，run() 结束时导出
+        self.metrics = RunMetrics('download')
+        # 进度事件 (见 module_events)，run() 里绑定书名
+        self.events = shared_events().scope('download')
 
     def _init_browser(self):
         """懒加载浏览器"""
         if not self.page:
-            print("[系统] 正在启动浏览器引擎...")
             try:
-                self.page = ChromiumPage()
+                self.page = shared_browser().get_page()
                 # 设置超时防止卡死
                 self.page.set.timeouts(10)
             except Exception as e:
                 print(f"[错误] 浏览器启动失败: {e}")
 
     def close_browser(self):
-        if self.page:
-            self.page.quit()
-            self.page = None
+        """释放浏览器引用 (共享浏览器由 main 在退出时统一关闭)"""
+        self.page = None
 
-    def parse_content(self, url):
-        """智能解析正文"""
-        if not self.page: return None
+    def parse_content(self, url, page=None):
+        """浏览器模式：打开页面后取一次 HTML 快照，在本地解析正文 (page 为空时使用主标签页)"""
+        page = page or self.page
+        if not page: return None
         try:
-            self.page.get(url)
-            
-            # 1. 尝试常见的小说正文ID/Class
-            selectors = ['#contentbox', '.contentbox', '#content', '.content', '.read-content', '#chaptercontent']
-            content_ele = None
-            for sel in selectors:
-                if self.page.ele(sel):
-                    ele = self.page.ele(sel)
-                    if len(ele.text) > 50:
-                        content_ele = ele
-                        break
-            
-            # 2. 兜底：找字数最多的 div
-            if not content_ele:
-                divs = self.page.eles('tag:div')
-                # 过滤掉链接太多的导航栏
-                candidates = [d for d in divs if len(d.eles('tag:a')) < 10]
-                if candidates:
-                    content_ele = max(candidates, key=lambda x: len(x.text))
-
-            if not content_ele: return None
-
-            # 3. 提取并清洗
-            # 优先提取 p 标签，如果没有则按行分割
-            p_tags = content_ele.eles('tag:p')
-            if p_tags:
-                lines = [p.text.strip() for p in p_tags if p.text.strip()]
+            start = time.time()
+            page.get(url)
+            latency = time.time() - start
+            self.metrics.observe('fetch_seconds', latency, mode='browser')
+            if is_challenge_title(page.title):
+                self.pacer.on_failure(FAIL_CLOUDFLARE)
+                self.metrics.inc('cloudflare')
+                self.events.emit(CF_CHALLENGE, url=url)
+                # 通过后通行证写入本地仓库，后续步骤和 HTTP 模式直接复用
+                if not wait_for_clearance(page, self.cookies):
+                    return None
+            html = page.html
+            self.metrics.inc('bytes_in', len(html.encode('utf-8')))
+            self._archive_page(url, html)
+            content = self.extract_content(html)
+            if content:
+                self.pacer.on_success(latency)
             else:
-                lines = [line.strip() for line in content_ele.text.split('\n') if line.strip()]
-
-            clean_lines = []
-            # 广告词过滤
-            ad_keywords = ["UU看书", "uuks.org", "javascript", "请收藏", "本站", "APP", "http"]
-            for line in lines:
-                if not any(ad in line for ad in ad_keywords):
-                    clean_lines.append(line)
-            
-            return '\n\n'.join(clean_lines)
+                self.pacer.on_failure(FAIL_EMPTY)
+            return content
+        except Exception as e:
+            print(f"[解析异常] {e}")
+            self.pacer.on_failure(FAIL_ERROR)
+            self.metrics.inc('failures', kind='error')
+            return None
 
+    def parse_html(self, html, url=None):
+        """HTTP 模式：直接解析原始 HTML"""
+        if not html: return None
+        self.metrics.inc('bytes_in', len(html.encode('utf-8')))
+        self._archive_page(url, html)
+        try:
+            return self.extract_content(html)
         except Exception as e:
             print(f"[解析异常] {e}")
             return None
 
+    def _archive_page(self, url, html):
+        """原始 HTML 存一份 (存档出错不影响下载)"""
+        if self.archive is None or not url:
+            return
+        try:
+            self.archive.put(url, html)
+        except Exception as e:
+            print(f"[存档] 写入失败，本次不再存档: {e}")
+            self.archive = None
+
+    def extract_content(self, html):
+        """从 HTML 快照中提取正文并过滤广告"""
+        with self.metrics.timer('parse_seconds'):
+            lines = self.extractor.extract_lines(html)
+            if not lines:
+                self.metrics.inc('failures', kind='empty')
+                return None
+
+            # 广告词过滤 (规则见 ad_rules.txt，所有规则编译成一个正则，每行扫描一次)
+            clean_lines = shared_filter(self.base_save_path).filter_lines(lines)
+
+            text = '\n\n'.join(clean_lines)
+            # "正在手打中" 之类的占位页不算成功，留给重试
+            reason = placeholder_reason(text)
+        if reason:
+            print(f"  [占位页] {reason}")
+            self.metrics.inc('failures', kind='placeholder')
+            return None
+        return text
+
+    def _chapter_done(self, ch, ok, seconds=None):
+        self.events.emit(CHAPTER_DONE, chapter=ch['file_name'], url=ch['url'], ok=ok,
+                         size=self.manifest.size(ch['file_name']) if ok else 0,
+                         seconds=round(seconds, 3) if seconds is not None else None)
+
+    def _save_chapter(self, novel_dir, ch, content):
+        file_path = os.path.join(novel_dir, ch['file_name'])
+        with self.metrics.timer('write_seconds'):
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        self.manifest.record(ch['file_name'])
+        self.metrics.inc('bytes_out', self.manifest.size(ch['file_name']))
+        self.journal.record(ch, status='success', size=self.manifest.size(ch['file_name']))
+
+    def _fetch_with_retry(self, url, page=None):
+        content = None
+        # 重试机制 (等待时间由节奏控制器决定，站点吃力时自动拉长)
+        for retry in range(3):
+            content = self.parse_content(url, page)
+            if content: break
+            if retry < 2:
+                self.metrics.inc('retries')
+                self.events.emit(RETRY, url=url, attempt=retry + 1)
+            self.pacer.retry_wait(retry)
+        return content
+
+    def _commit(self, novel_dir, ch, content, seconds=None):
+        if content:
+            self._save_chapter(novel_dir, ch, content)
+        else:
+            print(f"  -> 失败: 无法提取内容")
+            self.journal.record(ch, status='failed')
+        self._chapter_done(ch, bool(content), seconds)
+
+    def _fetch_timed(self, ch, index, page=None):
+        """浏览器抓取一章 (带重试)，返回 (正文, 用时)"""
+        self.events.emit(CHAPTER_STARTED, chapter=ch['file_name'], url=ch['url'], index=index)
+        start = time.time()
+        content = self._fetch_with_retry(ch['url'], page)
+        return content, time.time() - start
+
+    def _download_browser(self, queue, novel_dir):
+        """浏览器模式：单标签页逐章抓取"""
+        self._init_browser()
+        total = len(queue)
+
+        # 共享标签页同一时间只给一个任务使用 (批处理模式下可能有多本书同时回退到浏览器)
+        with shared_browser().exclusive():
+            for i, ch in enumerate(queue, 1):
+                print(f"[{i}/{total}] 下载: {ch['file_name']}")
+                content, seconds = self._fetch_timed(ch, i - 1)
+                self._commit(novel_dir, ch, content, seconds)
+                self.pacer.pause()
+
+    def _open_pool(self, size):
+        """打开 size 个工作页面，第一个复用主标签页"""
+        self._init_browser()
+        pages = [self.page]
+        for _ in range(size - 1):
+            try:
+                if self.pool_browsers:
+                    co = ChromiumOptions().auto_port()
+                    extra = ChromiumPage(co)
+                    extra.set.timeouts(10)
+                    self.cookies.apply_to_page(extra)
+                    pages.append(extra)
+                else:
+                    pages.append(self.page.new_tab())
+            except Exception as e:
+                print(f"[警告] 打开工作页面失败: {e}")
+                break
+        return pages
+
+    def _close_pool(self, pages):
+        for page in pages[1:]:
+            try:
+                if self.pool_browsers:
+                    page.quit()
+                else:
+                    page.close()
+            except Exception:
+                pass
+
+    def _download_pool(self, queue, novel_dir):
+        """浏览器池模式：多个页面并行抓取，结果按目录顺序落盘"""
+        pages = self._open_pool(max(1, int(self.concurrency)))
+        kind = "浏览器" if self.pool_browsers else "标签页"
+        print(f"[浏览器池] 已就绪 {len(pages)} 个{kind}")
+
+        tasks = Queue()
+        for idx, ch in enumerate(queue):
+            tasks.put((idx, ch))
+        results = Queue()
+        stop = threading.Event()
+
+        def work(page):
+            # 哪个页面空闲，就从队列里领下一章
+            while not stop.is_set():
+                try:
+                    idx, ch = tasks.get_nowait()
+                except Empty:
+                    return
+                # 页面数是上限，实际同时工作的页面数由节奏控制器决定
+                with self.pacer.slot():
+                    fetched = self._fetch_timed(ch, idx, page)
+                results.put((idx, fetched))
+                self.pacer.pause()
+
+        threads = [threading.Thread(target=work, args=(p,), daemon=True) for p in pages]
+        for t in threads:
+            t.start()
+
+        # 主线程按目录顺序写入：先到的结果暂存，直到前面的章节都完成
+        total = len(queue)
+        buffered = {}
+        next_idx = 0
+        try:
+            while next_idx < total:
+                try:
+                    idx, fetched = results.get(timeout=1)
+                except Empty:
+                    if not any(t.is_alive() for t in threads) and results.empty():
+                        break
+                    continue
+                buffered[idx] = fetched
+                while next_idx in buffered:
+                    ch = queue[next_idx]
+                    print(f"[{next_idx + 1}/{total}] 下载: {ch['file_name']}")
+                    self._commit(novel_dir, ch, *buffered.pop(next_idx))
+                    next_idx += 1
+        finally:
+            stop.set()
+            # 中断时把已拿到的内容也落盘，避免白跑
+            for idx in sorted(buffered):
+                content, seconds = buffered[idx]
+                if content:
+                    self._save_chapter(novel_dir, queue[idx], content)
+                    self._chapter_done(queue[idx], True, seconds)
+            for t in threads:
+                t.join(timeout=15)
+            self._close_pool(pages)
+
+    def _download_http(self, queue, novel_dir):
+        """HTTP 模式：并发直连抓取，被 Cloudflare 拦截的章节交给浏览器"""
+        total = len(queue)
+        done = [0]
+        index = {id(ch): i for i, ch in enumerate(queue)}
+        started = {}
+
+        def attempt(ch, retry):
+            if retry == 0:
+                started[id(ch)] = time.time()
+                self.events.emit(CHAPTER_STARTED, chapter=ch['file_name'], url=ch['url'], index=index[id(ch)])
+            else:
+                self.events.emit(RETRY, url=ch['url'], attempt=retry)
+
+        def handle(ch, html):
+            content = self.parse_html(html, ch['url'])
+            if not content:
+                return RESULT_RETRY
+            self._save_chapter(novel_dir, ch, content)
+            self._chapter_done(ch, True, time.time() - started.pop(id(ch), time.time()))
+            done[0] += 1
+            print(f"[{done[0]}/{total}] 完成: {ch['file_name']}")
+            return RESULT_OK
+
+        def fetch(items):
+            # 每轮都重新读取本地通行证 (可能刚被浏览器或其他进程更新)
+            headers = self.cookies.http_headers(items[0]['url'])
+            fetcher = AsyncHttpFetcher(concurrency=self.concurrency, headers=headers, controller=self.pacer,
+                                       metrics=self.metrics)
+            print(f"[HTTP] 并发上限: {fetcher.concurrency}" + (" (已携带通行证)" if 'Cookie' in headers else ""))
+            blocked, failed = fetcher.fetch_all([(ch, ch['url']) for ch in items], handle, attempt)
+            for ch in failed:
+                print(f"  -> 失败: 无法提取内容 {ch['file_name']}")
+                self.journal.record(ch, status='failed')
+                self._chapter_done(ch, False, time.time() - started.pop(id(ch), time.time()))
+            # 被拦截的章节交给浏览器重新开始，计时作废
+            for ch in blocked:
+                started.pop(id(ch), None)
+                self.events.emit(CF_CHALLENGE, url=ch['url'])
+            return blocked
+
+        blocked = fetch(queue)
+        if blocked:
+            # 先用浏览器过一次盾拿到通行证，再带着它回到 HTTP 模式
+            print(f"\n[Cloudflare] {len(blocked)} 章被拦截，使用浏览器获取通行证...")
+            self._download_browser(blocked[:1], novel_dir)
+            blocked = blocked[1:]
+            if blocked and self.cookies.has_clearance():
+                blocked = fetch(blocked)
+        if blocked:
+            print(f"\n[Cloudflare] 仍有 {len(blocked)} 章被拦截，改用浏览器抓取...")
+            self._download_browser(blocked, novel_dir)
+
+    def _stage_done(self, stage, start, queue):
+        success = sum(1 for ch in queue if ch['status'] == 'success')
+        self.events.emit(STAGE_DONE, stage=stage, total=len(queue), success=success,
+                         failed=len(queue) - success, seconds=round(time.time() - start, 3))
+
+    def _download(self, queue, novel_dir):
+        if self.mode == MODE_HTTP:
+            self._download_http(queue, novel_dir)
+        elif self.mode == MODE_POOL:
+            self._download_pool(queue, novel_dir)
+        else:
+            self._download_browser(queue, novel_dir)
+
     def run(self, specific_book=None):
-        """主入口"""
+        """
+        主入口。返回 {"success": 本次成功, "failed": 本次失败, "remaining": 目录中仍未下载成功的章节数}，
+        找不到目录时返回 None。
+        """
         if not specific_book:
             print("[错误] 未指定书籍。")
             return
 
-        novel_dir = os.path.join(self.base_save_path, specific_book)
-        json_path = os.path.join(novel_dir, 'catalog.json')
+        store = CatalogStore(self.base_save_path, specific_book)
+        novel_dir = store.book_dir
+        json_path = store.json_path
 
-        if not os.path.exists(json_path):
+        if not store.exists():
             print(f"[错误] 找不到目录文件: {json_path}")
             return
 
@@ -100,69 +372,195 @@ class BatchDownloader:
                 print("[前置] 正在检查本地文件序号...")
                 # 实例化并调用 run()，保持接口统一
                 organizer = FileOrganizer(self.base_save_path)
-                organizer.run(specific_book)
+                organizer.run(specific_book, content=False)
                 print("="*40 + "\n")
             except Exception as e:
                 print(f"[警告] 自动整理失败: {e}")
 
         # === 阶段一：准备任务 ===
-        data = load_json(json_path)
+        self.metrics = metrics = RunMetrics('download', specific_book)
+        self.events = events = shared_events().scope('download', specific_book)
+        stage_start = time.time()
+        data = store.load()
         chapters = data['chapters']
-        
+        events.emit(STAGE_STARTED, stage='scan', total=len(chapters))
+        # 上次学到的正文选择器，直接沿用
+        self.extractor.selector = data.get('content_selector')
+        # 进度写入追加日志，不再反复重写整个 catalog.json (启用书库时同步写入)
+        self.journal = store.journal(data)
+
         download_queue = []
         print(f"[检查] 扫描 {len(chapters)} 个章节...")
-        
+        # 一次 scandir 得到全部文件大小 (与 Step3 共享，目录没变化时直接用缓存)
+        self.manifest = ChapterManifest.for_book(self.base_save_path, specific_book)
+
         for ch in chapters:
-            file_path = os.path.join(novel_dir, ch['file_name'])
             # 如果文件存在且有内容，标记成功
-            if os.path.exists(file_path) and os.path.getsize(file_path) > 300:
-                ch['status'] = 'success'
-            else:
-                ch['status'] = 'pending'
+            status = 'success' if self.manifest.size(ch['file_name']) > 300 else 'pending'
+            # 质量检查标记过的章节 (占位页/重复/存疑) 保持原状态，不被文件大小覆盖
+            if status == 'success' and ch.get('quality') and ch.get('status') in ('pending', 'suspect'):
+                status = ch['status']
+            # 网站上已删除的章节 (增量更新标记)，本地没有就不再下载
+            if status == 'pending' and ch.get('removed'):
+                continue
+            if status == 'pending':
                 download_queue.append(ch)
+            # 只记录真正发生变化的状态
+            if ch.get('status') != status:
+                self.journal.record(ch, status=status)
+
+        # 内容质量：占位页、跨章节重复的内容重新排队 (文件未变化的章节只比对记录的哈希)
+        checker = QualityChecker(self.manifest, self.journal)
+        flagged = checker.scan(chapters)
+        if flagged:
+            print(f"[质检] {len(flagged)} 章内容异常，重新下载")
+            queued = {id(ch) for ch in download_queue}
+            download_queue.extend(ch for ch in flagged if id(ch) not in queued)
+        metrics.add_stage('scan', time.time() - stage_start)
+        events.emit(STAGE_DONE, stage='scan', total=len(chapters), queued=len(download_queue),
+                    seconds=round(time.time() - stage_start, 3))
 
-        save_json(json_path, data)
-        
         if not download_queue:
+            if self.journal.pending:
+                self.journal.compact()
+            self.manifest.save()
             print("[恭喜] 所有章节已存在，无需下载。")
-            return
+            return {"success": 0, "failed": 0, "remaining": 0}
 
         # === 阶段二：开始下载 ===
         print(f"[开始] 待下载: {len(download_queue)} 章")
-        self._init_browser()
-        
-        success_count = 0
+        if self.mode == MODE_HTTP and not AsyncHttpFetcher.available():
+            print("[警告] 未安装 aiohttp，回退到浏览器模式。")
+            self.mode = MODE_BROWSER
+
         total = len(download_queue)
-        
+        # 浏览器模式本来就逐章串行 (共享标签页独占)，不去改动共享节奏控制器的上限，
+        # 否则批处理里一本书回退到浏览器就会把所有书的总并发压到 1
+        if self.mode != MODE_BROWSER:
+            self.pacer.set_max_limit(int(self.concurrency))
+        if self.archive_enabled:
+            self.archive = HtmlArchive(novel_dir)
+
+        stage, stage_start, stage_queue = 'download', time.time(), download_queue
+        events.emit(STAGE_STARTED, stage=stage, total=total, mode=self.mode)
         try:
-            for i, ch in enumerate(download_queue, 1):
-                print(f"[{i}/{total}] 下载: {ch['file_name']}")
-                
-                content = None
-                # 重试机制
-                for retry in range(3):
-                    content = self.parse_content(ch['url'])
-                    if content: break
-                    time.sleep(1)
-                
-                if content:
-                    file_path = os.path.join(novel_dir, ch['file_name'])
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(content)
-                    ch['status'] = 'success'
-                    success_count += 1
-                else:
-                    print(f"  -> 失败: 无法提取内容")
-                    ch['status'] = 'failed'
-                
-                if i % 10 == 0: save_json(json_path, data)
-                time.sleep(random.uniform(0.2, 0.5))
+            self._download(download_queue, novel_dir)
+            metrics.add_stage(stage, time.time() - stage_start)
+            self._stage_done(stage, stage_start, stage_queue)
+            stage, stage_start, stage_queue = 'recheck', time.time(), []
+            # 新下载的内容再检查一遍 (和其他章节重复的，自动再下一轮)
+            positions = {id(ch): i for i, ch in enumerate(chapters)}
+            flagged = checker.scan(chapters, {positions[id(ch)] for ch in download_queue if ch['status'] == 'success'})
+            if flagged:
+                print(f"\n[质检] {len(flagged)} 章下载后仍有异常，再试一轮...")
+                stage_queue = flagged
+                events.emit(STAGE_STARTED, stage=stage, total=len(flagged), mode=self.mode)
+                self._download(flagged, novel_dir)
+                checker.scan(chapters, {positions[id(ch)] for ch in flagged if ch['status'] == 'success'})
 
         except KeyboardInterrupt:
             print("\n[停止] 用户手动中断。")
         except Exception as e:
             print(f"\n[出错] {e}")
         finally:
-            save_json(json_path, data)
+            if self.extractor.selector:
+                data['content_selector'] = self.extractor.selector
+            # 结束时合并为一次完整快照
+            self.journal.compact()
+            self.manifest.save()
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+            success_count = sum(1 for ch in download_queue if ch['status'] == 'success')
+            metrics.add_stage(stage, time.time() - stage_start)
+            self._stage_done(stage, stage_start, stage_queue)
+            # 进度行先打印完，再输出报告
+            events.bus.flush()
+            metrics.inc('chapters', success_count, status='success')
+            metrics.inc('chapters', total - success_count, status='failed')
             print(f"\n[报告] 成功: {success_count} / 失败: {total - success_count}")
-            # self.close_browser() # 可选：任务结束后关闭浏览器
+            print(self.pacer.report())
+            print(metrics.report())
+            metrics.export(self.base_save_path)
+            self.close_browser()
+
+        remaining = sum(1 for ch in chapters if ch.get('status') in ('pending', 'failed') and not ch.get('removed'))
+        return {"success": success_count, "failed": total - success_count, "remaining": remaining}
+
+    # ==========================================
+    # 离线重解析
+    # ==========================================
+    def reparse(self, specific_book=None):
+        """
+        不联网：用下载时存档的原始 HTML，按当前的提取逻辑和广告规则重新生成章节文件。
+        提取结果再经过 Step3 同样的清洗 (clean_text)，与已清洗过的文件比较、写出的也是清洗后的正文，
+        并记下清洗指纹，Step3 不必再处理。内容没有变化的章节不重写；存档里没有的章节保持原样。
+        """
+        if not specific_book:
+            print("[错误] 未指定书籍。")
+            return
+
+        store = CatalogStore(self.base_save_path, specific_book)
+        if not store.exists():
+            print(f"[错误] 找不到目录文件: {store.json_path}")
+            return
+        archive = HtmlArchive(store.book_dir)
+        if not len(archive):
+            print("[重解析] 本书没有原始网页存档 (下载时会自动存档，之前下载的章节没有)。")
+            return
+
+        data = store.load()
+        chapters = data['chapters']
+        self.journal = store.journal(data)
+        self.manifest = ChapterManifest.for_book(self.base_save_path, specific_book)
+        # 提取逻辑可能已经改过，正文选择器重新学习
+        self.extractor.selector = None
+        ad_filter = shared_filter(self.base_save_path)
+
+        print(f"[重解析] 存档中有 {len(archive)} 个页面，开始处理 {len(chapters)} 章...")
+        start = time.time()
+        changed, same, failed, missing = [], 0, 0, 0
+        try:
+            for idx, ch in enumerate(chapters):
+                html = archive.get(ch['url'])
+                if html is None:
+                    missing += 1
+                    continue
+                content = self.extract_content(html)
+                if content:
+                    content = clean_text(ad_filter, ch['title'], content)
+                if not content:
+                    failed += 1
+                    print(f"  [提取失败] {ch['title']} (保留原文件)")
+                    continue
+                name = ch['file_name']
+                unchanged = False
+                if self.manifest.exists(name):
+                    with open(os.path.join(store.book_dir, name), 'r', encoding='utf-8', errors='replace') as f:
+                        unchanged = f.read() == content
+                if unchanged:
+                    same += 1
+                else:
+                    self._save_chapter(store.book_dir, ch, content)
+                    changed.append(idx)
+                # 写出的就是按当前规则清洗后的正文 (与 Step3 的 clean 记录同一格式)
+                clean = f"{ad_filter.signature}:{self.manifest.hash(name)}"
+                if ch.get('clean') != clean:
+                    self.journal.record(ch, clean=clean)
+
+            # 改写过的章节更新指纹，顺便检查重复/占位 (有问题的留给下次下载)
+            if changed:
+                flagged = QualityChecker(self.manifest, self.journal).scan(chapters, set(changed))
+                if flagged:
+                    print(f"[质检] {len(flagged)} 章内容异常，已标记为待下载")
+        finally:
+            if self.extractor.selector:
+                data['content_selector'] = self.extractor.selector
+            self.journal.compact()
+            self.manifest.save()
+            archive.close()
+
+        elapsed = max(time.time() - start, 1e-6)
+        done = len(changed) + same + failed
+        print(f"[重解析完成] 改写 {len(changed)} 章，未变化 {same} 章，提取失败 {failed} 章，无存档 {missing} 章；"
+              f"用时 {elapsed:.1f}s ({done / elapsed:.0f} 章/秒)")
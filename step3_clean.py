@@ -1,33 +1,54 @@
 # -*- coding: utf-8 -*-
 import os
-from common import load_json, save_json, validate_filename
+import time
+from common import validate_filename
+from module_filter import shared_filter, clean_chapter_files
+from module_library import CatalogStore
+from module_manifest import ChapterManifest
+from module_pool import worker_count, ordered_map
+from module_events import shared_events, STAGE_STARTED, STAGE_DONE, CHAPTER_DONE
+
+# 每个进程池任务处理的章节数；章节很少时不启动进程池
+CLEAN_BATCH = 32
+PARALLEL_MIN_CHAPTERS = 128
 
 class TextCleaner:
-    def __init__(self, base_path):
+    def __init__(self, base_path, workers=None):
         self.base_path = base_path
+        # 清洗正文用的进程数 (None 表示按 CPU 核数)
+        self.workers = workers
+        # 进度事件 (见 module_events)
+        self.events = shared_events().scope('clean')
 
-    def run(self, specific_book=None):
+    def run(self, specific_book=None, content=True):
         """
         修复文件名的主逻辑：
         将下载下来的文件（可能是乱序或旧名）按照 catalog.json 的顺序重命名。
+        content=True 时接着按当前广告规则重新清洗正文 (见 clean_contents)。
+        完成返回 True，找不到书籍/目录时返回 None。
         """
         if not specific_book:
             print("[错误] 未指定书籍。")
             return
 
-        book_dir = os.path.join(self.base_path, specific_book)
-        json_path = os.path.join(book_dir, 'catalog.json')
+        store = CatalogStore(self.base_path, specific_book)
+        book_dir = store.book_dir
 
-        if not os.path.exists(json_path):
-            print(f"[错误] 找不到目录文件: {json_path}")
+        if not store.exists():
+            print(f"[错误] 找不到目录文件: {store.json_path}")
             return
 
-        data = load_json(json_path)
+        data = store.load()
         chapters = data['chapters']
+        self.events = events = shared_events().scope('clean', specific_book)
+        start = time.time()
+        events.emit(STAGE_STARTED, stage='rename', total=len(chapters))
         
         # === 1. 建立本地文件索引 ===
         # 目的：无论文件名怎么变，只要包含"标题"，就能找到它
-        local_files = os.listdir(book_dir)
+        # 文件清单由一次 scandir 建立，并在各步骤之间共享
+        manifest = ChapterManifest.for_book(self.base_path, specific_book)
+        local_files = manifest.names()
         existing_map = {}
         for f in local_files:
             if not f.endswith('.txt'): continue
@@ -56,6 +77,7 @@ class TextCleaner:
 
         renamed_count = 0
         linked_count = 0
+        changed = False
         
         print(f"正在整理书籍: {specific_book}")
 
@@ -69,10 +91,12 @@ class TextCleaner:
             target_path = os.path.join(book_dir, target_name)
             
             # 更新 JSON 记录
-            ch['file_name'] = target_name
+            if ch.get('file_name') != target_name:
+                ch['file_name'] = target_name
+                changed = True
             
             # 情况A: 目标文件已经存在
-            if os.path.exists(target_path):
+            if manifest.exists(target_name):
                 linked_count += 1
                 continue
                 
@@ -89,18 +113,88 @@ class TextCleaner:
 
                 try:
                     os.rename(old_path, target_path)
+                    manifest.rename(candidate, target_name)
                     renamed_count += 1
                 except OSError as e:
                     print(f"  [重命名失败] {candidate} -> {target_name}: {e}")
         
-        # 保存修正后的目录结构
-        save_json(json_path, data)
-        
+        events.emit(STAGE_DONE, stage='rename', total=len(chapters), renamed=renamed_count,
+                    linked=linked_count, seconds=round(time.time() - start, 3))
         if renamed_count > 0:
             print(f"[整理完成] 修正了 {renamed_count} 个文件的命名。")
         else:
             print("[整理完成] 文件结构正常，无需变动。")
 
+        if content and self.clean_contents(chapters, manifest):
+            changed = True
+
+        # 保存修正后的目录结构 (没有变化时不重写，免得无谓地改动目录)
+        if changed or renamed_count:
+            store.save(data)
+        manifest.save()
+        events.bus.flush()
+        return True
+
+    # ==========================================
+    # 正文清洗
+    # ==========================================
+    def clean_contents(self, chapters, manifest):
+        """
+        按当前广告规则重新清洗已下载的章节文件 (多进程，原地改写)。
+        每章记录 "规则指纹:清洗后内容哈希"，规则和文件都没变的章节直接跳过，不读正文。
+        返回目录记录是否有变化。
+        """
+        ad_filter = shared_filter(self.base_path)
+        todo = []
+        skipped = 0
+        for ch in chapters:
+            name = ch.get('file_name')
+            if not name or not manifest.exists(name):
+                continue
+            if ch.get('clean') == f"{ad_filter.signature}:{manifest.hash(name)}":
+                skipped += 1
+                continue
+            todo.append(ch)
+        if not todo:
+            if skipped:
+                print(f"[清洗] {skipped} 章已按当前规则清洗过，无需处理。")
+            return False
+
+        workers = worker_count(len(todo), self.workers, PARALLEL_MIN_CHAPTERS, CLEAN_BATCH)
+        print(f"[清洗] 待检查 {len(todo)} 章 (跳过 {skipped} 章)，进程数 {workers}")
+        batch_items = [(ch['title'], os.path.join(manifest.book_dir, ch['file_name'])) for ch in todo]
+
+        start = time.time()
+        self.events.emit(STAGE_STARTED, stage='clean', total=len(todo), skipped=skipped, workers=workers)
+        rewritten = errors = bytes_in = bytes_out = 0
+        results = ordered_map(clean_chapter_files, batch_items, workers, CLEAN_BATCH,
+                              args=(ad_filter.rules,), label="清洗")
+        for ch, result in zip(todo, results):
+            if isinstance(result, str):
+                errors += 1
+                if errors <= 10:
+                    print(f"  [清洗失败] {result}")
+                self.events.emit(CHAPTER_DONE, chapter=ch['file_name'], ok=False, error=result)
+                continue
+            was_rewritten, sha1, size_in, size_out = result
+            self.events.emit(CHAPTER_DONE, chapter=ch['file_name'], ok=True, rewritten=was_rewritten,
+                             size=size_out)
+            bytes_in += size_in
+            bytes_out += size_out
+            if was_rewritten:
+                rewritten += 1
+                manifest.record(ch['file_name'], sha1)
+                ch['size'] = manifest.size(ch['file_name'])
+            ch['clean'] = f"{ad_filter.signature}:{sha1 or manifest.hash(ch['file_name'])}"
+
+        elapsed = max(time.time() - start, 1e-6)
+        self.events.emit(STAGE_DONE, stage='clean', total=len(todo), success=len(todo) - errors, failed=errors,
+                         rewritten=rewritten, bytes_in=bytes_in, bytes_out=bytes_out, seconds=round(elapsed, 3))
+        print(f"[清洗完成] 检查 {len(todo)} 章，改写 {rewritten} 章，失败 {errors} 章；"
+              f"{bytes_in / 1024 / 1024:.1f} MB -> {bytes_out / 1024 / 1024:.1f} MB，"
+              f"用时 {elapsed:.2f}s ({len(todo) / elapsed:.0f} 章/秒, {bytes_in / 1024 / 1024 / elapsed:.1f} MB/s)")
+        return True
+
 if __name__ == "__main__":
     # 测试代码
     cleaner = TextCleaner("novels")
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import os
+import gzip
+import time
+import shutil
+from common import load_json, validate_filename
+from module_library import CatalogStore
+from module_manifest import ChapterManifest
+
+# zstd 可选：Python 3.14 自带 compression.zstd，否则使用 zstandard 包
+try:
+    from compression import zstd as _zstd
+
+    def _zstd_writer(f, level):
+        return _zstd.ZstdFile(f, 'wb', level=level)
+except ImportError:
+    try:
+        import zstandard as _zstd
+
+        def _zstd_writer(f, level):
+            return _zstd.ZstdCompressor(level=level).stream_writer(f, closefd=False)
+    except ImportError:
+        _zstd_writer = None
+
+# 输出压缩方式
+COMPRESS_NONE = None
+COMPRESS_GZIP = 'gzip'
+COMPRESS_ZSTD = 'zstd'
+EXTENSIONS = {COMPRESS_NONE: '.txt', COMPRESS_GZIP: '.txt.gz', COMPRESS_ZSTD: '.txt.zst'}
+
+# 合并文本放在书籍目录下的子目录里：章节扫描 (scandir 只看文件) 不会把整本书当成某一章
+EXPORT_DIR_NAME = "export"
+
+# 普通拷贝的缓冲区大小
+COPY_BUFFER = 1 << 20
+
+
+class TextMerger:
+    """
+    按目录顺序把章节文件合并成一个 TXT：
+    不压缩时用 copy_file_range / sendfile 在内核里直接拷贝 (不经过 Python 字符串)，
+    不支持的系统退回 1MB 缓冲区拷贝；压缩时按块送进 gzip / zstd 流。
+    内存占用与书的大小无关。
+    """
+    def __init__(self, base_path, compress=COMPRESS_NONE, headers=True, level=None):
+        self.base_path = base_path
+        self.compress = compress
+        # 每章前插入 "标题" 行
+        self.headers = headers
+        self.level = level
+        # 当前可用的零拷贝方式，失败一次后降级，不再重复尝试
+        self._method = 'copy_file_range' if hasattr(os, 'copy_file_range') else (
+            'sendfile' if hasattr(os, 'sendfile') else None)
+
+    # ---------------- 旧版输出 ----------------
+    @staticmethod
+    def _remove_legacy(book_dir, out_name, chapters):
+        """旧版本把合并文本直接写在章节目录里，会被当成章节文件；重新合并时删掉"""
+        used = {ch.get('file_name') for ch in chapters}
+        for ext in EXTENSIONS.values():
+            name = out_name + ext
+            path = os.path.join(book_dir, name)
+            if name not in used and os.path.isfile(path):
+                try:
+                    os.remove(path)
+                    print(f"[合并] 已删除旧位置的合并文本: {name}")
+                except OSError as e:
+                    print(f"[警告] 删除旧合并文本失败 {path}: {e}")
+
+    # ---------------- 拷贝 ----------------
+    def _zero_copy(self, src_fd, out_fd, size):
+        """内核拷贝 size 字节，成功返回 True；不支持时降级并返回 False (此时尚未写入任何数据)"""
+        copied = 0
+        while copied < size:
+            try:
+                if self._method == 'copy_file_range':
+                    n = os.copy_file_range(src_fd, out_fd, size - copied)
+                else:
+                    n = os.sendfile(out_fd, src_fd, None, size - copied)
+            except OSError:
+                if copied:
+                    raise
+                # 跨文件系统、老内核等：换下一种方式
+                self._method = 'sendfile' if self._method == 'copy_file_range' and hasattr(os, 'sendfile') else None
+                return False
+            if n == 0:
+                break
+            copied += n
+        return True
+
+    def _copy_chapter(self, path, out, raw_fd):
+        with open(path, 'rb') as src:
+            if raw_fd is not None and self._method:
+                size = os.fstat(src.fileno()).st_size
+                # 第一次失败后 _method 会降级，再试一次下一种方式
+                while self._method:
+                    if self._zero_copy(src.fileno(), raw_fd, size):
+                        return
+            shutil.copyfileobj(src, out, COPY_BUFFER)
+
+    def _open_output(self, path):
+        """返回 (写入对象, 底层文件, 可零拷贝的 fd)"""
+        f = open(path, 'wb', buffering=0)
+        if self.compress == COMPRESS_GZIP:
+            return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=self.level or 6, mtime=0), f, None
+        if self.compress == COMPRESS_ZSTD:
+            return _zstd_writer(f, self.level or 10), f, None
+        return f, f, f.fileno()
+
+    # ---------------- 主流程 ----------------
+    def run(self, specific_book=None):
+        if not specific_book:
+            print("[错误] 未指定书籍。")
+            return None
+
+        store = CatalogStore(self.base_path, specific_book)
+        if not store.exists():
+            print(f"[错误] 找不到目录文件: {store.json_path}")
+            return None
+        if self.compress == COMPRESS_ZSTD and _zstd_writer is None:
+            print("[警告] 未安装 zstandard，改用 gzip 压缩。")
+            self.compress = COMPRESS_GZIP
+
+        chapters = store.load()['chapters']
+        info = load_json(os.path.join(store.book_dir, 'book_info.json')) or {}
+        title = info.get('title') or specific_book
+        manifest = ChapterManifest.for_book(self.base_path, specific_book)
+
+        files, missing = [], 0
+        for ch in chapters:
+            name = ch.get('file_name', '')
+            if manifest.exists(name):
+                files.append((ch['title'], os.path.join(store.book_dir, name), manifest.size(name)))
+            elif not ch.get('removed'):
+                missing += 1
+
+        if not files:
+            print("[错误] 没有可合并的章节文件，请先下载。")
+            return None
+
+        out_name = validate_filename(title) or specific_book
+        out_dir = os.path.join(store.book_dir, EXPORT_DIR_NAME)
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, out_name + EXTENSIONS[self.compress])
+        self._remove_legacy(store.book_dir, out_name, chapters)
+        tmp_path = out_path + '.tmp'
+        total_bytes = sum(size for _, _, size in files)
+        print(f"[合并] {len(files)} 章 ({total_bytes / 1024 / 1024:.1f} MB) -> {out_path}")
+
+        start = time.time()
+        out, raw, raw_fd = self._open_output(tmp_path)
+        try:
+            head = f"{title}\n作者：{info.get('author', '未知')}\n"
+            if info.get('description'):
+                head += f"\n{info['description']}\n"
+            out.write(head.encode('utf-8'))
+            for ch_title, path, _ in files:
+                if self.headers:
+                    out.write(f"\n\n{ch_title}\n\n".encode('utf-8'))
+                self._copy_chapter(path, out, raw_fd)
+            if out is not raw:
+                out.close()
+            raw.close()
+            os.replace(tmp_path, out_path)
+        except BaseException:
+            raw.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        elapsed = max(time.time() - start, 1e-6)
+        out_size = os.path.getsize(out_path)
+        method = self.compress or self._method or '缓冲拷贝'
+        print(f"[完成] 输出 {out_size / 1024 / 1024:.1f} MB，用时 {elapsed:.2f}s "
+              f"({total_bytes / 1024 / 1024 / elapsed:.0f} MB/s，方式: {method})")
+        if missing:
+            print(f"[注意] 有 {missing} 个章节文件缺失，未包含在合并文本中。")
+        return out_path
+
+
+if __name__ == "__main__":
+    # 测试代码
+    merger = TextMerger("novels")
+    # merger.run("测试书籍名")
+    pass
@@ -3,8 +3,19 @@ import os
 import time
 import requests
 import re
+import json
+import hashlib
+from html import escape
 from ebooklib import epub
 from common import load_json, save_json, validate_filename
+from module_cookies import shared_store
+from module_library import CatalogStore
+from module_manifest import ChapterManifest, CACHE_DIR_NAME
+from module_metrics import RunMetrics
+from module_pool import worker_count, ordered_map
+from module_events import shared_events, STAGE_STARTED, STAGE_DONE, CHAPTER_DONE
+from module_epub import (StreamingEpubWriter, EpubBuildCache, chapter_key, render_body,
+                         render_chapter_files)
 
 # 引入 Step0 的交互类
 try:
@@ -12,9 +23,42 @@ try:
 except ImportError:
     MetadataInteractive = None
 
+# EPUB 写入方式
+BACKEND_STREAM = 'stream'      # 自带的流式 zip 写入 (默认，内存占用恒定)
+BACKEND_EBOOKLIB = 'ebooklib'  # ebooklib 整本组装后一次写出 (旧方式)
+
+# 分卷方式
+SPLIT_NONE = None        # 不分卷 (单个 EPUB，平铺目录)
+SPLIT_COUNT = 'count'    # 每 N 章一卷
+SPLIT_SIZE = 'size'      # 每卷正文不超过 N MB
+SPLIT_MARKER = 'marker'  # 按章节标题里的 "第X卷" 标记分卷
+VOLUME_DEFAULT_CHAPTERS = 500
+VOLUME_DEFAULT_MB = 20
+# 卷内目录每组的章节数 (嵌套目录，避免阅读器一次展开几千个条目)
+TOC_GROUP_SIZE = 100
+VOLUME_PATTERN = re.compile(r'\s*(第[0-9零一二三四五六七八九十百千万两]+[卷部集]|卷[0-9零一二三四五六七八九十百千万两]+)')
+CHAPTER_PATTERN = re.compile(r'第[0-9零一二三四五六七八九十百千万两]+章')
+# 耗时统计项 -> 指标里的阶段名
+STAGE_NAMES = {'扫描': 'scan', '渲染压缩': 'render', '写入': 'write', '索引': 'index', '合计': 'total'}
+
+# 并行渲染：每个任务处理的章节数，以及启用进程池的最少章节数
+RENDER_BATCH = 16
+PARALLEL_MIN_CHAPTERS = 64
+
 class EpubAdvancedGenerator:
-    def __init__(self, base_path):
+    def __init__(self, base_path, interactive=True, backend=BACKEND_STREAM, workers=None,
+                 split=SPLIT_NONE, split_value=None):
         self.base_path = base_path
+        # 非交互模式 (批处理) 下跳过人工核对，直接生成
+        self.interactive = interactive
+        self.backend = backend
+        # 渲染/压缩进程数 (None = CPU 核数，1 = 不用进程池)
+        self.workers = workers
+        # 分卷方式与参数 (章节数 / MB)
+        self.split = split
+        self.split_value = split_value
+        # 进度事件 (见 module_events)
+        self.events = shared_events().scope('epub')
 
     def _download_cover(self, url, save_path):
         """辅助方法：下载封面图片"""
@@ -26,6 +70,7 @@ class EpubAdvancedGenerator:
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
             }
+            headers.update(shared_store().http_headers(url))
             res = requests.get(url, headers=headers, timeout=10)
             if res.status_code == 200:
                 with open(save_path, 'wb') as f:
@@ -64,7 +109,7 @@ class EpubAdvancedGenerator:
             print("="*50)
             
             print("指令: [Enter]确认生成  [M]修改信息  [Q]退出")
-            choice = input("请选择: ").strip().lower()
+            choice = input("请选择: ").strip().lower() if self.interactive else ''
 
             if choice == 'm':
                 print("\n--- 快速修正模式 (直接回车保持原值) ---")
@@ -94,21 +139,23 @@ class EpubAdvancedGenerator:
                 return meta
 
     def run(self, specific_book=None):
+        """生成 EPUB；返回本书的 EPUB 路径列表 (内容无变化时为已有文件)，失败返回 None"""
         if not specific_book:
             print("[错误] 未指定书籍目录名。")
             return
 
-        novel_dir = os.path.join(self.base_path, specific_book)
-        catalog_path = os.path.join(novel_dir, 'catalog.json')
+        store = CatalogStore(self.base_path, specific_book)
+        novel_dir = store.book_dir
+        catalog_path = store.json_path
         info_path = os.path.join(novel_dir, 'book_info.json')
         cover_path = os.path.join(novel_dir, 'cover.jpg')
         
         # 1. 基础检查
-        if not os.path.exists(catalog_path):
+        if not store.exists():
             print(f"[错误] 目录文件不存在: {catalog_path}")
             return
         
-        catalog_data = load_json(catalog_path)
+        catalog_data = store.load()
         chapters = catalog_data.get('chapters', [])
         book_url = catalog_data.get('url', '')
 
@@ -116,7 +163,7 @@ class EpubAdvancedGenerator:
         if not os.path.exists(info_path):
             print(f"[提示] 缺少 book_info.json，尝试调用采集工具...")
             if MetadataInteractive:
-                step0 = MetadataInteractive(self.base_path)
+                step0 = MetadataInteractive(self.base_path, interactive=self.interactive)
                 step0.run(book_url)
             else:
                 print("[警告] step0_metadata 模块缺失，使用默认元数据")
@@ -134,6 +181,7 @@ class EpubAdvancedGenerator:
             return
             
         save_json(info_path, meta)
+        store.update_book(title=meta['title'], author=meta['author'])
 
         # === 4. 生成 EPUB ===
         
@@ -147,48 +195,37 @@ class EpubAdvancedGenerator:
 
         print(f"\n[开始生成] 目标路径: {abs_path}")
         
-        book = epub.EpubBook()
-        book.set_identifier(str(int(time.time())))
-        book.set_title(meta['title'])
-        book.set_language('zh')
-        book.add_author(meta['author'])
-        
-        # 封面
-        if os.path.exists(cover_path):
-            try:
-                with open(cover_path, 'rb') as f:
-                    book.set_cover("cover.jpg", f.read())
-            except Exception as e:
-                print(f"[警告] 封面读取失败: {e}")
-        
         # 简介
-        desc_text = meta.get('description', '暂无简介')
+        # (流式写入不经过 HTML 解析器，文字需要转义成合法的 XHTML)
+        desc_text = escape(meta.get('description', '暂无简介'), quote=False)
         desc_html = desc_text.replace('\n', '<br/>')
-        pub_date_str = meta.get('publish_date', '')
+        pub_date_str = escape(str(meta.get('publish_date', '')), quote=False)
         
         intro_html = f"""
             <div style="text-align: center;">
-                <h1>{meta['title']}</h1>
-                <p><b>作者：</b>{meta['author']}</p>
+                <h1>{escape(meta['title'], quote=False)}</h1>
+                <p><b>作者：</b>{escape(meta['author'], quote=False)}</p>
                 <p><b>更新：</b>{pub_date_str}</p>
             </div>
             <hr/>
             <h3>简介</h3>
             <p style="line-height:1.5;">{desc_html}</p>
         """
-        c_intro = epub.EpubHtml(title='书籍信息', file_name='intro.xhtml', lang='zh')
-        c_intro.content = intro_html
-        book.add_item(c_intro)
 
-        # 章节
-        epub_items = []
-        valid_count = 0
+        # 章节 (这里只确定文件路径，正文在写入时才逐章读取)
+        scan_start = time.time()
+        timings = {'扫描': 0.0, '渲染压缩': 0.0, '写入': 0.0, '索引': 0.0}
+        self.events = events = shared_events().scope('epub', specific_book)
+        events.emit(STAGE_STARTED, stage='scan', total=len(chapters))
+        entries = []
         missing_count = 0
         print(f"[打包] 正在处理 {len(chapters)} 个章节...")
         
         # 计算序号宽度，用于备用文件名匹配
         width = len(str(len(chapters)))
         width = max(width, 4)
+        # 一次 scandir 得到全部文件，不再逐章 exists
+        manifest = ChapterManifest.for_book(self.base_path, specific_book)
 
         for idx, ch in enumerate(chapters):
             # 1. 尝试使用 JSON 中记录的文件名
@@ -197,58 +234,306 @@ class EpubAdvancedGenerator:
             
             # 2. 如果文件不存在，尝试构建“安全文件名”进行备选查找
             # (防止 Step1 记录了非法字符，但 Step2 保存时已经替换成了下划线)
-            if not os.path.exists(txt_file):
+            if not manifest.exists(file_name):
                 safe_title = validate_filename(ch['title'])
                 num_str = str(idx + 1).zfill(width)
                 backup_name = f"{num_str}_{safe_title}.txt"
                 backup_path = os.path.join(novel_dir, backup_name)
                 
-                if os.path.exists(backup_path):
+                if manifest.exists(backup_name):
                     txt_file = backup_path # 找到了备份文件
+                    file_name = backup_name
                     print(f"[修正] 章节 {idx+1} 使用修正后的文件名: {backup_name}")
+                elif ch.get('removed'):
+                    # 网站已删除且本地从未下载的章节，静默跳过
+                    continue
                 else:
                     print(f"!!! [缺失] 找不到文件 (第{idx+1}章): {file_name}")
                     missing_count += 1
                     continue
-            
-            try:
-                with open(txt_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except Exception as e:
-                print(f"[错误] 读取文件失败 {txt_file}: {e}")
-                continue
-            
-            lines = [f"<p>{line.strip()}</p>" for line in content.split('\n') if line.strip()]
-            html_body = "".join(lines)
-            
-            # 兼容 EPUB 文件名规范
-            c = epub.EpubHtml(title=ch['title'], file_name=f"ch_{valid_count:04d}.xhtml", lang='zh')
-            c.content = f"<h2>{ch['title']}</h2>{html_body}"
-            book.add_item(c)
-            epub_items.append(c)
-            valid_count += 1
+
+            entries.append((ch['title'], txt_file, file_name))
 
         print("-" * 30)
-        print(f"处理结果: 成功 {valid_count} 章 / 缺失 {missing_count} 章")
+        print(f"处理结果: 找到 {len(entries)} 章 / 缺失 {missing_count} 章")
+        events.emit(STAGE_DONE, stage='scan', total=len(chapters), success=len(entries), failed=missing_count,
+                    seconds=round(time.time() - scan_start, 3))
 
-        if valid_count == 0:
+        if not entries:
             print("[错误] 未找到任何有效的章节文件，停止生成。")
             print("请尝试运行 [2. 下载] 步骤来补充缺失的文件。")
             return
 
-        book.toc = [c_intro] + epub_items
-        book.spine = ['nav', c_intro] + epub_items
-        book.add_item(epub.EpubNcx())
-        book.add_item(epub.EpubNav())
+        cover_data = None
+        if os.path.exists(cover_path):
+            try:
+                with open(cover_path, 'rb') as f:
+                    cover_data = f.read()
+            except Exception as e:
+                print(f"[警告] 封面读取失败: {e}")
+
+        if self.backend == BACKEND_EBOOKLIB and self.split == SPLIT_NONE:
+            try:
+                valid_count = self._write_ebooklib(output_file_path, meta, cover_data, intro_html, entries)
+                store.update_book(epub_path=abs_path, epub_at=time.time())
+                self._report([(abs_path, valid_count)], missing_count)
+                return [abs_path]
+            except Exception as e:
+                print(f"[失败] 写入文件时出错: {e}")
+                print("请检查文件是否被占用，或文件名包含特殊字符。")
+            return
+        if self.backend == BACKEND_EBOOKLIB:
+            print("[提示] 分卷输出使用流式写入。")
+
+        # 构建缓存：章节键 = 标题 + 正文哈希 (清单里缓存的 sha1，文件没变化时不用重新读取)
+        cache = EpubBuildCache(os.path.join(self.base_path, CACHE_DIR_NAME, f"{specific_book}.epub"))
+        entries = [entry + (chapter_key(entry[0], manifest.hash(entry[2])),) for entry in entries]
+        cover_hash = hashlib.sha1(cover_data).hexdigest() if cover_data else None
+
+        volumes = self._plan_volumes(entries, manifest)
+        # 分卷时标识符固定 (同一本书每次生成都一样)，阅读器里覆盖导入而不是出现重复的书
+        base_id = "uuks-" + hashlib.sha1((book_url or specific_book).encode('utf-8')).hexdigest()[:16]
+        timings['扫描'] = time.time() - scan_start
 
+        outputs = []
+        # 本书的全部 EPUB 文件 (含内容无变化、直接跳过的分卷)，作为返回值
+        paths = []
         try:
-            epub.write_epub(output_file_path, book, {})
-            print("="*50)
-            print(f" [成功] EPUB 已生成！")
-            print(f" [位置] {abs_path}")
-            if missing_count > 0:
-                print(f" [注意] 有 {missing_count} 个章节因文件缺失未被打包，请运行下载步骤补充。")
-            print("="*50)
+            for vol in volumes:
+                if len(volumes) == 1:
+                    path, title, identifier, series = output_file_path, meta['title'], str(int(time.time())), None
+                else:
+                    n = vol['index']
+                    path = os.path.join(novel_dir, f"{safe_book_title}_第{n:02d}卷.epub")
+                    title = f"{meta['title']} {vol['label'] or f'第{n}卷'}"
+                    identifier, series = f"{base_id}-v{n:02d}", (meta['title'], n)
+                signature = hashlib.sha1(json.dumps(
+                    [title, meta['author'], intro_html, cover_hash, identifier if series else None,
+                     vol['sections'], [e[3] for e in vol['entries']]],
+                    ensure_ascii=False).encode('utf-8')).hexdigest()
+                paths.append(os.path.abspath(path))
+                if cache.is_fresh(signature, path, [e[3] for e in vol['entries']]):
+                    print(f"[跳过] 内容无变化，已是最新: {os.path.basename(path)}")
+                    continue
+                writer = StreamingEpubWriter(path, identifier, title, meta['author'], series=series)
+                vol_start = time.time()
+                events.emit(STAGE_STARTED, stage='write', total=len(vol['entries']), volume=vol['index'])
+                count = self._write_stream(writer, cover_data, intro_html, vol, cache, timings)
+                events.emit(STAGE_DONE, stage='write', total=len(vol['entries']), success=count,
+                            failed=len(vol['entries']) - count, volume=vol['index'], path=os.path.abspath(path),
+                            size=os.path.getsize(path), seconds=round(time.time() - vol_start, 3))
+                cache.record_output(signature, path)
+                outputs.append((os.path.abspath(path), count))
+            cache.save()
         except Exception as e:
             print(f"[失败] 写入文件时出错: {e}")
             print("请检查文件是否被占用，或文件名包含特殊字符。")
+            return
+        finally:
+            events.bus.flush()
+
+        if not outputs:
+            return paths
+        timings['合计'] = time.time() - scan_start
+        detail = f"复用 {sum(c for _, c in outputs) - cache.added} 章，渲染 {cache.added} 章"
+        print("[耗时] " + " | ".join(f"{k} {v:.2f}s" for k, v in timings.items()) + f" ({detail})")
+        self._export_metrics(specific_book, timings, outputs, cache, manifest, entries, missing_count)
+        store.update_book(epub_path=outputs[0][0] if len(volumes) == 1 else novel_dir, epub_at=time.time())
+        self._report(outputs, missing_count)
+        return paths
+
+    def _export_metrics(self, book, timings, outputs, cache, manifest, entries, missing_count):
+        """各阶段耗时、读入的正文与写出的 EPUB 大小写入指标文件 (见 module_metrics)"""
+        metrics = RunMetrics('epub', book)
+        for name, seconds in timings.items():
+            metrics.add_stage(STAGE_NAMES.get(name, name), seconds)
+        for path, _ in outputs:
+            metrics.inc('bytes_out', os.path.getsize(path))
+        metrics.inc('bytes_in', sum(manifest.size(e[2]) for e in entries))
+        metrics.inc('chapters', sum(c for _, c in outputs) - cache.added, source='cache')
+        metrics.inc('chapters', cache.added, source='rendered')
+        if missing_count:
+            metrics.inc('chapters', missing_count, source='missing')
+        metrics.export(self.base_path)
+
+    def _report(self, outputs, missing_count):
+        print("="*50)
+        if len(outputs) == 1:
+            print(f" [成功] EPUB 已生成！共 {outputs[0][1]} 章")
+            print(f" [位置] {outputs[0][0]}")
+        else:
+            print(f" [成功] 已生成 {len(outputs)} 个分卷 EPUB：")
+            for path, count in outputs:
+                print(f"   {os.path.basename(path)} ({count} 章)")
+            print(f" [位置] {os.path.dirname(outputs[0][0])}")
+        if missing_count > 0:
+            print(f" [注意] 有 {missing_count} 个章节因文件缺失未被打包，请运行下载步骤补充。")
+        print("="*50)
+
+    # ---------------- 分卷 ----------------
+    @staticmethod
+    def _volume_label(title):
+        """章节标题里的分卷标记 (如 "第二卷 风起云涌")，没有返回 None"""
+        m = VOLUME_PATTERN.match(title)
+        if not m:
+            return None
+        chapter = CHAPTER_PATTERN.search(title, m.end())
+        return title[:chapter.start()].strip() if chapter else title.strip()
+
+    def _marker_groups(self, entries, offset=0):
+        """按分卷标记把章节分组：[(标记, 起, 止)]，标记之前的章节归入第一组 (标记为 None)"""
+        groups = []
+        for i, entry in enumerate(entries):
+            label = self._volume_label(entry[0])
+            if not groups or (label and label != groups[-1][0]):
+                groups.append([label, i + offset, i + offset + 1])
+            else:
+                groups[-1][2] = i + offset + 1
+        return groups
+
+    def _plan_volumes(self, entries, manifest):
+        """
+        按设置切分卷。返回 [{'index', 'label', 'entries', 'sections'}]，
+        sections 为卷内的嵌套目录分组 [(标题, 起, 止)] (下标相对于卷内章节)。
+        """
+        bounds = []   # (标记, 起, 止)
+        if self.split == SPLIT_MARKER:
+            bounds = self._marker_groups(entries)
+            if len(bounds) < 2:
+                print(f"[分卷] 未识别到分卷标记，改为每 {VOLUME_DEFAULT_CHAPTERS} 章一卷")
+                bounds = []
+        if self.split == SPLIT_SIZE:
+            limit = (self.split_value or VOLUME_DEFAULT_MB) * 1024 * 1024
+            start, total = 0, 0
+            for i, entry in enumerate(entries):
+                size = max(manifest.size(entry[2]), 0)
+                if total and total + size > limit:
+                    bounds.append((None, start, i))
+                    start, total = i, 0
+                total += size
+            bounds.append((None, start, len(entries)))
+        elif self.split != SPLIT_NONE and not bounds:
+            step = self.split_value if self.split == SPLIT_COUNT and self.split_value else VOLUME_DEFAULT_CHAPTERS
+            bounds = [(None, i, min(i + step, len(entries))) for i in range(0, len(entries), step)]
+        if not bounds:
+            return [{'index': 1, 'label': None, 'entries': entries, 'sections': []}]
+
+        volumes = []
+        for n, (label, a, b) in enumerate(bounds, 1):
+            vol_entries = entries[a:b]
+            # 卷内目录：有分卷标记按标记分组，否则章节多时每 TOC_GROUP_SIZE 章一组
+            groups = self._marker_groups(vol_entries) if self.split != SPLIT_MARKER else []
+            if len(groups) >= 2:
+                sections = [(g or f"第{a + x + 1}-{a + y}章", x, y) for g, x, y in groups]
+            elif len(vol_entries) > TOC_GROUP_SIZE:
+                sections = [(f"第{a + x + 1}-{a + min(x + TOC_GROUP_SIZE, len(vol_entries))}章",
+                             x, min(x + TOC_GROUP_SIZE, len(vol_entries)))
+                            for x in range(0, len(vol_entries), TOC_GROUP_SIZE)]
+            else:
+                sections = []
+            volumes.append({'index': n, 'label': label, 'entries': vol_entries, 'sections': sections})
+        print(f"[分卷] 共 {len(volumes)} 卷: " + ", ".join(str(len(v['entries'])) for v in volumes) + " 章")
+        return volumes
+
+    def _read_chapter(self, txt_file):
+        try:
+            with open(txt_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception as e:
+            print(f"[错误] 读取文件失败 {txt_file}: {e}")
+            return None
+
+    def _read_chapters(self, entries):
+        """按顺序逐章读取正文 (生成器，任意时刻只有一章在内存里)"""
+        for title, txt_file, *_ in entries:
+            content = self._read_chapter(txt_file)
+            if content is not None:
+                yield title, content
+
+    def _write_stream(self, writer, cover_data, intro_html, vol, cache, timings):
+        """
+        流式写入：每章渲染好即写入 zip，内存占用与章节数无关。
+        缓存里有的章节直接复制压缩数据；其余章节交给进程池渲染压缩，主进程按顺序写入。
+        """
+        entries = vol['entries']
+        # 需要重新渲染的章节 (同一内容出现多次时只渲染一次)
+        todo, todo_keys, pending = [], [], set()
+        for title, txt_file, _, key in entries:
+            if key not in cache.index and key not in pending:
+                pending.add(key)
+                todo_keys.append(key)
+                todo.append((title, txt_file))
+        # 多进程渲染 + 压缩，按提交顺序取回结果 (书脊顺序固定)；结果与键一一对应，
+        # 只在某个键第一次出现时取下一个结果，之后成功的走缓存、失败的查 failed
+        workers = worker_count(len(todo), self.workers, PARALLEL_MIN_CHAPTERS, RENDER_BATCH)
+        rendered = zip(todo_keys, ordered_map(render_chapter_files, todo, workers, RENDER_BATCH, label="渲染"))
+        failed = {}
+        section_starts = {start: (title, end) for title, start, end in vol['sections']}
+
+        valid_count = 0
+        with writer:
+            t = time.time()
+            if cover_data:
+                writer.set_cover(cover_data)
+            writer.add_page('intro.xhtml', '书籍信息', intro_html)
+            timings['写入'] += time.time() - t
+            for i, (title, txt_file, _, key) in enumerate(entries):
+                if i in section_starts:
+                    writer.start_section(section_starts[i][0])
+                t = time.time()
+                entry = cache.get(key)
+                cached = entry is not None
+                if entry is None:
+                    if key in pending:
+                        pending.discard(key)
+                        _, entry = next(rendered)
+                        timings['渲染压缩'] += time.time() - t
+                        if isinstance(entry, str):
+                            failed[key] = entry
+                    else:
+                        entry = failed.get(key, f"缓存中找不到章节: {txt_file}")
+                    if isinstance(entry, str):
+                        print(f"[错误] {entry}")
+                        self.events.emit(CHAPTER_DONE, chapter=os.path.basename(txt_file), ok=False, error=entry)
+                        continue
+                    t = time.time()
+                    cache.put(key, entry)
+                # 兼容 EPUB 文件名规范
+                writer.add_compressed(f"ch_{valid_count:04d}.xhtml", title, entry)
+                timings['写入'] += time.time() - t
+                valid_count += 1
+                self.events.emit(CHAPTER_DONE, chapter=os.path.basename(txt_file), ok=True, cached=cached)
+            t = time.time()
+        timings['索引'] += time.time() - t
+        return valid_count
+
+    def _write_ebooklib(self, output_file_path, meta, cover_data, intro_html, entries):
+        """ebooklib 写入 (整本书先在内存中组装，章节很多时占用较大)"""
+        book = epub.EpubBook()
+        book.set_identifier(str(int(time.time())))
+        book.set_title(meta['title'])
+        book.set_language('zh')
+        book.add_author(meta['author'])
+        
+        # 封面
+        if cover_data:
+            book.set_cover("cover.jpg", cover_data)
+
+        c_intro = epub.EpubHtml(title='书籍信息', file_name='intro.xhtml', lang='zh')
+        c_intro.content = intro_html
+        book.add_item(c_intro)
+
+        epub_items = []
+        for title, content in self._read_chapters(entries):
+            # 兼容 EPUB 文件名规范
+            c = epub.EpubHtml(title=title, file_name=f"ch_{len(epub_items):04d}.xhtml", lang='zh')
+            c.content = render_body(title, content)
+            book.add_item(c)
+            epub_items.append(c)
+
+        book.toc = [c_intro] + epub_items
+        book.spine = ['nav', c_intro] + epub_items
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        epub.write_epub(output_file_path, book, {})
+        return len(epub_items)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import os
+from collections import defaultdict
+
+from module_epub import EpubBuildCache
+from step4_epub import EpubAdvancedGenerator
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.chapters = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_cover(self, data):
+        pass
+
+    def add_page(self, name, title, html):
+        pass
+
+    def start_section(self, title):
+        pass
+
+    def add_compressed(self, name, title, entry):
+        self.chapters.append((title, entry[1]))
+
+
+def test_failed_render_shared_by_two_entries(tmp_path):
+    good = tmp_path / "0003_第三章.txt"
+    good.write_text("第三章的正文。", encoding='utf-8')
+    missing = str(tmp_path / "missing.txt")
+    # 前两章内容相同 (同一个键)，且读取失败；后面的章节不能错拿它们的结果
+    entries = [("第一章", missing, "a.txt", "k1"),
+               ("第一章", missing, "b.txt", "k1"),
+               ("第三章", str(good), good.name, "k3")]
+    vol = {'entries': entries, 'sections': []}
+    generator = EpubAdvancedGenerator(str(tmp_path), interactive=False, workers=1)
+    writer = RecordingWriter()
+    cache = EpubBuildCache(os.path.join(str(tmp_path), "cache", "book.epub"))
+
+    count = generator._write_stream(writer, None, "<p/>", vol, cache, defaultdict(float))
+
+    assert count == 1
+    assert [title for title, _ in writer.chapters] == ["第三章"]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from module_extract import ContentExtractor, extract_book_title, extract_catalog_links, extract_heading
+
+XHTML_PAGE = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html PUBLIC "-//WAP//DTD XHTML Mobile 1.0//EN" "http://www.wapforum.org/DTD/xhtml-mobile10.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title>测试小说最新章节</title></head>
+<body><h1>测试小说</h1>
+<ul><li><a href="/b/1/1.html">第1章 开端</a></li><li><a href="/b/1/2.html">第2章 继续</a></li></ul>
+<div id="contentbox"><p>　　这是第一段正文，内容足够长，用来确认提取器能找到正文容器。</p>
+<p>　　这是第二段正文，同样需要一定的长度才能通过最短正文长度的检查。</p></div>
+</body></html>"""
+
+
+def test_xml_declaration_with_encoding():
+    assert extract_heading(XHTML_PAGE) == "测试小说"
+    assert extract_book_title(XHTML_PAGE) == "测试小说"
+    links = extract_catalog_links(XHTML_PAGE, "http://m.example.com/b/1/all.html")
+    assert [text for text, _ in links] == ["第1章 开端", "第2章 继续"]
+    lines = ContentExtractor().extract_lines(XHTML_PAGE)
+    assert len(lines) == 2 and lines[0].endswith("正文容器。")
+
+
+def test_xml_declaration_after_bom():
+    assert extract_heading("\ufeff" + XHTML_PAGE) == "测试小说"
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from module_filter import AdFilter, parse_rules
+
+RULES = parse_rules("""UU看书
+re:(?i)uuks\\.org
+line:(.)\\1{2,}
+re:(a)(b)
+strip:(?i)\\[广告[^\\]]*\\]
+""")
+
+
+def test_flagged_rule_after_other_rules():
+    ad_filter = AdFilter(RULES)
+    assert ad_filter.clean_line("请访问 UUKS.ORG 阅读") is None
+    assert ad_filter.clean_line("UU看书 首发") is None
+    assert ad_filter.clean_line("正文[AD广告]继续") == "正文[AD广告]继续"
+    assert ad_filter.clean_line("正文[广告 xyz]继续") == "正文继续"
+    assert ad_filter.clean_line("正常的一行正文") == "正常的一行正文"
+
+
+def test_backreference_keeps_its_own_groups():
+    ad_filter = AdFilter(RULES)
+    assert ad_filter.clean_line("哈哈哈") is None
+    assert ad_filter.clean_line("ab") is None
+    assert ad_filter.clean_line("哈哈") == "哈哈"
+
+
+def test_combine_failure_falls_back_to_each_rule():
+    # 两条规则定义了同名分组，无法拼成一个正则
+    ad_filter = AdFilter(parse_rules("re:(?P<x>广告)\nre:(?P<x>推广)"))
+    assert ad_filter.filter_lines(["广告来了", "推广一下", "正文"]) == ["正文"]